@@ -1,13 +1,38 @@
+import gzip
+import json
 import os
-from src.rating_routes import rate_all, get_progress_rating, abort, get_results, task_progress
-from flask import Flask, request, render_template, jsonify
-import threading
 import time
+from src.rating_routes import rate_all
+from src.route_results import DEFAULT_PAGE_SIZE
+from src.tasks import get_task_registry, ACTIVE, QUEUED, RUNNING, FINISHED, ABORTED
+from src.scheduler import get_scheduler, QueueFull
+from src.result_cache import get_result_cache
+from src.route_cache import get_route_cache
+from src.worker_pool import start_worker_pool
+from flask import Flask, Response, request, render_template, jsonify
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
 
 app = Flask(__name__)
 
-task_results = {}
-task_lock = threading.Lock()
+# Long-lived pool of preloaded rating workers, shared by all requests of this app
+worker_pool = start_worker_pool()
+
+tasks = get_task_registry()
+# Runs the calculations on a bounded number of threads, the others wait in its queue
+scheduler = get_scheduler()
+
+# Responses smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = 1024
+# Seconds without progress after which a progress stream sends a comment to keep the connection open
+PROGRESS_KEEPALIVE_SECONDS = 15
+# Seconds after which a progress stream is closed to free its server thread; the browser reconnects on its own
+PROGRESS_STREAM_SECONDS = 30
+# Milliseconds the browser waits before reconnecting to a closed progress stream
+PROGRESS_RETRY_MILLISECONDS = 1000
 
 
 @app.route('/', methods=['GET'])
@@ -27,11 +52,12 @@ def home():
 @app.route('/start_calculation', methods=['POST'])
 def start_calculation():
     """
-    Starts a background calculation task.
+    Queues a background calculation task.
 
     This function handles POST requests to the '/start_calculation' URL. It retrieves the input parameters
-    from the request, starts a new background thread to perform the calculation, and returns a JSON response
-    with the task ID.
+    from the request, queues the calculation with the task scheduler, and returns a JSON response with the task ID.
+    If the queue is full, the request is rejected with status 503 and a Retry-After header, an invalid top_k with
+    status 400.
 
     Request Form Parameters:
         - original_start (str): The original starting point.
@@ -39,26 +65,35 @@ def start_calculation():
         - original_end (str): The original ending point.
         - radius_end (float): The radius around the ending point.
         - tolerance (int): The tolerance level for the calculation.
+        - top_k (int, optional): Only return the best top_k routes and a summary of the others.
+        - branch_and_bound (optional): If set, the best top_k routes are found with the branch-and-bound search
+          instead of rating every route (no summary of the others).
 
     Returns:
-        Response: A JSON object containing the task ID and status.
+        Response: A JSON object containing the task ID and status, or the number of seconds to wait before retrying.
     """
     start = request.form['original_start']
     radius_start = float(request.form['radius_start'])
     end = request.form['original_end']
     radius_end = float(request.form['radius_end'])
     tolerance = int(request.form['tolerance'])
+    try:
+        top_k = int(request.form['top_k']) if request.form.get('top_k') else None
+    except ValueError:
+        top_k = 0
+    if top_k is not None and top_k < 1:
+        return jsonify({'error': 'top_k must be a positive integer'}), 400
+    branch_and_bound = bool(request.form.get('branch_and_bound'))
 
-    task_id = f"task_{int(time.time())}"
-
-    # Initialize task progress to counteract "Task not found" Errors
-    with threading.Lock():
-        task_progress[task_id] = [0, 10000]  # Set initial progress to 0 and a dummy total of 10000
+    try:
+        task_id = scheduler.submit(lambda task_id: rate_all(start, radius_start, end, radius_end, tolerance, task_id,
+                                                            top_k, branch_and_bound))
+    except QueueFull as e:
+        response = jsonify({"status": "busy", "result": str(e), "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
 
-    thread = threading.Thread(target=rate_all, args=(start, radius_start, end, radius_end, tolerance, task_id))
-    thread.start()
-
-    return jsonify({"task_id": task_id, "status": "Calculation started"})
+    return jsonify({"task_id": task_id, "status": "Calculation queued"})
 
 
 @app.route('/get_progress/<task_id>')
@@ -73,25 +108,133 @@ def get_progress(task_id):
         task_id (str): The ID of the task to check progress for.
 
     Returns:
-        Response: A JSON object containing the state ('PROGRESS', 'SUCCESS', 'ERROR'), progress percentage, and result (if applicable).
-    """
-
-    percentage = get_progress_rating(task_id)
-    if percentage is None:
-        response = {
-            'state': 'ERROR',
-            'progress': 0.0,
-            'result': f'Task ID {task_id} not found'
-        }
-    elif percentage <= 100.0:
-        response = {'state': 'PROGRESS', 'progress': percentage}
-    else:
-        result = get_results(task_id)
-        if result is None:
-            response = {'state': 'ERROR', 'progress': 100.0, 'result': 'Task did not complete successfully'}
-        else:
-            response = {'state': 'SUCCESS', 'progress': 100.0, 'result': result}
-    return jsonify(response)
+        Response: A JSON object containing the state ('QUEUED', 'PROGRESS', 'SUCCESS', 'ABORTED', 'ERROR') and
+        progress percentage. A queued task also reports its position in the queue (1 is next), a finished task its
+        number of routes, which are fetched page by page from /get_results.
+    """
+    return jsonify(_task_response(tasks.get(task_id), task_id))
+
+
+def _task_response(state, task_id: str) -> dict:
+    if state is None:
+        return {'state': 'ERROR', 'progress': 0.0, 'result': f'Task ID {task_id} not found'}
+    if state['status'] == QUEUED:
+        return {'state': 'QUEUED', 'progress': 0.0, 'position': state['queue_position']}
+    if state['status'] == RUNNING:
+        return {'state': 'PROGRESS', 'progress': state['progress']}
+    if state['status'] == ABORTED:
+        return {'state': 'ABORTED', 'progress': state['progress']}
+    if state['status'] == FINISHED:
+        return {'state': 'SUCCESS', 'progress': 100.0, 'total': len(state['result'])}
+    return {'state': 'ERROR', 'progress': state['progress'], 'result': 'Task did not complete successfully'}
+
+
+@app.route('/progress_stream/<task_id>')
+def progress_stream(task_id):
+    """
+    Streams the progress of a running task as Server-Sent Events.
+
+    This function handles GET requests to the '/progress_stream/<task_id>' URL. Instead of being polled, it pushes
+    a 'queued' event whenever the position of a waiting task in the queue changes, a 'progress' event whenever the
+    progress of the task changes, and ends the stream with exactly one final event: 'result' with the number of
+    routes and the first page of the results (see /get_results), 'aborted', or 'failure' if the task is unknown or
+    did not complete.
+
+    Every open stream holds one server thread, so a stream is closed after PROGRESS_STREAM_SECONDS even if the task
+    is still queued or running. EventSource then reconnects after the announced retry delay and the new stream
+    starts with the current state of the task.
+
+    Args:
+        task_id (str): The ID of the task to stream the progress of.
+
+    Returns:
+        Response: A text/event-stream response.
+    """
+    def events():
+        version = last_percentage = last_position = None
+        deadline = time.monotonic() + PROGRESS_STREAM_SECONDS
+        yield f"retry: {PROGRESS_RETRY_MILLISECONDS}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return  # the client reconnects to a new stream
+            state = tasks.wait(task_id, version, min(PROGRESS_KEEPALIVE_SECONDS, remaining))
+            if state is not None and state['version'] == version:
+                yield ': keep-alive\n\n'
+                continue
+
+            data = _task_response(state, task_id)
+            if state is None or state['status'] not in ACTIVE:
+                if data['state'] == 'SUCCESS':
+                    data['page'] = state['result'].page(0, DEFAULT_PAGE_SIZE)
+                yield _event({'SUCCESS': 'result', 'ABORTED': 'aborted'}.get(data['state'], 'failure'), data)
+                return
+
+            version = state['version']
+            if state['status'] == QUEUED:
+                if state['queue_position'] != last_position:
+                    last_position = state['queue_position']
+                    yield _event('queued', data)
+            elif state['progress'] != last_percentage:
+                last_percentage = state['progress']
+                yield _event('progress', data)
+
+    # X-Accel-Buffering keeps reverse proxies from holding back the events
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+@app.route('/get_results/<task_id>')
+def get_task_results(task_id):
+    """
+    Returns one page of the ranked routes of a finished task.
+
+    This function handles GET requests to the '/get_results/<task_id>' URL. The page is sent as JSON, compressed
+    with brotli or gzip if the client accepts it.
+
+    Query Parameters:
+        - offset (int, optional): The rank (0-based) of the first route of the page. Defaults to 0.
+        - limit (int, optional): The number of routes of the page. Defaults to DEFAULT_PAGE_SIZE.
+
+    Returns:
+        Response: A JSON object with the routes of the page as {route, rating, hops, km} objects, the total number
+        of routes, the timing metadata and the top-K summary.
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+
+    state = tasks.get(task_id)
+    result = state['result'] if state else None
+    if result is None:
+        return jsonify({'error': f'No results for task ID {task_id}'}), 404
+    return _compressed_json(result.page(offset, limit))
+
+
+def _compressed_json(payload: dict) -> Response:
+    """
+    Serialises a JSON response and compresses it with the best encoding the client accepts.
+    """
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    response = Response(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 
 @app.route('/abort_calculation', methods=['POST'])
@@ -109,11 +252,35 @@ def abort_calculation():
         Response: A JSON object indicating the status of the abort operation.
     """
     task_id = request.form['task_id']
-    abort(task_id)
-    task_results[task_id] = 'Calculation aborted by client'
+    if not scheduler.abort(task_id):
+        return jsonify({"status": "not found"})
     return jsonify({"status": "aborted"})
 
 
+@app.route('/task_metrics')
+def task_metrics():
+    """
+    Reports the number of live tasks per status and how many tasks were created, finished, aborted, failed and
+    evicted since the start of the process, plus the load of the task scheduler.
+
+    Returns:
+        Response: A JSON object with the metrics of the task registry and of the scheduler.
+    """
+    return jsonify({**tasks.metrics(), "scheduler": scheduler.metrics()})
+
+
+@app.route('/cache_metrics')
+def cache_metrics():
+    """
+    Reports the size of the search result cache and of the route set cache, and their hits, misses, stale and
+    evicted entries since the start of the process.
+
+    Returns:
+        Response: A JSON object with the metrics of the caches.
+    """
+    return jsonify({"results": get_result_cache().metrics(), "routes": get_route_cache().metrics()})
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8082))
     app.run(host="0.0.0.0", port=port)
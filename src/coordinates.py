@@ -1,11 +1,55 @@
 import os
 import json
+import threading
 from geopy.distance import geodesic
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 airport_coordinates_json = os.path.join(base_dir, 'data', 'airport_coordinates.json')
 city_coordinates_json = os.path.join(base_dir, 'data', 'city_coordinates.json')
 
+# Both coordinate files and the airport proximity table, keyed by the mtimes of the files they were loaded from
+_coordinates = {"version": None, "airport": {}, "city": {}, "proximity": {}}
+_coordinates_lock = threading.Lock()
+
+
+def coordinates_version() -> tuple:
+    """
+    Returns the modification times of both coordinate files, which change whenever either file is rewritten.
+    """
+    version = []
+    for file_path in (airport_coordinates_json, city_coordinates_json):
+        try:
+            version.append(os.stat(file_path).st_mtime_ns)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"'{file_path}' file not found.")
+    return tuple(version)
+
+
+def load_coordinates() -> dict:
+    """
+    Returns the airport coordinates, the city coordinates and the proximity table (distance between each city's
+    centre and its airport in km). Everything is loaded and computed once and kept in memory until either
+    coordinate file changes on disk.
+
+    :return: A dictionary with the keys "airport", "city" and "proximity".
+    """
+    version = coordinates_version()
+    if _coordinates["version"] != version:
+        with _coordinates_lock:
+            if _coordinates["version"] != version:
+                with open(airport_coordinates_json, 'r') as f:
+                    airport_coordinates = json.load(f)
+                with open(city_coordinates_json, 'r') as f:
+                    city_coordinates = json.load(f)
+
+                proximity = {city_name: geodesic(airport_coordinates[city_name], coords_city).kilometers
+                             for city_name, coords_city in city_coordinates.items()
+                             if city_name in airport_coordinates}
+
+                _coordinates.update(airport=airport_coordinates, city=city_coordinates, proximity=proximity,
+                                    version=version)
+    return _coordinates
+
 
 def get_city_coordinates(city_name: str) -> list:
     """
@@ -14,11 +58,7 @@ def get_city_coordinates(city_name: str) -> list:
     :param city_name: Name of the city to retrieve coordinates for.
     :return: A list containing latitude and longitude of the city.
     """
-    try:
-        with open(airport_coordinates_json, 'r') as f:
-            city_coordinates = json.load(f)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"'{airport_coordinates_json}' file not found.")
+    city_coordinates = load_coordinates()["airport"]
 
     if city_name in city_coordinates:
         return city_coordinates[city_name]
@@ -53,27 +93,15 @@ def remove_city_coordinate(city_name: str) -> None:
 
 def proximity_to_airport(city_name: str) -> float:
     """
-    Calculate the distance between the city coordinates in airport_coordinates.json and city_coordinates.json.
+    Look up the distance between the city coordinates in airport_coordinates.json and city_coordinates.json
+    in the proximity table.
 
     :param city_name: Name of the city to calculate proximity for.
     :return: The distance in kilometers.
     """
-    try:
-        with open(airport_coordinates_json, 'r') as f:
-            airport_coordinates = json.load(f)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"'{airport_coordinates_json}' file not found.")
-
-    try:
-        with open(city_coordinates_json, 'r') as f:
-            city_coordinates = json.load(f)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"'{city_coordinates_json}' file not found.")
+    proximity = load_coordinates()["proximity"]
 
-    if city_name in airport_coordinates and city_name in city_coordinates:
-        coords_airport = airport_coordinates[city_name]
-        coords_city = city_coordinates[city_name]
-        distance = geodesic(coords_airport, coords_city).kilometers
-        return distance
+    if city_name in proximity:
+        return proximity[city_name]
     else:
         raise ValueError(f"Coordinates for city '{city_name}' not found in one or both files.")
@@ -1,115 +1,191 @@
 import json
 import os
-from src.coordinates import proximity_to_airport
+from typing import NamedTuple
+from src.coordinates import proximity_to_airport, coordinates_version
 from src.essentials import get_Graph
+from src.geodata import get_geodata
 from multiprocessing import Lock
 
 lock = Lock()
 G = get_Graph()
 
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CityRecord(NamedTuple):
+    name: str
+    visited: bool
+    rating: float
+    revisit: bool
+    airport_rating: float
+    proximity_airport: float
+    accessibility_general: float
+    accessibility_foot: float
+    accessibility_transport: float
+    cheap_transport: float
+    degree: int
+    country: str
+
+
+class CountryRecord(NamedTuple):
+    visited: bool
+    rating: float
+    eu_member: bool
+    visa_needed: bool
+    german_name: str
+    continent: str
+
+
+class Profile:
+    """
+    The parsed settings.json of one (username, template_name) profile together with the immutable city and country
+    records and Destination objects built from it. Records are created on first use and shared afterwards.
+    """
+    __slots__ = ("settings_path", "mtime", "coordinates_version", "settings", "cities", "countries", "destinations")
+
+    def __init__(self, settings_path: str, mtime: int, coordinates_version: tuple, settings: dict):
+        self.settings_path = settings_path
+        self.mtime = mtime
+        self.coordinates_version = coordinates_version
+        self.settings = settings
+        self.cities = {}
+        self.countries = {}
+        self.destinations = {}
+
+    def city_record(self, city: str) -> CityRecord:
+        if city not in self.cities:
+            city_data = self.settings['city'].get(city)
+            if not city_data:
+                raise ValueError(f"City '{city}' not found")
+            self.cities[city] = CityRecord(
+                name=city,
+                visited=city_data['visited'],
+                rating=city_data['rating'],
+                revisit=city_data['revisit'],
+                airport_rating=city_data['airport_rating'],
+                proximity_airport=proximity_to_airport(city),
+                accessibility_general=city_data['accessibility_general'],
+                accessibility_foot=city_data['accessibility_foot'],
+                accessibility_transport=city_data['accessibility_transport'],
+                cheap_transport=city_data['cheap_transport'],
+                degree=G.degree(city),
+                country=city_data['country']
+            )
+        return self.cities[city]
+
+    def country_record(self, country: str) -> CountryRecord:
+        if country not in self.countries:
+            country_data = self.settings['country'].get(country)
+            if not country_data:
+                raise ValueError(f"Country '{country}' not found")
+            self.countries[country] = CountryRecord(
+                visited=country_data['visited'],
+                rating=country_data['rating'],
+                eu_member=country_data['eu_member'],
+                visa_needed=country_data['visa_needed'],
+                german_name=country_data['german_name'],
+                continent=country_data['continent']
+            )
+        return self.countries[country]
+
+
+_profiles = {}
+
+
+def get_profile(username: str = "default", template_name: str = "default") -> Profile:
+    """
+    Returns the parsed profile, reading settings.json only if it changed on disk (by mtime) since the last call.
+    The records are also rebuilt when the coordinate files changed, as they hold the airport proximity.
+    """
+    settings_path = os.path.join(base_dir, 'data', username, template_name, 'settings.json')
+    mtime = os.stat(settings_path).st_mtime_ns
+    version = coordinates_version()
+
+    profile = _profiles.get(settings_path)
+    if profile is None or profile.mtime != mtime or profile.coordinates_version != version:
+        with lock:
+            with open(settings_path, 'r') as file:
+                profile = Profile(settings_path, mtime, version, json.load(file))
+        _profiles[settings_path] = profile
+    return profile
+
+
+def get_destination(city: str, username: str = "default", template_name: str = "default") -> "Destination":
+    """
+    Returns the shared Destination of a city for the given profile, creating it on first use.
+    """
+    profile = get_profile(username, template_name)
+    destination = profile.destinations.get(city)
+    if destination is None:
+        destination = Destination(city, username, template_name, profile)
+        profile.destinations[city] = destination
+    return destination
+
 
 class Destination:
-    def __init__(self, city, username="default", template_name="default"):
+    def __init__(self, city, username="default", template_name="default", profile: Profile = None):
         self.city = city
         self.username = username
         self.template_name = template_name
-        self.settings = self._load_settings()
-        self.city_info = self._get_city_info(self.city)
-        self.country_info = self._get_country_info(self.city_info['country'])
-        self.continent = self.country_info['continent']
-
-    def _load_settings(self):
-        with lock:
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            settings_path = os.path.join(base_dir, 'data', self.username, self.template_name, 'settings.json')
-
-            with open(settings_path, 'r') as file:
-                return json.load(file)
-
-    def _get_city_info(self, city):
-        city_data = self.settings['city'].get(city)
-        if not city_data:
-            raise ValueError(f"City '{city}' not found")
-        return {
-            "name": city,
-            "visited": city_data['visited'],
-            "rating": city_data['rating'],
-            "revisit": city_data['revisit'],
-            "airport_rating": city_data['airport_rating'],
-            "proximity_airport": proximity_to_airport(city),
-            "accessibility_general": city_data['accessibility_general'],
-            "accessibility_foot": city_data['accessibility_foot'],
-            "accessibility_transport": city_data['accessibility_transport'],
-            "cheap_transport": city_data['cheap_transport'],
-            "degree": G.degree(city),
-            "country": city_data['country']
-        }
-
-    def _get_country_info(self, country):
-        country_data = self.settings['country'].get(country)
-        if not country_data:
-            raise ValueError(f"Country '{country}' not found")
-        return {
-            "visited": country_data['visited'],
-            "rating": country_data['rating'],
-            "eu_member": country_data['eu_member'],
-            "visa_needed": country_data['visa_needed'],
-            "german_name": country_data['german_name'],
-            "continent": country_data['continent']
-        }
+        if profile is None:
+            profile = get_profile(username, template_name)
+        self.settings = profile.settings
+        self.city_info = profile.city_record(self.city)
+        self.country_info = profile.country_record(self.city_info.country)
+        self.continent = self.country_info.continent
 
     # Getter methods for City information
     def get_city(self):
         return self.city
 
     def get_city_visited(self):
-        return self.city_info['visited']
+        return self.city_info.visited
 
     def get_city_preferability(self):
-        return self.city_info['rating']
+        return self.city_info.rating
 
     def get_city_would_visit_again(self):
-        return self.city_info['revisit']
+        return self.city_info.revisit
 
     def get_airport_rating(self):
-        return self.city_info['airport_rating']
+        return self.city_info.airport_rating
 
     def get_proximity_airport(self):
-        return proximity_to_airport(self.city)
+        return self.city_info.proximity_airport
 
     def get_accessibility_general(self):
-        return self.city_info['accessibility_general']
+        return self.city_info.accessibility_general
 
     def get_reachability_by_foot(self):
-        return self.city_info['accessibility_foot']
+        return self.city_info.accessibility_foot
 
     def get_reachability_by_public_transport(self):
-        return self.city_info['accessibility_transport']
+        return self.city_info.accessibility_transport
 
     def get_cost_of_reachability(self):
-        return self.city_info['cheap_transport']
+        return self.city_info.cheap_transport
 
     def get_degree(self):
-        return G.degree(self.city)
+        return self.city_info.degree
 
     def get_country_name_local(self):
-        return self.city_info['country']
+        return self.city_info.country
 
     # Getter methods for Country information
     def get_country_name_german(self):
-        return self.country_info['german_name']
+        return self.country_info.german_name
 
     def get_country_visited(self):
-        return self.country_info['visited']
+        return self.country_info.visited
 
     def get_country_preferability(self):
-        return self.country_info['rating']
+        return self.country_info.rating
 
     def get_country_eu_member(self):
-        return self.country_info['eu_member']
+        return self.country_info.eu_member
 
     def get_country_visa_needed(self):
-        return self.country_info['visa_needed']
+        return self.country_info.visa_needed
 
     # Getter method for Continent
     def get_continent(self):
@@ -140,19 +216,7 @@ class Destination:
         }
 
     def get_distance_to(self, city: str) -> float:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        distances_json = os.path.join(base_dir, 'data', 'distances.json')
-
-        with open(distances_json, 'r') as file:
-            distances_data = json.load(file)
-
-        if self.city in distances_data:
-            if city in distances_data[self.city]:
-                return distances_data[self.city][city]
-            else:
-                raise ValueError(f"Distance from {self.city} to {city} not found.")
-        else:
-            raise ValueError(f"City {self.city} not found in distances data.")
+        return get_geodata().table_distance(self.city, city)
 
 
 def print_city(city_name: str, username=None, template_name=None):
@@ -1,6 +1,9 @@
 import json
 import os
+import time
+import numpy as np
 from src.essentials import get_Graph, calculate_distance_coords
+from src.geodata import save_distance_matrix, distances_npy
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 distances_json = os.path.join(base_dir, 'data', 'distances.json')
@@ -8,6 +11,11 @@ airport_coordinates_json = os.path.join(base_dir, 'data', 'airport_coordinates.j
 
 G = get_Graph()
 
+# WGS-84 ellipsoid, the same one geopy's geodesic uses
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
 
 def get_city_coordinates(city_name: str) -> list:
     """
@@ -52,6 +60,93 @@ def calculate_all_distances(cities: list) -> dict:
     return distances
 
 
+def vincenty_distance_matrix(coordinates: np.ndarray, max_iterations: int = 200, tolerance: float = 1e-12):
+    """
+    Calculate the distances between all pairs of coordinates at once with the Vincenty inverse formula,
+    vectorized over the whole N x N matrix.
+
+    :param coordinates: An (N, 2) array of latitude/longitude pairs in degrees.
+    :param max_iterations: Maximum number of iterations of the lambda recursion.
+    :param tolerance: Convergence threshold of the lambda recursion in radians.
+    :return: The N x N distance matrix in kilometers and a boolean matrix marking the pairs that converged.
+    """
+    latitudes = np.radians(coordinates[:, 0])
+    longitudes = np.radians(coordinates[:, 1])
+
+    L = longitudes[None, :] - longitudes[:, None]
+    U = np.arctan((1 - WGS84_F) * np.tan(latitudes))
+    sin_u1, cos_u1 = np.sin(U)[:, None], np.cos(U)[:, None]
+    sin_u2, cos_u2 = np.sin(U)[None, :], np.cos(U)[None, :]
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    for _ in range(max_iterations):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines have cos2_alpha == 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+        C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+        previous_lam = lam
+        lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        converged = np.abs(lam - previous_lam) < tolerance
+        if converged.all():
+            break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+
+    return WGS84_B * A * (sigma - delta_sigma) / 1000, converged
+
+
+def calculate_distance_matrix(cities: list) -> np.ndarray:
+    """
+    Calculate the distances between all city pairs at once, reading the coordinates file a single time.
+    Pairs for which the Vincenty iteration does not converge (nearly antipodal points) are computed with geodesic.
+
+    :param cities: A list of city names.
+    :return: The N x N distance matrix in kilometers, rounded to one decimal place, in the order of cities.
+    """
+    try:
+        with open(airport_coordinates_json, 'r') as f:
+            city_coordinates = json.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"'{airport_coordinates_json}' file not found.")
+
+    missing = [city for city in cities if city not in city_coordinates]
+    if missing:
+        raise ValueError(f"Coordinates for city '{missing[0]}' not found in the file.")
+
+    coordinates = np.array([city_coordinates[city] for city in cities], dtype=np.float64)
+    distances, converged = vincenty_distance_matrix(coordinates)
+
+    for i, j in zip(*np.nonzero(~converged)):
+        distances[i, j] = calculate_distance_coords(coordinates[i], coordinates[j])
+
+    return np.round(distances, 1)
+
+
+def distance_matrix_to_dict(matrix: np.ndarray, cities: list) -> dict:
+    """
+    Convert a distance matrix into the nested dictionary layout of distances.json.
+
+    :param matrix: The N x N distance matrix.
+    :param cities: The city names in row/column order.
+    :return: A dictionary with city names as keys and their distances to all other cities as values.
+    """
+    return {city_a: {city_b: float(matrix[i, j]) for j, city_b in enumerate(cities) if i != j}
+            for i, city_a in enumerate(cities)}
+
+
 def save_distance_to_json(distance_dict: dict, filename: str) -> None:
     """
     Save the distance dictionary to a JSON file.
@@ -65,6 +160,10 @@ def save_distance_to_json(distance_dict: dict, filename: str) -> None:
 
 
 if __name__ == '__main__':
+    start_time = time.time()
     cities = list(G.nodes)
-    distance_dict = calculate_all_distances(cities)
-    save_distance_to_json(distance_dict, distances_json)
+    distance_matrix = calculate_distance_matrix(cities)
+    save_distance_to_json(distance_matrix_to_dict(distance_matrix, cities), distances_json)
+    save_distance_matrix(distance_matrix, cities)
+    print(f"Distance matrix saved to {distances_npy}")
+    print(f"Time taken to rebuild the distances: {time.time() - start_time:.4f} seconds")
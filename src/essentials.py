@@ -1,9 +1,9 @@
 import os
 from math import exp
+import numpy as np
 from geopy.distance import geodesic
-import json
-from functools import lru_cache
 from src.graph_maker import load_graph
+from src.geodata import get_geodata
 
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -31,6 +31,43 @@ def custom_sigmoid(x, right_shift, horizontal_scaling, full_point: float, flippe
                (100 / (100 / (1 + exp(-(full_point - right_shift) / horizontal_scaling))))
 
 
+class SigmoidCurve:
+    """
+    custom_sigmoid with fixed parameters. The normalising factor, which only depends on the parameters, is computed
+    once. Calling the curve with a number gives the same result as custom_sigmoid, calling it with a NumPy array
+    evaluates it element-wise.
+    """
+    __slots__ = ("right_shift", "horizontal_scaling", "full_point", "flipped", "_sign", "_normalisation")
+
+    def __init__(self, right_shift, horizontal_scaling, full_point: float, flipped: bool):
+        self.right_shift = right_shift
+        self.horizontal_scaling = horizontal_scaling
+        self.full_point = full_point
+        self.flipped = flipped
+        self._sign = 1 if flipped else -1
+        self._normalisation = 100 / (100 / (1 + exp(self._sign * (full_point - right_shift) / horizontal_scaling)))
+
+    def __call__(self, x):
+        if isinstance(x, np.ndarray):
+            return (1 / (1 + np.exp(self._sign * (x - self.right_shift) / self.horizontal_scaling))) * \
+                   self._normalisation
+        return (1 / (1 + exp(self._sign * (x - self.right_shift) / self.horizontal_scaling))) * self._normalisation
+
+
+# The curves used by the rating modules
+SIGMOIDS = {
+    "airport_proximity": SigmoidCurve(-49.34, 14.12, 0, True),
+    "city_degree": SigmoidCurve(10.77, 2.58, 15.1, False),
+    "flight_distance": SigmoidCurve(840, 700, 170, True),
+    "degree_difference": SigmoidCurve(4.32, 0.67, 15, False),
+    "degree_ratio": SigmoidCurve(1.68, 0.497, 4, False),
+    "route_distance_ratio": SigmoidCurve(76.6, 8.4, 100, False),
+    "average_rating": SigmoidCurve(53.3, 11.98, 100, False),
+    "rating_stddev": SigmoidCurve(19.5, 3.85, 50, False),
+    "relative_span": SigmoidCurve(0.42, 0.084, 0, True),
+}
+
+
 def calculate_distance_coords(coords_1: list, coords_2: list) -> float:
     """
     Calculate the distance between two sets of coordinates.
@@ -51,98 +88,22 @@ def calculate_distance_cities(city_a: str, city_b: str, factor_a: str = "airport
     :param factor_a: If coordinates from "city_a" should come from the city or the airport.
     :param factor_b: If coordinates from "city_b" should come from the city or the airport.
     :return: The distance in kilometers, rounded to one decimal place.
+    :raises ValueError: If coordinates are not found for either city.
     """
 
-    # Load the coordinates from JSON files
-    with open(airport_coordinates, 'r') as airport_file:
-        airport_coords = json.load(airport_file)
-
-    with open(city_coordinates, 'r') as city_file:
-        city_coords = json.load(city_file)
+    return get_geodata().distance(city_a, city_b, factor_a, factor_b)
 
-    # Determine the coordinates for city_a
-    if factor_a == "city":
-        coords_1 = city_coords.get(city_a)
-    else:
-        coords_1 = airport_coords.get(city_a)
-
-    # Determine the coordinates for city_b
-    if factor_b == "city":
-        coords_2 = city_coords.get(city_b)
-    else:
-        coords_2 = airport_coords.get(city_b)
-
-    # If coordinates are not found for either city, raise an error
-    if not coords_1 or not coords_2:
-        raise ValueError(f"Coordinates not found for {city_a} or {city_b}.")
-
-    # Calculate the geodesic distance
-    return round(geodesic(coords_1, coords_2).kilometers, 1)
 
-
-# Creates a function to load and preprocess distances (cached internally)
-@lru_cache(maxsize=1)
-def load_and_preprocess_distances(file_path: str):
-    """
-    Load the distance data from a JSON file and preprocess it into a flat dictionary for efficient lookups.
-    This function is cached so the file is only loaded and processed once.
-
-    :param file_path: Path to the distances.json file.
-    :return: Preprocessed flat distance dictionary.
-    """
-    with open(file_path, 'r') as file:
-        distances = json.load(file)
-
-    return preprocess_distances(distances)
-
-
-def preprocess_distances(distances):
+def calculate_distance_route(route: list) -> float:
     """
-    Preprocesses the distances data to use tuple keys (city_a, city_b) for constant-time lookups.
-
-    :param distances: Original nested dictionary of distances.
-    :return: A flat dictionary where keys are (city_a, city_b) tuples and values are distances.
-    """
-    flat_distances = {}
-
-    for city_a, city_b_distances in distances.items():
-        for city_b, distance in city_b_distances.items():
-            # Store the distance using both (city_a, city_b) and (city_b, city_a) keys
-            flat_distances[(city_a, city_b)] = distance
-            flat_distances[(city_b, city_a)] = distance
-
-    return flat_distances
-
-
-# Step 2: Use this cached distance data in the route calculation
-def calculate_distance_route(route: list, file_path: str = distances_json) -> float:
-    """
-    Efficiently calculates the total distance for a route using preprocessed distances.
+    Calculates the total distance for a route by indexing the shared distance matrix.
 
     :param route: A list of city names representing the route.
-    :param file_path: Path to the distances.json file (used only once, as loading is cached).
     :return: The total distance of the route in kilometers, rounded to one decimal place.
+    :raises ValueError: If the distance between two consecutive cities is not found.
     """
-    # Load and preprocess distances (cached, so this happens only once)
-    flat_distances = load_and_preprocess_distances(file_path)
-
-    total_distance = 0.0
-
-    # Iterate through consecutive city pairs in the route and sum distances
-    for i in range(len(route) - 1):
-        city_a = route[i]
-        city_b = route[i + 1]
-
-        # Efficient lookup using tuple-based keys
-        distance = flat_distances.get((city_a, city_b))
-
-        # If no distance is found, handle gracefully (e.g., return an error or skip)
-        if distance is None:
-            raise ValueError(f"Distance between {city_a} and {city_b} not found.")
-
-        total_distance += distance
-
-    return round(total_distance, 1)
+    geodata = get_geodata()
+    return geodata.route_distance(geodata.ids_of(route))
 
 
 def evaluate_weighting(pro_weight, con_weight, pro_result, con_result) -> (float, float):
@@ -160,6 +121,33 @@ def evaluate_weighting(pro_weight, con_weight, pro_result, con_result) -> (float
     return rated, weight
 
 
+def evaluate_max_weighting(pro_weight, con_weight, pro_result, con_result):
+    """
+    Weighting used by the city and flight ratings: the pro result is used if its weight is set, otherwise the con
+    result, and the pair counts with the larger of both weights. Works on numbers and NumPy arrays alike.
+
+    :return: The weighted result (0 if both weights are 0) and the weight.
+    """
+    if pro_weight != 0:
+        return pro_weight * pro_result, max(pro_weight, con_weight)
+    if con_weight != 0:
+        return con_weight * con_result, max(pro_weight, con_weight)
+    return 0, 0
+
+
+def evaluate_weighting_array(pro_weight, con_weight, pro_result, con_result):
+    """
+    Array version of evaluate_weighting: the weights are scalars, the results arrays of equal shape.
+
+    :return: The weighted results (an array, or 0 if both weights are 0) and the weight.
+    """
+    if pro_weight != 0:
+        return pro_weight * pro_result, pro_weight
+    if con_weight != 0:
+        return con_weight * con_result, con_weight
+    return 0, 0
+
+
 if __name__ == "__main__":
     distance = calculate_distance_cities("Aberdeen", "Gdansk")
     print(f"The distance between Aberdeen and Gdansk is {distance} km.")
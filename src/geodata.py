@@ -0,0 +1,269 @@
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+from geopy.distance import geodesic
+from src.graph_core import get_csr_graph, row_sums
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+airport_coordinates_json = os.path.join(base_dir, 'data', 'airport_coordinates.json')
+city_coordinates_json = os.path.join(base_dir, 'data', 'city_coordinates.json')
+distances_json = os.path.join(base_dir, 'data', 'distances.json')
+distances_npy = os.path.join(base_dir, 'data', 'distances.npy')
+distances_index_json = os.path.join(base_dir, 'data', 'distances_index.json')
+
+
+class GeoData:
+    """
+    In-memory store of all coordinates and pairwise airport distances.
+
+    Cities share the integer IDs of the CSR graph; cities that only appear in the data files are appended after the
+    graph's cities. Coordinates are held as (N, 2) arrays of latitude/longitude (NaN where unknown) and the distances
+    from distances.json as a dense float32 N x N matrix (NaN where no distance is stored).
+    """
+
+    def __init__(self, names: list, airport_coords: np.ndarray, city_coords: np.ndarray, distances: np.ndarray):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.airport_coords = airport_coords
+        self.city_coords = city_coords
+        self.distances = distances
+        self._geodesic_cache = {}
+
+    @classmethod
+    def from_files(cls, airport_file: str = airport_coordinates_json, city_file: str = city_coordinates_json,
+                   distances_file: str = distances_json, matrix_file: str = distances_npy,
+                   index_file: str = distances_index_json):
+        """
+        Loads coordinates from the JSON data files and the distances from the binary matrix if it exists
+        (memory-mapped, see load_distance_matrix), otherwise from distances.json.
+        """
+        with open(airport_file, 'r') as f:
+            airport_coords = json.load(f)
+        with open(city_file, 'r') as f:
+            city_coords = json.load(f)
+
+        if os.path.exists(matrix_file) and os.path.exists(index_file):
+            matrix_names, matrix = load_distance_matrix(matrix_file, index_file)
+            distances = None
+        else:
+            with open(distances_file, 'r') as f:
+                distances = json.load(f)
+            matrix_names, matrix = list(distances), None
+
+        names = list(get_csr_graph().names)
+        known = set(names)
+        for source in (matrix_names, airport_coords, city_coords):
+            for name in source:
+                if name not in known:
+                    names.append(name)
+                    known.add(name)
+        index = {name: i for i, name in enumerate(names)}
+
+        if matrix is None:
+            matrix = cls._distance_matrix(distances, index)
+        elif matrix_names != names:
+            # Only a file in exactly our ID order can be used without copying
+            print(f"City order of {matrix_file} differs from the graph, rebuild it with distances_maker.")
+            matrix = cls._reindex_matrix(matrix, matrix_names, index)
+
+        return cls(names, cls._coords_array(airport_coords, index), cls._coords_array(city_coords, index), matrix)
+
+    @staticmethod
+    def _coords_array(coords: dict, index: dict) -> np.ndarray:
+        array = np.full((len(index), 2), np.nan)
+        for name, (latitude, longitude) in coords.items():
+            array[index[name]] = (latitude, longitude)
+        return array
+
+    @staticmethod
+    def _distance_matrix(distances: dict, index: dict) -> np.ndarray:
+        matrix = np.full((len(index), len(index)), np.nan, dtype=np.float32)
+        np.fill_diagonal(matrix, 0)
+        for city_a, city_b_distances in distances.items():
+            row = index[city_a]
+            for city_b, distance in city_b_distances.items():
+                matrix[row, index[city_b]] = distance
+                matrix[index[city_b], row] = distance
+        return matrix
+
+    @staticmethod
+    def _reindex_matrix(matrix: np.ndarray, matrix_names: list, index: dict) -> np.ndarray:
+        reindexed = np.full((len(index), len(index)), np.nan, dtype=np.float32)
+        np.fill_diagonal(reindexed, 0)
+        ids = np.array([index[name] for name in matrix_names])
+        reindexed[np.ix_(ids, ids)] = matrix
+        return reindexed
+
+    def __contains__(self, city):
+        return city in self.index
+
+    def id_of(self, city: str) -> int:
+        try:
+            return self.index[city]
+        except KeyError:
+            raise ValueError(f"City '{city}' not found in the geodata.")
+
+    def coordinates(self, city: str, factor: str = "airport"):
+        """
+        Returns the (latitude, longitude) of a city's airport or city centre, or None if unknown.
+        """
+        if city not in self.index:
+            return None
+        coords = (self.city_coords if factor == "city" else self.airport_coords)[self.index[city]]
+        if np.isnan(coords[0]):
+            return None
+        return float(coords[0]), float(coords[1])
+
+    def table_distance(self, city_a: str, city_b: str) -> float:
+        """
+        Looks up the stored airport distance between two cities (as found in distances.json).
+
+        :raises ValueError: If either city or the distance between them is not stored.
+        """
+        if city_a not in self.index:
+            raise ValueError(f"City {city_a} not found in distances data.")
+        if city_b not in self.index or city_b == city_a:
+            raise ValueError(f"Distance from {city_a} to {city_b} not found.")
+        distance = self.distances[self.index[city_a], self.index[city_b]]
+        if np.isnan(distance):
+            raise ValueError(f"Distance from {city_a} to {city_b} not found.")
+        # The table holds values rounded to one decimal, rounding again removes the float32 representation error
+        return round(float(distance), 1)
+
+    def distance(self, city_a: str, city_b: str, factor_a: str = "airport", factor_b: str = "airport") -> float:
+        """
+        Distance between two cities in kilometers, rounded to one decimal place. Airport to airport distances come
+        from the matrix; anything else is computed once with geodesic and memoized.
+
+        :raises ValueError: If the coordinates of either city are unknown.
+        """
+        if factor_a != "city" and factor_b != "city" and city_a in self.index and city_b in self.index:
+            distance = self.distances[self.index[city_a], self.index[city_b]]
+            if not np.isnan(distance):
+                return round(float(distance), 1)
+
+        key = (city_a, city_b, factor_a == "city", factor_b == "city")
+        if key not in self._geodesic_cache:
+            coords_1 = self.coordinates(city_a, factor_a)
+            coords_2 = self.coordinates(city_b, factor_b)
+            if not coords_1 or not coords_2:
+                raise ValueError(f"Coordinates not found for {city_a} or {city_b}.")
+            self._geodesic_cache[key] = round(geodesic(coords_1, coords_2).kilometers, 1)
+        return self._geodesic_cache[key]
+
+    def ids_of(self, cities) -> list:
+        return [self.id_of(city) for city in cities]
+
+    def route_distance(self, ids) -> float:
+        """
+        Total stored airport distance along a route of city IDs, rounded to one decimal place.
+
+        :raises ValueError: If the distance of any leg is not stored.
+        """
+        ids = np.asarray(ids)
+        legs = self.distances[ids[:-1], ids[1:]]
+        if np.isnan(legs).any():
+            leg = int(np.flatnonzero(np.isnan(legs))[0])
+            raise ValueError(f"Distance between {self.names[ids[leg]]} and {self.names[ids[leg + 1]]} not found.")
+        return round(float(np.round(legs.astype(np.float64), 1).sum()), 1)
+
+    def route_distances(self, routes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Batch version of route_distance for routes packed with graph_core.pack_routes.
+
+        :raises ValueError: If the distance of any leg is not stored.
+        """
+        routes = np.asarray(routes)
+        legs_mask = np.arange(routes.shape[1] - 1)[None, :] < (np.asarray(lengths) - 1)[:, None]
+        cities = np.where(routes >= 0, routes, 0)
+        legs = np.where(legs_mask, self.distances[cities[:, :-1], cities[:, 1:]], 0)
+        if np.isnan(legs).any():
+            row, leg = np.argwhere(np.isnan(legs))[0]
+            raise ValueError(f"Distance between {self.names[routes[row, leg]]} and {self.names[routes[row, leg + 1]]} "
+                             f"not found.")
+        return np.round(row_sums(np.round(legs.astype(np.float64), 1)), 1)
+
+    def nearby(self, city: str, radius: float) -> list:
+        """
+        Returns the city itself followed by all cities whose stored distance to it is at most radius.
+        """
+        nearby_cities = [city]
+        if city in self.index:
+            # Compare the one-decimal table values, not their float32 approximations
+            row = np.round(self.distances[self.index[city]].astype(np.float64), 1)
+            for i in np.flatnonzero(row <= radius):
+                if self.names[i] != city:
+                    nearby_cities.append(self.names[i])
+        return nearby_cities
+
+
+def save_distance_matrix(matrix: np.ndarray, names: list, matrix_file: str = distances_npy,
+                         index_file: str = distances_index_json) -> None:
+    """
+    Save a distance matrix in the binary format: a float32 .npy matrix plus a JSON list of the city names
+    in row/column order.
+
+    :param matrix: The N x N distance matrix in kilometers.
+    :param names: The city names in row/column order.
+    :param matrix_file: The file path of the .npy matrix.
+    :param index_file: The file path of the name index.
+    """
+    # Both files are written to temporary files next to them and renamed over the old ones, so the memory-mapped
+    # matrix of running processes is never rewritten in place and readers never see a partial file
+    temp_paths = []
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(matrix_file), prefix='.distances_', suffix='.npy')
+        temp_paths.append(temp_path)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.asarray(matrix, dtype=np.float32))
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_file), prefix='.distances_index_', suffix='.json')
+        temp_paths.append(temp_path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(list(names), f, indent=4, ensure_ascii=False)
+        for temp_path, file_path in zip(temp_paths, (matrix_file, index_file)):
+            if os.path.exists(file_path):
+                os.chmod(temp_path, os.stat(file_path).st_mode & 0o777)
+            os.replace(temp_path, file_path)
+    except BaseException:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+
+
+def load_distance_matrix(matrix_file: str = distances_npy, index_file: str = distances_index_json):
+    """
+    Open a distance matrix saved with save_distance_matrix. The matrix is memory-mapped read-only, so all processes
+    reading it share the same page-cache pages instead of holding private copies.
+
+    distances_maker always writes this file together with distances.json; if it is missing, the store falls back to
+    parsing distances.json.
+
+    :param matrix_file: The file path of the .npy matrix.
+    :param index_file: The file path of the name index.
+    :return: The list of city names and the memory-mapped float32 matrix.
+    """
+    with open(index_file, 'r', encoding='utf-8') as f:
+        names = json.load(f)
+    matrix = np.load(matrix_file, mmap_mode='r')
+    if matrix.shape != (len(names), len(names)):
+        raise ValueError(f"Distance matrix {matrix_file} does not match its index {index_file}.")
+    return names, matrix
+
+
+_geodata = None
+_geodata_lock = threading.Lock()
+
+
+def get_geodata() -> GeoData:
+    """
+    Returns the process-wide geodata store, loading the data files on first use.
+    """
+    global _geodata
+    if _geodata is None:
+        with _geodata_lock:
+            if _geodata is None:
+                _geodata = GeoData.from_files()
+    return _geodata
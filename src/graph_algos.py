@@ -1,12 +1,8 @@
-import json
-import os
-from collections import Counter
-import networkx as nx
+import numpy as np
 from src.essentials import get_Graph
-import concurrent.futures
-
-base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-distances_json = os.path.join(base_dir, 'data', 'distances.json')
+from src.graph_core import get_csr_graph
+from src.geodata import get_geodata
+from src.route_cache import get_route_cache, RouteSet
 
 G = get_Graph()
 
@@ -22,8 +18,10 @@ def min_amount_flights(start_city, end_city):
     Returns:
         int: The minimum number of flights, or -1 if no path exists.
     """
-    bfs_shortest_paths = nx.single_source_shortest_path_length(G, start_city)
-    return bfs_shortest_paths.get(end_city, -1)
+    graph = get_csr_graph()
+    if end_city not in graph:
+        return -1
+    return int(graph.bfs(graph.id_of(start_city))[graph.id_of(end_city)])
 
 
 def find_all_paths_with_max_n_flights(start_city, end_city, n, memo=None):
@@ -39,24 +37,33 @@ def find_all_paths_with_max_n_flights(start_city, end_city, n, memo=None):
     Returns:
         list: A list of paths, where each path is a list of city names.
     """
+    graph = get_csr_graph()
     if memo is None:
         memo = {}
-    # Memoization key: (start_city, remaining_flights)
-    memo_key = (start_city, n)
+    id_paths = _find_all_paths_with_max_n_flights(graph, graph.id_of(start_city), graph.id_of(end_city), n, memo)
+    return [graph.names_of(path) for path in id_paths]
+
+
+def _find_all_paths_with_max_n_flights(graph, start, end, n, memo):
+    """
+    Integer-ID version of find_all_paths_with_max_n_flights, working on the CSR graph.
+    """
+    # Memoization key: (start, remaining_flights)
+    memo_key = (start, n)
 
     # Check if the result is already in the memo
     if memo_key in memo:
         return memo[memo_key]
-    if start_city == end_city and n >= 0:
-        return [[start_city]]
+    if start == end and n >= 0:
+        return [[start]]
     if n == 0:
         return []
 
     all_paths = []
-    for neighbor in G.neighbors(start_city):
-        sub_paths = find_all_paths_with_max_n_flights(neighbor, end_city, n - 1, memo)
+    for neighbor in graph.adjacency[start]:
+        sub_paths = _find_all_paths_with_max_n_flights(graph, neighbor, end, n - 1, memo)
         for sub_path in sub_paths:
-            all_paths.append([start_city] + sub_path)
+            all_paths.append([start] + sub_path)
 
     memo[memo_key] = all_paths
     return all_paths
@@ -64,17 +71,159 @@ def find_all_paths_with_max_n_flights(start_city, end_city, n, memo=None):
 
 def find_all_paths_with_max_n_flights_no_revisits(start_city, end_city, n):
     """
-    Finds all possible paths between two cities that have at most n flights, then filters out paths that contain any
-    city visited more than once.
+    Finds all possible paths between two cities that have at most n flights and visit no city more than once.
 
     Returns:
         list: A list of valid paths with no city visited more than once.
     """
-    true_paths = []
-    for path in find_all_paths_with_max_n_flights(start_city, end_city, n):
-        if not any(count > 1 for count in Counter(path).values()):
-            true_paths.append(path)
-    return true_paths
+    graph = get_csr_graph()
+    return [graph.names_of(path)
+            for path in iter_simple_paths(graph, graph.id_of(start_city), graph.id_of(end_city), n)]
+
+
+def iter_simple_paths(graph, start, end, n, hops_to_end=None):
+    """
+    Lazily enumerates all paths from start to end with at most n flights that visit no city twice.
+
+    The search is a depth-first walk over the CSR graph that tracks the current path in a visited bitset. A branch is
+    cut as soon as the remaining flight budget is smaller than the BFS distance from its city to the target, so only
+    paths that can still reach the target within n flights are ever extended. Paths are yielded in the same order as
+    find_all_paths_with_max_n_flights produces them.
+
+    Args:
+        graph (CSRGraph): The compact graph.
+        start (int): The ID of the start city.
+        end (int): The ID of the destination city.
+        n (int): The maximum number of flights for each path.
+        hops_to_end (np.ndarray, optional): Precomputed BFS distances to end, indexed by city ID.
+
+    Yields:
+        list: A path as a list of city IDs.
+    """
+    if hops_to_end is None:
+        hops_to_end = graph.bfs(end)
+
+    # A city at depth d can only lie on a wanted path if d + (flights from the city to end) <= n
+    reach = np.where(hops_to_end >= 0, n - hops_to_end, -1)
+    expand = reach.copy()
+    expand[end] = -1  # paths stop at the destination
+    yield from _walk_simple_paths(graph.adjacency, start, reach.tolist(), expand.tolist(), {end: n})
+
+
+def iter_multi_target_paths(graph, starts, ends, tolerance, max_min_flights=5, restrictions=None):
+    """
+    Enumerates the routes of every (start, end) combination in a single pass.
+
+    One BFS is run from each end city (the graph is undirected, so this is the reverse BFS towards the end set).
+    For every start, each end gets its own flight budget of (minimum flights + tolerance), and a single depth-first
+    expansion walks all simple paths that can still reach at least one end within its budget. A path is emitted
+    whenever it arrives at an end within that end's budget, so the result is exactly the union of
+    all_paths_a_to_b over all combinations.
+
+    Args:
+        graph (CSRGraph): The compact graph.
+        starts (list): IDs of the possible start cities.
+        ends (list): IDs of the possible destination cities.
+        tolerance (int): The number of extra flights allowed above the minimum of each combination.
+        max_min_flights (int, optional): Combinations needing more flights than this are skipped. Defaults to 5.
+        restrictions (RestrictionIndex, optional): Restricted routes are pruned during the search instead of being
+            generated.
+
+    Yields:
+        list: A path as a list of city IDs.
+    """
+    for start, reach, expand, end_budgets in iter_search_plans(graph, starts, ends, tolerance, max_min_flights):
+        yield from _walk_simple_paths(graph.adjacency, start, reach, expand, end_budgets, restrictions)
+
+
+def iter_search_plans(graph, starts, ends, tolerance, max_min_flights=5):
+    """
+    Computes what the multi-target walk of every start needs (see iter_multi_target_paths), printing the
+    combinations without a path.
+
+    Yields:
+        tuple: The start ID, the reach and expand lists and the end budgets of the start (see _walk_simple_paths).
+    """
+    ends = list(dict.fromkeys(ends))
+    if not ends:
+        return
+    hops_from_ends = np.vstack([graph.bfs(end) for end in ends])
+    end_ids = np.array(ends)
+
+    for start in starts:
+        min_flights = hops_from_ends[:, start]
+        valid = (min_flights != -1) & (min_flights <= max_min_flights)
+        for end in end_ids[~valid]:
+            print(f"There is no path from {graph.names[start]} to {graph.names[end]}\n")
+        if not valid.any():
+            continue
+
+        budgets = min_flights + tolerance
+        per_end_reach = np.where((hops_from_ends >= 0) & valid[:, None], budgets[:, None] - hops_from_ends, -1)
+        reach = per_end_reach.max(axis=0)
+
+        # Beyond an end city the walk is only worth continuing towards one of the other ends
+        per_end_reach[np.arange(len(ends)), end_ids] = -1
+        expand = reach.copy()
+        expand[end_ids] = per_end_reach[:, end_ids].max(axis=0)
+
+        end_budgets = {int(end): int(budget) for end, budget in zip(end_ids[valid], budgets[valid])}
+        yield start, reach.tolist(), expand.tolist(), end_budgets
+
+
+def _walk_simple_paths(adjacency, start, reach, expand, end_budgets, restrictions=None):
+    """
+    Depth-first walk over simple paths shared by the path enumerators.
+
+    Args:
+        adjacency (list): Neighbor lists indexed by city ID.
+        start (int): The ID of the start city.
+        reach (list): The deepest depth at which each city can still lie on a wanted path (negative: never).
+        expand (list): The deepest depth from which the walk may continue beyond each city.
+        end_budgets (dict): The maximum number of flights for paths ending in each destination ID.
+        restrictions (RestrictionIndex, optional): Restrictions no yielded path may violate.
+
+    Yields:
+        list: A path as a list of city IDs.
+    """
+    if reach[start] < 0:
+        return
+    forbidden = 0
+    sequences_by_last = {}
+    if restrictions is not None:
+        if not restrictions.allows_city(start):
+            return
+        # Forbidden cities are treated as already visited, so the walk never enters them
+        forbidden = restrictions.city_mask
+        sequences_by_last = restrictions.sequences_by_last
+    if end_budgets.get(start, -1) >= 0:
+        yield [start]
+    if expand[start] < 0:
+        return
+
+    path = [start]
+    visited = forbidden | 1 << start
+    stack = [iter(adjacency[start])]
+    while stack:
+        for city in stack[-1]:
+            if visited >> city & 1:
+                continue
+            depth = len(path)
+            if reach[city] < depth:
+                continue
+            if city in sequences_by_last and not restrictions.allows_step(path, city):
+                continue
+            if end_budgets.get(city, -1) >= depth:
+                yield path + [city]
+            if expand[city] < depth:
+                continue
+            path.append(city)
+            visited |= 1 << city
+            stack.append(iter(adjacency[city]))
+            break
+        else:
+            stack.pop()
+            visited &= ~(1 << path.pop())
 
 
 def nearby_airport_finder(city, distance):
@@ -89,17 +238,7 @@ def nearby_airport_finder(city, distance):
     Returns:
         list: A list of nearby airports within the specified distance. If the city is not found, returns a list containing parameter city.
     """
-    with open(distances_json, 'r') as file:
-        data = json.load(file)
-    nearby_airports = [city]
-
-    if city in data:
-        city_distances = data[city]
-        for nearby_city, city_distance in city_distances.items():
-            if city_distance <= distance:
-                nearby_airports.append(nearby_city)
-
-    return nearby_airports
+    return get_geodata().nearby(city, distance)
 
 
 def all_paths_a_to_b(start_city, end_city, tolerance=0):
@@ -113,20 +252,26 @@ def all_paths_a_to_b(start_city, end_city, tolerance=0):
     Returns:
         list: A list of paths from start_city to end_city.
     """
-    min_flights = min_amount_flights(start_city, end_city)
+    graph = get_csr_graph()
+    start = graph.id_of(start_city)
+    hops_to_end = graph.bfs(graph.id_of(end_city)) if end_city in graph else None
+
+    min_flights = -1 if hops_to_end is None else int(hops_to_end[start])
     if min_flights == -1 or min_flights > 5:
         print(f"There is no path from {start_city} to {end_city}\n")
         return []
 
     if tolerance > 4:
         tolerance = 4
-    all_paths = find_all_paths_with_max_n_flights_no_revisits(start_city, end_city, min_flights + tolerance)
-    return all_paths
+    paths = iter_simple_paths(graph, start, graph.id_of(end_city), min_flights + tolerance, hops_to_end)
+    return [graph.names_of(path) for path in paths]
 
 
-def get_all_routes(city_start: str, radius_start: float, city_end: str, radius_end: float, tolerance: int):
+def get_all_routes(city_start: str, radius_start: float, city_end: str, radius_end: float, tolerance: int,
+                   restrictions=None):
     """
-    Finds all possible routes between two cities within specified radii and tolerance using multiprocessing.
+    Finds all possible routes between two cities within specified radii and tolerance in a single search pass (see
+    get_allowed_route_set).
 
     Args:
         city_start (str): Name of the starting city.
@@ -134,28 +279,70 @@ def get_all_routes(city_start: str, radius_start: float, city_end: str, radius_e
         city_end (str): Name of the destination city.
         radius_end (float): Radius around the destination city to search for airports.
         tolerance (int): Tolerance level for the routes.
+        restrictions (RestrictionIndex, optional): If given, only routes allowed by these restrictions are returned.
 
     Returns:
         list: A list of all possible routes from the start to the end city.
     """
-    starts = nearby_airport_finder(city_start, radius_start)
-    ends = nearby_airport_finder(city_end, radius_end)
+    graph = get_csr_graph()
+    route_set = get_allowed_route_set(city_start, radius_start, city_end, radius_end, tolerance, restrictions)
+    return [graph.names_of(route) for route in route_set.routes()]
 
-    all_routes = []
 
-    # Prepare all (start, end) combinations
-    route_combinations = [(start, end) for start in starts for end in ends]
+def get_allowed_route_set(city_start: str, radius_start: float, city_end: str, radius_end: float, tolerance: int,
+                          restrictions=None):
+    """
+    Like get_all_routes, but returns the routes as a RouteSet of city IDs, without building any list of names.
+    The unrestricted routes of a search are kept in the route cache, so repeated searches of the same airports and
+    tolerance, by any profile, only filter the cached set by their restrictions. The price is paid on a cache miss:
+    restricted routes are enumerated too instead of being pruned during the walk (see iter_multi_target_paths),
+    which costs more the more of the corridor the restrictions forbid.
 
-    # Use multiprocessing at the route combination level
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        # Submit each start-end combination to the pool
-        futures = [executor.submit(all_paths_a_to_b, start, end, tolerance) for start, end in route_combinations]
+    Args:
+        city_start (str): Name of the starting city.
+        radius_start (float): Radius around the starting city to search for airports.
+        city_end (str): Name of the destination city.
+        radius_end (float): Radius around the destination city to search for airports.
+        tolerance (int): Tolerance level for the routes.
+        restrictions (RestrictionIndex, optional): If given, only routes allowed by these restrictions are returned.
 
-        # Collecting results from the futures
-        for future in concurrent.futures.as_completed(futures):
-            all_routes.extend(future.result())
+    Returns:
+        RouteSet: The possible routes from the start to the end city.
+    """
+    graph = get_csr_graph()
+    starts = graph.ids_of(nearby_airport_finder(city_start, radius_start))
+    ends = [city for city in nearby_airport_finder(city_end, radius_end) if city in graph]
 
-    return all_routes
+    if tolerance > 4:
+        tolerance = 4
+    route_set = get_route_set(graph, starts, graph.ids_of(ends), tolerance)
+    if restrictions:
+        route_set = route_set.select(route_set.allowed(restrictions))
+    return route_set
+
+
+def get_route_set(graph, starts, ends, tolerance, max_min_flights=5):
+    """
+    Returns the unrestricted routes of iter_multi_target_paths from the route cache, enumerating them on a miss.
+
+    Args:
+        graph (CSRGraph): The compact graph.
+        starts (list): IDs of the possible start cities.
+        ends (list): IDs of the possible destination cities.
+        tolerance (int): The number of extra flights allowed above the minimum of each combination.
+        max_min_flights (int, optional): Combinations needing more flights than this are skipped. Defaults to 5.
+
+    Returns:
+        RouteSet: The routes as compact integer arrays.
+    """
+    cache = get_route_cache()
+    key = cache.key(graph, starts, ends, tolerance, max_min_flights)
+    route_set = cache.get(key)
+    if route_set is None:
+        route_set = RouteSet.from_routes(iter_multi_target_paths(graph, starts, ends, tolerance, max_min_flights),
+                                         len(graph))
+        cache.put(key, route_set)
+    return route_set
 
 
 def calculate_path_distance(path):
@@ -168,9 +355,11 @@ def calculate_path_distance(path):
     Returns:
         float: The total distance of the path in kilometers.
     """
+    graph = get_csr_graph()
+    ids = graph.ids_of(path)
     distance = 0
-    for i in range(len(path) - 1):
-        distance += G[path[i]][path[i + 1]]['weight']
+    for i in range(len(ids) - 1):
+        distance += graph.edge_weight(ids[i], ids[i + 1])
     return distance
 
 
@@ -184,8 +373,10 @@ def shortest_path_km(start_city):
     Returns:
         list: A list of [destination, distance] pairs, sorted by distance.
     """
-    shortest_paths = nx.single_source_dijkstra_path_length(G, start_city, weight='weight')
-    return [[destination, distance] for destination, distance in shortest_paths.items() if distance != 0]
+    graph = get_csr_graph()
+    distances = graph.dijkstra(graph.id_of(start_city))
+    order = np.argsort(distances, kind='stable')
+    return [[graph.names[i], float(distances[i])] for i in order if 0 < distances[i] < np.inf]
 
 
 def shortest_path_flights(start_city):
@@ -198,8 +389,10 @@ def shortest_path_flights(start_city):
     Returns:
         list: A list of [destination, num_flights] pairs, sorted by the number of flights.
     """
-    bfs_shortest_paths = nx.single_source_shortest_path_length(G, start_city)
-    return [[destination, num_edges] for destination, num_edges in bfs_shortest_paths.items() if num_edges != 0]
+    graph = get_csr_graph()
+    hops = graph.bfs(graph.id_of(start_city))
+    order = np.argsort(hops, kind='stable')
+    return [[graph.names[i], int(hops[i])] for i in order if hops[i] > 0]
 
 
 def sum_all_km(start_city):
@@ -212,8 +405,9 @@ def sum_all_km(start_city):
     Returns:
         float: The sum of all distances in kilometers.
     """
-    shortest_paths = nx.single_source_dijkstra_path_length(G, start_city, weight='weight')
-    return sum(distance for distance in shortest_paths.values())
+    graph = get_csr_graph()
+    distances = graph.dijkstra(graph.id_of(start_city))
+    return float(distances[distances < np.inf].sum())
 
 
 def sum_all_flights(start_city):
@@ -226,8 +420,9 @@ def sum_all_flights(start_city):
     Returns:
         int: The sum of all flights.
     """
-    bfs_shortest_paths = nx.single_source_shortest_path_length(G, start_city)
-    return sum(num_edges for num_edges in bfs_shortest_paths.values())
+    graph = get_csr_graph()
+    hops = graph.bfs(graph.id_of(start_city))
+    return int(hops[hops > 0].sum())
 
 
 def filter_routes_length(min_km, max_km):
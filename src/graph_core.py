@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import heapq
+from collections import deque
+import numpy as np
+from src.graph_maker import load_graph
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+graph_pkl = os.path.join(base_dir, 'data', 'graph.pkl')
+edges_json = os.path.join(base_dir, 'data', 'edges.json')
+
+
+class CSRGraph:
+    """
+    Compact, integer-indexed copy of the flight graph used by the search hot path.
+
+    Every city is mapped to a consecutive integer ID. The adjacency of city ``u`` is stored in
+    ``indices[indptr[u]:indptr[u + 1]]`` and the matching edge weights (km) in ``weights`` at the same positions,
+    so the position inside ``indices`` doubles as a directed edge ID. City names are only needed when translating
+    results back at the API boundary.
+    """
+
+    def __init__(self, names: list, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+        # Plain python lists are faster than numpy slices for the per-node loops of BFS/DFS
+        self.adjacency = [self.indices[self.indptr[u]:self.indptr[u + 1]].tolist() for u in range(len(self.names))]
+        self.edge_ids = {}
+        for u in range(len(self.names)):
+            for eid in range(self.indptr[u], self.indptr[u + 1]):
+                self.edge_ids[(u, int(self.indices[eid]))] = eid
+
+        self._hop_matrix = None
+        self._edge_matrix = None
+        self._version = None
+
+    @classmethod
+    def from_adjacency(cls, adjacency: dict):
+        """
+        Builds the CSR arrays from a nested ``{city: {neighbor: distance}}`` mapping.
+
+        Args:
+            adjacency (dict): The adjacency mapping, either from edges.json or a networkx graph.
+
+        Returns:
+            CSRGraph: The compact graph.
+        """
+        names = list(adjacency.keys())
+        for connections in adjacency.values():
+            for neighbor in connections:
+                if neighbor not in adjacency:
+                    adjacency[neighbor] = {}
+                    names.append(neighbor)
+        index = {name: i for i, name in enumerate(names)}
+
+        indptr = np.zeros(len(names) + 1, dtype=np.int32)
+        indices = []
+        weights = []
+        for i, name in enumerate(names):
+            for neighbor, distance in adjacency[name].items():
+                indices.append(index[neighbor])
+                weights.append(distance)
+            indptr[i + 1] = len(indices)
+
+        return cls(names, indptr, np.array(indices, dtype=np.int32), np.array(weights, dtype=np.float64))
+
+    @classmethod
+    def from_networkx(cls, G):
+        """
+        Builds the compact graph from a networkx graph, keeping its node and neighbor order.
+
+        Args:
+            G (networkx.Graph): The graph with 'weight' edge attributes.
+
+        Returns:
+            CSRGraph: The compact graph.
+        """
+        return cls.from_adjacency({city: {neighbor: data['weight'] for neighbor, data in G[city].items()}
+                                   for city in G.nodes})
+
+    @classmethod
+    def from_edges_json(cls, file_path: str = edges_json):
+        """
+        Builds the compact graph directly from the edges.json file.
+
+        Args:
+            file_path (str): Path to the edges.json file.
+
+        Returns:
+            CSRGraph: The compact graph.
+        """
+        with open(file_path, 'r') as f:
+            return cls.from_adjacency(json.load(f))
+
+    @property
+    def version(self) -> str:
+        """
+        Fingerprint of the cities and flights, equal for graphs with the same structure (used as cache key).
+        """
+        if self._version is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update("\n".join(self.names).encode('utf-8'))
+            digest.update(self.indptr.tobytes())
+            digest.update(self.indices.tobytes())
+            self._version = digest.hexdigest()
+        return self._version
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, city):
+        return city in self.index
+
+    def id_of(self, city: str) -> int:
+        """
+        Translates a city name into its integer ID.
+
+        Raises:
+            ValueError: If the city is not part of the graph.
+        """
+        try:
+            return self.index[city]
+        except KeyError:
+            raise ValueError(f"City '{city}' not found in the graph.")
+
+    def ids_of(self, cities) -> list:
+        return [self.id_of(city) for city in cities]
+
+    def names_of(self, ids) -> list:
+        return [self.names[i] for i in ids]
+
+    def neighbors(self, u: int) -> list:
+        return self.adjacency[u]
+
+    def degree(self, u: int) -> int:
+        return int(self.indptr[u + 1] - self.indptr[u])
+
+    def edge_id(self, u: int, v: int) -> int:
+        """
+        Returns the directed edge ID of u -> v, or -1 if there is no flight between them.
+        """
+        return self.edge_ids.get((u, v), -1)
+
+    def edge_weight(self, u: int, v: int) -> float:
+        eid = self.edge_ids.get((u, v), -1)
+        if eid == -1:
+            raise ValueError(f"No flight between {self.names[u]} and {self.names[v]}.")
+        return float(self.weights[eid])
+
+    def edge_matrix(self) -> np.ndarray:
+        """
+        Dense N x N matrix of directed edge IDs (-1 where there is no flight), built once for vectorized lookups.
+        """
+        if self._edge_matrix is None:
+            matrix = np.full((len(self.names), len(self.names)), -1, dtype=np.int32)
+            for (u, v), eid in self.edge_ids.items():
+                matrix[u, v] = eid
+            self._edge_matrix = matrix
+        return self._edge_matrix
+
+    def bfs(self, source: int) -> np.ndarray:
+        """
+        Computes the minimum number of flights from source to every city.
+
+        Args:
+            source (int): The ID of the start city.
+
+        Returns:
+            np.ndarray: Hop distances indexed by city ID, -1 for unreachable cities.
+        """
+        hops = np.full(len(self.names), -1, dtype=np.int32)
+        hops[source] = 0
+        queue = deque([source])
+        adjacency = self.adjacency
+        while queue:
+            u = queue.popleft()
+            next_hops = hops[u] + 1
+            for v in adjacency[u]:
+                if hops[v] == -1:
+                    hops[v] = next_hops
+                    queue.append(v)
+        return hops
+
+    def hop_matrix(self) -> np.ndarray:
+        """
+        All-pairs minimum number of flights, computed once and cached (the graph is undirected, so it is symmetric).
+
+        Returns:
+            np.ndarray: An N x N matrix of hop distances, -1 for unreachable pairs.
+        """
+        if self._hop_matrix is None:
+            self._hop_matrix = np.vstack([self.bfs(u) for u in range(len(self.names))])
+        return self._hop_matrix
+
+    def dijkstra(self, source: int, weights: np.ndarray = None) -> np.ndarray:
+        """
+        Computes the shortest distance in kilometers from source to every city.
+
+        Args:
+            source (int): The ID of the start city.
+            weights (np.ndarray, optional): Edge lengths indexed by edge ID, defaults to the graph's weights.
+
+        Returns:
+            np.ndarray: Distances indexed by city ID, inf for unreachable cities.
+        """
+        distances = np.full(len(self.names), np.inf)
+        distances[source] = 0.0
+        heap = [(0.0, source)]
+        indptr, indices = self.indptr, self.indices
+        if weights is None:
+            weights = self.weights
+        while heap:
+            distance, u = heapq.heappop(heap)
+            if distance > distances[u]:
+                continue
+            for eid in range(indptr[u], indptr[u + 1]):
+                v = indices[eid]
+                candidate = distance + weights[eid]
+                if candidate < distances[v]:
+                    distances[v] = candidate
+                    heapq.heappush(heap, (candidate, v))
+        return distances
+
+
+def pack_routes(routes: list, width: int = None):
+    """
+    Packs routes of city IDs into one padded integer array (route x hop), the layout used by the batch scorers.
+
+    Args:
+        routes (list): Routes as lists of city IDs.
+        width (int, optional): Number of columns, defaults to the length of the longest route.
+
+    Returns:
+        tuple: The (R, width) int32 array padded with -1, and the int32 array of route lengths (number of cities).
+    """
+    lengths = np.fromiter((len(route) for route in routes), dtype=np.int32, count=len(routes))
+    if width is None:
+        width = int(lengths.max()) if len(routes) else 0
+    packed = np.full((len(routes), width), -1, dtype=np.int32)
+    for i, route in enumerate(routes):
+        packed[i, :len(route)] = route
+    return packed, lengths
+
+
+def row_sums(values: np.ndarray) -> np.ndarray:
+    """
+    Sums every row of a packed array strictly from left to right. Unlike np.sum, whose pairwise summation depends
+    on the row length, the result for a route is the same whatever padding width its batch was packed with.
+    """
+    values = np.asarray(values)
+    if values.shape[1] == 0:
+        return np.zeros(len(values), dtype=values.dtype)
+    totals = values[:, 0].copy()
+    for column in range(1, values.shape[1]):
+        totals += values[:, column]
+    return totals
+
+
+def load_csr_graph(graph_file: str = graph_pkl, edges_file: str = edges_json) -> CSRGraph:
+    """
+    Loads the compact graph from the pickled networkx graph, or from edges.json if no pickle exists.
+    """
+    if os.path.exists(graph_file):
+        return CSRGraph.from_networkx(load_graph(graph_file))
+    return CSRGraph.from_edges_json(edges_file)
+
+
+_csr_graph = None
+
+
+def get_csr_graph() -> CSRGraph:
+    """
+    Returns the process-wide compact graph, building it on first use.
+    """
+    global _csr_graph
+    if _csr_graph is None:
+        _csr_graph = load_csr_graph()
+    return _csr_graph
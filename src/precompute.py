@@ -1,46 +1,182 @@
 import os
 import json
-from src.rating_city import rate_city
-from src.rating_flight import rate_flight
+import tempfile
+import threading
+import time
+import numpy as np
+from src.rating_city import rate_cities
+from src.rating_flight import rate_flights
 from src.weights import Weights
 from src.essentials import get_Graph
+from src.destination import Destination, get_profile, get_destination
+from src.geodata import get_geodata
+from src.graph_core import get_csr_graph
 
 G = get_Graph()
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Inputs of the city ratings and the flight ratings, read from a city's Destination
+CITY_INPUTS = {
+    "visited": Destination.get_city_visited,
+    "country_visited": Destination.get_country_visited,
+    "rating": Destination.get_city_preferability,
+    "country_rating": Destination.get_country_preferability,
+    "revisit": Destination.get_city_would_visit_again,
+    "accessibility_general": Destination.get_accessibility_general,
+    "proximity_airport": Destination.get_proximity_airport,
+    "accessibility_foot": Destination.get_reachability_by_foot,
+    "accessibility_transport": Destination.get_reachability_by_public_transport,
+    "cheap_transport": Destination.get_cost_of_reachability,
+    "visa_needed": Destination.get_country_visa_needed,
+    "eu_member": Destination.get_country_eu_member,
+    "degree": Destination.get_degree,
+}
+FLIGHT_INPUTS = {
+    "eu_member": Destination.get_country_eu_member,
+    "degree": Destination.get_degree,
+    "airport_rating": Destination.get_airport_rating,
+    # The flight distances are derived from the airport coordinates
+    "coordinates": lambda city: get_geodata().coordinates(city.city),
+}
+
+# The inputs a rating depends on as long as the weight is not 0 / the hard switch is set
+CITY_WEIGHT_INPUTS = {
+    ("unvisited_city", "visited_city"): ("visited",),
+    ("unvisited_country", "visited_country"): ("country_visited",),
+    ("high_rated_city", "low_rated_city"): ("rating",),
+    ("high_rated_country", "low_rated_country"): ("country_rating",),
+    ("revisits", "no_revisits"): ("revisit",),
+    ("accessibility_general", "not_accessibility_general"): ("accessibility_general", "proximity_airport"),
+    ("near_city_airport", "far_city_airport"): ("proximity_airport",),
+    ("accessibility_foot", "not_accessibility_foot"): ("accessibility_foot",),
+    ("accessibility_transport", "not_accessibility_transport"): ("accessibility_transport",),
+    ("cheap_transport", "expensive_transport"): ("cheap_transport",),
+    ("visa_needed", "no_visa_needed"): ("visa_needed",),
+    ("eu_member", "not_eu_member"): ("eu_member",),
+    ("high_degree", "low_degree"): ("degree",),
+}
+CITY_SWITCH_INPUTS = {
+    "eu_member": "eu_member",
+    "no_visa": "visa_needed",
+    "only_unvisited_city": "visited",
+    "only_unvisited_country": "country_visited",
+    "only_revisit": "revisit",
+}
+FLIGHT_WEIGHT_INPUTS = {
+    ("high_distance", "low_distance"): ("coordinates",),
+    ("eu_261", "no_eu_261"): ("eu_member",),
+    ("high_airport_rating", "low_airport_rating"): ("airport_rating",),
+    ("degree_level_up", "degree_level_down"): ("degree",),
+}
+FLIGHT_SWITCH_INPUTS = {
+    "only_eu261": "eu_member",
+    "only_level_up": "degree",
+}
+
+
+def _used_inputs(weight_values: dict, switch_values: dict, weight_inputs: dict, switch_inputs: dict) -> list:
+    used = set()
+    for keys, inputs in weight_inputs.items():
+        if any(weight_values.get(key, 0) != 0 for key in keys):
+            used.update(inputs)
+    for switch, name in switch_inputs.items():
+        if switch_values.get(switch) in (0, 1):
+            used.add(name)
+    return sorted(used)
+
+
+def record_dependencies(weights: Weights, cities: list) -> dict:
+    """
+    Records what the ratings of a profile depend on: the weights and hard switches, and for every city the values
+    of the inputs that its city rating and the flight ratings from/to it read under these weights.
+
+    :return: The dependencies as stored in precomputed.json.
+    """
+    city_inputs = _used_inputs(weights.city_weights, weights.city_hard_switch, CITY_WEIGHT_INPUTS, CITY_SWITCH_INPUTS)
+    flight_inputs = _used_inputs(weights.flight_weights, weights.flight_hard_switch, FLIGHT_WEIGHT_INPUTS,
+                                 FLIGHT_SWITCH_INPUTS)
+    dependencies = {
+        "weights": {
+            "city": weights.city_weights,
+            "city_hard_switch": weights.city_hard_switch,
+            "flight": weights.flight_weights,
+            "flight_hard_switch": weights.flight_hard_switch,
+        },
+        "city": {},
+        "flight": {},
+    }
+    for city in cities:
+        destination = get_destination(city, username=weights.username, template_name=weights.template_name)
+        dependencies["city"][city] = {name: CITY_INPUTS[name](destination) for name in city_inputs}
+        dependencies["flight"][city] = {name: FLIGHT_INPUTS[name](destination) for name in flight_inputs}
+    # Normalize to what JSON gives back (e.g. tuples become lists), so recorded and fresh values compare equal
+    return json.loads(json.dumps(dependencies))
+
+
+def _write_precomputed(file_path: str, precomputed_data: dict):
+    """
+    Writes precomputed.json to a temporary file next to it and renames it, so readers (the workers reloading their
+    cached ratings) never see a partial file.
+
+    :param file_path: The path of precomputed.json.
+    :param precomputed_data: The city and route ratings and their dependencies.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix='.precomputed_', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(precomputed_data, f, indent=4)
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o777)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
 
-def precompute(username, template_name, output_dir=os.path.join(base_dir, 'data')):
-    weights = Weights(username, template_name)
-
-    # Clear dynamic restrictions
-    weights.clear_dynamic_city_restrictions()
-    weights.clear_dynamic_route_restrictions()
-
-    # Get cities and routes from the graph
-    cities = list(G.nodes)
-    routes = list(G.edges)
-
-    # Create a list of routes in both directions
-    true_routes = []
-    for each in routes:
-        true_routes.append(each)
-        true_routes.append((each[1], each[0]))
-
-    city_ratings = {}
-    route_ratings = {}
 
-    # Compute city ratings sequentially
-    for city in cities:
-        city_ratings[city] = rate_city(city, weights)
+def precompute(username, template_name, output_dir=os.path.join(base_dir, 'data')):
+    """
+    Rates every city and both directions of every flight of the graph for a profile and saves the ratings to
+    precomputed.json. Settings and geodata are loaded once and all ratings are computed as arrays by the batch
+    scorers; the time of every phase is printed.
+    """
+    timings = {}
+    phase_start = time.time()
 
-    # Compute route ratings sequentially
-    for city_a, city_b in true_routes:
-        rating = rate_flight(city_a, city_b, weights)
-        if city_a not in route_ratings:
-            route_ratings[city_a] = {}
-        route_ratings[city_a][city_b] = rating
+    weights = Weights(username, template_name)
 
+    # Restrictions set by the hard switches are collected and written to settings.json once
+    with weights.batch_restrictions():
+        # Clear dynamic restrictions
+        weights.clear_dynamic_city_restrictions()
+        weights.clear_dynamic_route_restrictions()
+
+        # Get cities and routes from the graph, the routes in both directions
+        cities = list(G.nodes)
+        true_routes = []
+        for each in G.edges:
+            true_routes.append(each)
+            true_routes.append((each[1], each[0]))
+
+        get_profile(username, template_name)
+        get_geodata()
+        timings["Loading"] = time.time() - phase_start
+
+        phase_start = time.time()
+        city_ratings = dict(zip(cities, rate_cities(cities, weights).tolist()))
+        timings["City ratings"] = time.time() - phase_start
+
+        phase_start = time.time()
+        route_ratings = {}
+        for (city_a, city_b), rating in zip(true_routes, rate_flights(true_routes, weights).tolist()):
+            if city_a not in route_ratings:
+                route_ratings[city_a] = {}
+            route_ratings[city_a][city_b] = rating
+        timings["Flight ratings"] = time.time() - phase_start
+        phase_start = time.time()
+    timings["Saving restrictions"] = time.time() - phase_start
+
+    phase_start = time.time()
     # Prepare output directory for the precomputed data
     user_dir = os.path.join(output_dir, username, template_name)
     os.makedirs(user_dir, exist_ok=True)
@@ -48,118 +184,114 @@ def precompute(username, template_name, output_dir=os.path.join(base_dir, 'data'
     # Prepare the structure for precomputed data (city and routes ratings)
     precomputed_data = {
         "city": city_ratings,
-        "routes": route_ratings
+        "routes": route_ratings,
+        "dependencies": record_dependencies(weights, cities)
     }
 
     # Save the precomputed data to precomputed.json
-    with open(os.path.join(user_dir, 'precomputed.json'), 'w', encoding='utf-8') as f:
-        json.dump(precomputed_data, f, indent=4)
+    _write_precomputed(os.path.join(user_dir, 'precomputed.json'), precomputed_data)
+    timings["Saving"] = time.time() - phase_start
 
     print(f"Precomputed data saved to {os.path.join(user_dir, 'precomputed.json')}")
-
-
-def retrieve_precomputed_data(username, template_name, output_dir=os.path.join(base_dir, 'data')):
-    user_dir = os.path.join(output_dir, username, template_name)
-    file_path = os.path.join(user_dir, 'precomputed.json')
-
-    if not os.path.exists(file_path):
-        print(f"No precomputed data found at {file_path}")
-        return None
-
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    return data
-
-
-if __name__ == "__main__":
-    username = "default"
-    template_name = "default"
-
-    w = Weights(username, template_name)
-    w.clear_dynamic_city_restrictions()
-    w.clear_dynamic_route_restrictions()
-
-    precompute(username, template_name)
-
-    # Retrieve the precomputed data
-    precomputed_data = retrieve_precomputed_data(username, template_name)
-    if precomputed_data:
-        print("Route Ratings:", precomputed_data['routes'].get("Dortmund", {}))
-
-
-"""
-multiprocessed faulty version:
-
-
-import os
-import json
-from src.rating_city import rate_city
-from src.rating_flight import rate_flight
-from src.weights import Weights
-from src.essentials import get_Graph
-import multiprocessing as mp
-from functools import partial
-
-G = get_Graph()
-
-base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-
-def compute_city_rating(city, weights):
-    return city, rate_city(city, weights)
-
-
-def compute_route_rating(city_a, city_b, weights):
-    return city_a, city_b, rate_flight(city_a, city_b, weights)
-
-
-def precompute(username, template_name, output_dir=os.path.join(base_dir, 'data')):
+    for phase, seconds in timings.items():
+        print(f"{phase}: {seconds:.4f} seconds")
+    print(f"Total: {sum(timings.values()):.4f} seconds")
+
+
+def update_precomputed(username, template_name, output_dir=os.path.join(base_dir, 'data')):
+    """
+    Brings precomputed.json up to date after settings.json or the graph changed, re-rating only what is affected
+    according to the recorded dependencies (see record_dependencies):
+
+    - a city whose city rating inputs changed is re-rated, and so are the flights from and to a city whose flight
+      rating inputs changed,
+    - changed weights or hard switches re-rate all cities and/or all flights,
+    - new cities and flights (e.g. after a route update) are rated, removed ones are dropped.
+
+    The dynamic restrictions of the re-rated elements are renewed and the file is patched in place. Without
+    recorded dependencies a full precompute is run instead.
+    """
+    file_path = os.path.join(output_dir, username, template_name, 'precomputed.json')
+    precomputed_data = retrieve_precomputed_data(username, template_name, output_dir)
+    if not precomputed_data or "dependencies" not in precomputed_data:
+        precompute(username, template_name, output_dir)
+        return
+
+    start_time = time.time()
     weights = Weights(username, template_name)
     cities = list(G.nodes)
-    routes = list(G.edges)
-
     true_routes = []
-    for each in routes:
+    for each in G.edges:
         true_routes.append(each)
         true_routes.append((each[1], each[0]))
 
-    city_ratings = {}
-    route_ratings = {}
-
-    # Use multiprocessing to compute city ratings in parallel
-    with mp.Pool() as pool:
-        compute_city_partial = partial(compute_city_rating, weights=weights)
-        city_results = pool.map(compute_city_partial, cities)
-
-    # Collect results into city_ratings
-    for city, rating in city_results:
-        city_ratings[city] = rating
-
-    # Use multiprocessing to compute route ratings in parallel
-    with mp.Pool() as pool:
-        compute_rating_partial = partial(compute_route_rating, weights=weights)
-        route_results = pool.starmap(compute_rating_partial, true_routes)
-
-    # Collect results into route_ratings
-    for city_a, city_b, rating in route_results:
-        if city_a not in route_ratings:
-            route_ratings[city_a] = {}
-        route_ratings[city_a][city_b] = rating
-
-    # Prepare output directory
-    user_dir = os.path.join(output_dir, username, template_name)
-    os.makedirs(user_dir, exist_ok=True)
-
-    # Store the results in a JSON file
-    precomputed_data = {
-        "city": city_ratings,
-        "routes": route_ratings
-    }
-    with open(os.path.join(user_dir, 'precomputed.json'), 'w', encoding='utf-8') as f:
-        json.dump(precomputed_data, f, indent=4)
-
-    print(f"Precomputed data saved to {os.path.join(user_dir, 'precomputed.json')}")
+    recorded = precomputed_data["dependencies"]
+    current = record_dependencies(weights, cities)
+    city_ratings = precomputed_data["city"]
+    route_ratings = precomputed_data["routes"]
+
+    # Everything depends on the weights, otherwise only cities with changed or new inputs are affected
+    if current["weights"]["city"] != recorded["weights"]["city"] or \
+            current["weights"]["city_hard_switch"] != recorded["weights"]["city_hard_switch"]:
+        changed_cities = cities
+    else:
+        changed_cities = [city for city in cities if current["city"][city] != recorded["city"].get(city)]
+    if current["weights"]["flight"] != recorded["weights"]["flight"] or \
+            current["weights"]["flight_hard_switch"] != recorded["weights"]["flight_hard_switch"]:
+        changed_flights = true_routes
+    else:
+        flight_cities = {city for city in cities if current["flight"][city] != recorded["flight"].get(city)}
+        changed_flights = [(city_a, city_b) for city_a, city_b in true_routes
+                           if city_a in flight_cities or city_b in flight_cities
+                           or city_b not in route_ratings.get(city_a, {})]
+
+    # Drop cities and flights that are no longer part of the graph
+    for city in set(city_ratings) - set(cities):
+        del city_ratings[city]
+    existing_flights = set(true_routes)
+    for city_a in list(route_ratings):
+        for city_b in list(route_ratings[city_a]):
+            if (city_a, city_b) not in existing_flights:
+                del route_ratings[city_a][city_b]
+        if not route_ratings[city_a]:
+            del route_ratings[city_a]
+
+    with weights.batch_restrictions():
+        # The hard switches are evaluated again for the re-rated elements
+        for city in changed_cities:
+            if city in weights.dynamic_city_restrictions:
+                weights.remove_dynamic_city_restriction(city)
+        for city_a, city_b in changed_flights:
+            if [city_a, city_b] in weights.dynamic_route_restrictions:
+                weights.remove_dynamic_route_restriction([city_a, city_b])
+
+        if changed_cities:
+            city_ratings.update(zip(changed_cities, rate_cities(changed_cities, weights).tolist()))
+        if changed_flights:
+            for (city_a, city_b), rating in zip(changed_flights, rate_flights(changed_flights, weights).tolist()):
+                route_ratings.setdefault(city_a, {})[city_b] = rating
+
+    precomputed_data["dependencies"] = current
+    _write_precomputed(file_path, precomputed_data)
+
+    print(f"Updated {len(changed_cities)} city and {len(changed_flights)} flight ratings in {file_path} "
+          f"in {time.time() - start_time:.4f} seconds")
+
+
+def update_all_precomputed(output_dir=os.path.join(base_dir, 'data')):
+    """
+    Runs update_precomputed for every profile (user and template) that has a precomputed.json, e.g. after the
+    routes changed.
+
+    :param output_dir: The directory holding the user directories.
+    """
+    for username in sorted(os.listdir(output_dir)):
+        user_dir = os.path.join(output_dir, username)
+        if not os.path.isdir(user_dir):
+            continue
+        for template_name in sorted(os.listdir(user_dir)):
+            if os.path.exists(os.path.join(user_dir, template_name, 'precomputed.json')):
+                update_precomputed(username, template_name, output_dir)
 
 
 def retrieve_precomputed_data(username, template_name, output_dir=os.path.join(base_dir, 'data')):
@@ -176,15 +308,93 @@ def retrieve_precomputed_data(username, template_name, output_dir=os.path.join(b
     return data
 
 
+class PrecomputedRatings:
+    """
+    Precomputed ratings of one profile laid out for array gathers: city ratings indexed by the CSR graph's city IDs
+    and flight ratings indexed by its directed edge IDs. Missing ratings are 0, like the dictionary lookups they
+    replace.
+    """
+    __slots__ = ("mtime", "data", "city", "flight")
+
+    def __init__(self, data: dict, mtime: int = None, graph=None):
+        if graph is None:
+            graph = get_csr_graph()
+        self.mtime = mtime
+        self.data = data
+
+        self.city = np.zeros(len(graph))
+        for city, rating in data.get('city', {}).items():
+            if city in graph:
+                self.city[graph.index[city]] = rating
+
+        self.flight = np.zeros(len(graph.indices))
+        for city_a, ratings in data.get('routes', {}).items():
+            if city_a not in graph:
+                continue
+            for city_b, rating in ratings.items():
+                edge_id = graph.edge_id(graph.index[city_a], graph.index.get(city_b, -1))
+                if edge_id != -1:
+                    self.flight[edge_id] = rating
+
+    def route_ratings(self, route_ids, graph=None):
+        """
+        Gathers the city ratings and the flight ratings along a route of city IDs.
+
+        :return: Two arrays: the rating of every city and of every flight of the route.
+        """
+        if graph is None:
+            graph = get_csr_graph()
+        edge_ids = np.array([graph.edge_id(route_ids[i], route_ids[i + 1]) for i in range(len(route_ids) - 1)],
+                            dtype=np.int64)
+        flight_ratings = np.where(edge_ids >= 0, self.flight[edge_ids], 0.0) if len(edge_ids) else np.zeros(0)
+        return self.city[route_ids], flight_ratings
+
+
+_precomputed_ratings = {}
+_precomputed_lock = threading.Lock()
+
+
+def get_precomputed_ratings(username, template_name, output_dir=os.path.join(base_dir, 'data')):
+    """
+    Returns the precomputed ratings of a profile from the in-process cache. precomputed.json is only parsed again
+    when its mtime changed.
+
+    :return: The PrecomputedRatings, or None if the profile has no precomputed data.
+    """
+    file_path = os.path.join(output_dir, username, template_name, 'precomputed.json')
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        print(f"No precomputed data found at {file_path}")
+        return None
+
+    ratings = _precomputed_ratings.get(file_path)
+    if ratings is None or ratings.mtime != mtime:
+        with _precomputed_lock:
+            ratings = _precomputed_ratings.get(file_path)
+            if ratings is None or ratings.mtime != mtime:
+                ratings = PrecomputedRatings(retrieve_precomputed_data(username, template_name, output_dir), mtime)
+                _precomputed_ratings[file_path] = ratings
+    return ratings
+
+
 if __name__ == "__main__":
     username = "default"
     template_name = "default"
 
-    precompute(username, template_name)
+    precomputed_data = retrieve_precomputed_data(username, template_name)
+    if precomputed_data and "dependencies" in precomputed_data:
+        # Only what changed since the last run is rated again
+        update_precomputed(username, template_name)
+    else:
+        w = Weights(username, template_name)
+        w.clear_dynamic_city_restrictions()
+        w.clear_dynamic_route_restrictions()
+
+        precompute(username, template_name)
 
     # Retrieve the precomputed data
     precomputed_data = retrieve_precomputed_data(username, template_name)
     if precomputed_data:
-        # print("City Ratings:", precomputed_data['city'])
-        print("Route Ratings:", precomputed_data['routes']["Dortmund"])
-"""
\ No newline at end of file
+        print("Route Ratings:", precomputed_data['routes'].get("Dortmund", {}))
+
@@ -1,186 +1,86 @@
-from src.destination import Destination
+from src.destination import Destination, get_destination
 from src.weights import Weights
-from src.essentials import custom_sigmoid
-
-
-def calculate_general_accessibility(city: Destination) -> float:
-    value = city.get_accessibility_general() * 0.06 + custom_sigmoid(city.get_proximity_airport(), -49.34, 14.12, 0, True) * 0.4
-    return value
+from src.essentials import SIGMOIDS, evaluate_max_weighting
+import numpy as np
 
 
 def rate_city(city_name: str, weights: Weights) -> float:
-    city_obj = Destination(city_name, username=weights.username, template_name=weights.template_name)
-    rating = 0
+    """
+    Rates a single city with rate_cities.
+
+    :param city_name: The city to rate.
+    :param weights: The weights of the profile.
+    :return: The rating of the city.
+    """
+    return float(rate_cities([city_name], weights)[0])
+
+
+def rate_cities(city_names: list, weights: Weights) -> np.ndarray:
+    """
+    Rates all given cities in one pass over arrays of their attributes and adds a dynamic restriction for every
+    city excluded by a hard switch.
+
+    :param city_names: The cities to rate.
+    :param weights: The weights of the profile.
+    :return: The ratings in the order of city_names.
+    """
+    cities = [get_destination(city, username=weights.username, template_name=weights.template_name)
+              for city in city_names]
+
+    def attribute(getter, dtype=np.float64):
+        return np.array([getter(city) for city in cities], dtype=dtype)
+
+    visited = attribute(Destination.get_city_visited, bool)
+    country_visited = attribute(Destination.get_country_visited, bool)
+    revisit = attribute(Destination.get_city_would_visit_again, bool)
+    eu_member = attribute(Destination.get_country_eu_member, bool)
+    visa_needed = attribute(Destination.get_country_visa_needed, bool)
+    city_pref = attribute(Destination.get_city_preferability)
+    country_pref = attribute(Destination.get_country_preferability)
+    proximity = SIGMOIDS["airport_proximity"](attribute(Destination.get_proximity_airport))
+    general_accessibility = attribute(Destination.get_accessibility_general) * 0.06 + proximity * 0.4
+    foot = attribute(Destination.get_reachability_by_foot)
+    transport = attribute(Destination.get_reachability_by_public_transport)
+    cost = attribute(Destination.get_cost_of_reachability)
+    deg = attribute(Destination.get_degree)
+    degree_rating = np.where(deg < 3, 0, np.where(deg <= 15, SIGMOIDS["city_degree"](deg), 1))
+
+    # Check Hard Switches, each switch restricts the cities for which the value differs from the switch
+    restricted = np.zeros(len(cities), dtype=bool)
+    for switch, values in (("eu_member", eu_member), ("no_visa", visa_needed), ("only_unvisited_city", ~visited),
+                           ("only_unvisited_country", ~country_visited), ("only_revisit", revisit)):
+        if weights.city_hard_switch.get(switch) == 1:
+            restricted |= ~values
+        elif weights.city_hard_switch.get(switch) == 0:
+            restricted |= values
+    for i in np.flatnonzero(restricted):
+        weights.add_dynamic_city_restriction(city_names[i])
+
+    rating = np.zeros(len(cities))
     total_weight_sum = 0
-
-    def check_and_restrict(condition):
-        if condition:
-            weights.add_dynamic_city_restriction(city_name)
-        return
-
-    # Check Hard Switches
-    if weights.city_hard_switch.get("eu_member") == 1:
-        check_and_restrict(not city_obj.get_country_eu_member())
-    elif weights.city_hard_switch.get("eu_member") == 0:
-        check_and_restrict(city_obj.get_country_eu_member())
-
-    if weights.city_hard_switch.get("no_visa") == 1:
-        check_and_restrict(not city_obj.get_country_visa_needed())
-    elif weights.city_hard_switch.get("no_visa") == 0:
-        check_and_restrict(city_obj.get_country_visa_needed())
-
-    if weights.city_hard_switch.get("only_unvisited_city") == 1:
-        check_and_restrict(city_obj.get_city_visited())
-    elif weights.city_hard_switch.get("only_unvisited_city") == 0:
-        check_and_restrict(not city_obj.get_city_visited())
-
-    if weights.city_hard_switch.get("only_unvisited_country") == 1:
-        check_and_restrict(city_obj.get_country_visited())
-    elif weights.city_hard_switch.get("only_unvisited_country") == 0:
-        check_and_restrict(not city_obj.get_country_visited())
-
-    if weights.city_hard_switch.get("only_revisit") == 1:
-        check_and_restrict(not city_obj.get_city_would_visit_again())
-    elif weights.city_hard_switch.get("only_revisit") == 0:
-        check_and_restrict(city_obj.get_city_would_visit_again())
-
-    # Unvisited/Visited City
-    if weights.city_weights.get("unvisited_city") != 0 or weights.city_weights.get("visited_city") != 0:
-        if weights.city_weights.get("unvisited_city") != 0:
-            rating += weights.city_weights.get("unvisited_city") * (not city_obj.get_city_visited())
-        else:
-            rating += weights.city_weights.get("visited_city") * city_obj.get_city_visited()
-        total_weight_sum += max(weights.city_weights.get("unvisited_city"),
-                                weights.city_weights.get("visited_city"))
-
-    # Unvisited/Visited Country
-    if weights.city_weights.get("unvisited_country") != 0 or weights.city_weights.get("visited_country") != 0:
-        if weights.city_weights.get("unvisited_country") != 0:
-            rating += weights.city_weights.get("unvisited_country") * (not city_obj.get_country_visited())
-        else:
-            rating += weights.city_weights.get("visited_country") * city_obj.get_country_visited()
-        total_weight_sum += max(weights.city_weights.get("unvisited_country"),
-                                weights.city_weights.get("visited_country"))
-
-    # High/Low Rated City
-    city_pref = city_obj.get_city_preferability()
-    if weights.city_weights.get("high_rated_city") != 0 or weights.city_weights.get("low_rated_city") != 0:
-        if weights.city_weights.get("high_rated_city") != 0:
-            rating += weights.city_weights.get("high_rated_city") * city_pref / 10
-        else:
-            rating += weights.city_weights.get("low_rated_city") * (10 - city_pref) / 10
-        total_weight_sum += max(weights.city_weights.get("high_rated_city"),
-                                weights.city_weights.get("low_rated_city"))
-
-    # High/Low Rated Country
-    country_pref = city_obj.get_country_preferability()
-    if weights.city_weights.get("high_rated_country") != 0 or weights.city_weights.get("low_rated_country") != 0:
-        if weights.city_weights.get("high_rated_country") != 0:
-            rating += weights.city_weights.get("high_rated_country") * country_pref / 10
-        else:
-            rating += weights.city_weights.get("low_rated_country") * (10 - country_pref) / 10
-        total_weight_sum += max(weights.city_weights.get("high_rated_country"),
-                                weights.city_weights.get("low_rated_country"))
-
-    # Revisits/No Revisits
-    if weights.city_weights.get("revisits") != 0 or weights.city_weights.get("no_revisits") != 0:
-        if weights.city_weights.get("revisits") != 0:
-            rating += weights.city_weights.get("revisits") * city_obj.get_city_would_visit_again()
-        else:
-            rating += weights.city_weights.get("no_revisits") * (not city_obj.get_city_would_visit_again())
-        total_weight_sum += max(weights.city_weights.get("revisits"), weights.city_weights.get("no_revisits"))
-
-    # Accessibility General/Not Accessibility General
-    if weights.city_weights.get("accessibility_general") != 0 or weights.city_weights.get(
-            "not_accessibility_general") != 0:
-        if weights.city_weights.get("accessibility_general") != 0:
-            rating += weights.city_weights.get("accessibility_general") * calculate_general_accessibility(city_obj)
-        else:
-            rating += weights.city_weights.get("not_accessibility_general") * (1 - calculate_general_accessibility(city_obj))
-        total_weight_sum += max(weights.city_weights.get("accessibility_general"),
-                                weights.city_weights.get("not_accessibility_general"))
-
-    # Proximity Airport
-    if weights.city_weights.get("near_city_airport") != 0 or weights.city_weights.get(
-            "far_city_airport") != 0:
-        if weights.city_weights.get("near_city_airport") != 0:
-            rating += weights.city_weights.get("near_city_airport") * custom_sigmoid(city_obj.get_proximity_airport(), -49.34, 14.12, 0, True)
-        else:
-            rating += weights.city_weights.get("far_city_airport") * (1 - custom_sigmoid(city_obj.get_proximity_airport(), -49.34, 14.12, 0, True))
-        total_weight_sum += max(weights.city_weights.get("near_city_airport"),
-                                weights.city_weights.get("far_city_airport"))
-
-    # Accessibility by Foot/Not Accessibility by Foot
-    if weights.city_weights.get("accessibility_foot") != 0 or weights.city_weights.get(
-            "not_accessibility_foot") != 0:
-        if weights.city_weights.get("accessibility_foot") != 0:
-            rating += weights.city_weights.get("accessibility_foot") * city_obj.get_reachability_by_foot() / 10
-        else:
-            rating += weights.city_weights.get("not_accessibility_foot") * (
-                        10 - city_obj.get_reachability_by_foot()) / 10
-        total_weight_sum += max(weights.city_weights.get("accessibility_foot"),
-                                weights.city_weights.get("not_accessibility_foot"))
-
-    # Accessibility by Public Transport/Not Accessibility by Public Transport
-    if weights.city_weights.get("accessibility_transport") != 0 or weights.city_weights.get(
-            "not_accessibility_transport") != 0:
-        if weights.city_weights.get("accessibility_transport") != 0:
-            rating += weights.city_weights.get(
-                "accessibility_transport") * city_obj.get_reachability_by_public_transport() / 10
-        else:
-            rating += weights.city_weights.get("not_accessibility_transport") * (
-                    10 - city_obj.get_reachability_by_public_transport()) / 10
-        total_weight_sum += max(weights.city_weights.get("accessibility_transport"),
-                                weights.city_weights.get("not_accessibility_transport"))
-
-    # Cheap Transport/Expensive Transport
-    if weights.city_weights.get("cheap_transport") != 0 or weights.city_weights.get("expensive_transport") != 0:
-        if weights.city_weights.get("cheap_transport") != 0:
-            rating += weights.city_weights.get("cheap_transport") * city_obj.get_cost_of_reachability() / 10
-        else:
-            rating += weights.city_weights.get("expensive_transport") * (
-                        10 - city_obj.get_cost_of_reachability()) / 10
-        total_weight_sum += max(weights.city_weights.get("cheap_transport"),
-                                weights.city_weights.get("expensive_transport"))
-
-    # Visa Needed/No Visa Needed
-    if weights.city_weights.get("visa_needed") != 0 or weights.city_weights.get("no_visa_needed") != 0:
-        if weights.city_weights.get("visa_needed") != 0:
-            rating += weights.city_weights.get("visa_needed") * city_obj.get_country_visa_needed()
-        else:
-            rating += weights.city_weights.get("no_visa_needed") * (not city_obj.get_country_visa_needed())
-        total_weight_sum += max(weights.city_weights.get("visa_needed"), weights.city_weights.get("no_visa_needed"))
-
-    # EU Member/Not EU Member
-    if weights.city_weights.get("eu_member") != 0 or weights.city_weights.get("not_eu_member") != 0:
-        if weights.city_weights.get("eu_member") != 0:
-            rating += weights.city_weights.get("eu_member") * city_obj.get_country_eu_member()
-        else:
-            rating += weights.city_weights.get("not_eu_member") * (not city_obj.get_country_eu_member())
-        total_weight_sum += max(weights.city_weights.get("eu_member"), weights.city_weights.get("not_eu_member"))
-
-    # High Degree/Low Degree
-    deg = city_obj.get_degree()
-    if deg < 3:
-        degree_rating = 0
-    elif deg <= 15:
-        degree_rating = custom_sigmoid(deg, 10.77, 2.58, 15.1, False)
-    else:
-        degree_rating = 1
-
-    if weights.city_weights.get("high_degree") != 0 or weights.city_weights.get("low_degree") != 0:
-        if weights.city_weights.get("high_degree") != 0:
-            rating += weights.city_weights.get("high_degree") * degree_rating
-        else:
-            rating += weights.city_weights.get("low_degree") * (1 - degree_rating)
-        total_weight_sum += max(weights.city_weights.get("high_degree"), weights.city_weights.get("low_degree"))
-
-    # Normalize and return the final rating
+    for pro, con, pro_result, con_result in (
+            ("unvisited_city", "visited_city", ~visited, visited),
+            ("unvisited_country", "visited_country", ~country_visited, country_visited),
+            ("high_rated_city", "low_rated_city", city_pref / 10, (10 - city_pref) / 10),
+            ("high_rated_country", "low_rated_country", country_pref / 10, (10 - country_pref) / 10),
+            ("revisits", "no_revisits", revisit, ~revisit),
+            ("accessibility_general", "not_accessibility_general", general_accessibility, 1 - general_accessibility),
+            ("near_city_airport", "far_city_airport", proximity, 1 - proximity),
+            ("accessibility_foot", "not_accessibility_foot", foot / 10, (10 - foot) / 10),
+            ("accessibility_transport", "not_accessibility_transport", transport / 10, (10 - transport) / 10),
+            ("cheap_transport", "expensive_transport", cost / 10, (10 - cost) / 10),
+            ("visa_needed", "no_visa_needed", visa_needed, ~visa_needed),
+            ("eu_member", "not_eu_member", eu_member, ~eu_member),
+            ("high_degree", "low_degree", degree_rating, 1 - degree_rating)):
+        rated, weight = evaluate_max_weighting(weights.city_weights.get(pro), weights.city_weights.get(con),
+                                               pro_result, con_result)
+        rating += rated
+        total_weight_sum += weight
+
+    # Normalize the final ratings
     if total_weight_sum == 0:
-        return 0
-    else:
-        rating = (rating / total_weight_sum) * 100
-        return round(rating, 5)
+        return np.zeros(len(cities))
+    return np.round(rating / total_weight_sum * 100, 5)
 
 
 if __name__ == '__main__':
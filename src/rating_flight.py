@@ -1,120 +1,115 @@
-from src.destination import Destination
+from src.destination import get_destination
 from src.weights import Weights
-from src.essentials import custom_sigmoid
+from src.essentials import SIGMOIDS, evaluate_max_weighting
+from src.geodata import get_geodata
+import numpy as np
 
 
-# returns rating, weight
-def rate_degree_transition(departure_degree, arrival_degree, low_threshold, high_threshold, weights, threshold_not_met_relief_factor=6):
-    if weights.flight_weights.get("degree_level_up") == 0 and weights.flight_weights.get("degree_level_down") == 0:
-        return 0, 0
+def rate_degree_transitions(departure_degree: np.ndarray, arrival_degree: np.ndarray, low_threshold, high_threshold,
+                            weights, threshold_not_met_relief_factor=6):
+    """
+    Rates the change of the degree (number of connections) from the departure to the arrival city of every flight.
+
+    :return: The ratings and the weights, both arrays in the order of the given degrees.
+    """
+    level_up = weights.flight_weights.get("degree_level_up")
+    level_down = weights.flight_weights.get("degree_level_down")
+    if level_up == 0 and level_down == 0:
+        return np.zeros(len(departure_degree)), np.zeros(len(departure_degree))
 
     degree_diff = arrival_degree - departure_degree
-    if degree_diff == 0:
-        return 0, max(weights.flight_weights.get("degree_level_up"), weights.flight_weights.get("degree_level_down"))
-
-    if degree_diff > 0:
-        ratio = max(arrival_degree, departure_degree) / min(arrival_degree, departure_degree)
-        if weights.flight_weights.get("degree_level_up") == 0:
-            if departure_degree <= low_threshold and \
-                    arrival_degree >= high_threshold:
-                return 0, weights.flight_weights.get("degree_level_down")
-            else:
-                return 0, weights.flight_weights.get("degree_level_down") / threshold_not_met_relief_factor
-        else:
-            if departure_degree <= low_threshold and \
-                    arrival_degree >= high_threshold:
-                return min(1.0, custom_sigmoid(degree_diff, 4.32, 0.67, 15, False)) * \
-                       min(1.0, custom_sigmoid(ratio, 1.68, 0.497, 4, False)), \
-                       weights.flight_weights.get("degree_level_up")
-            else:
-                return 0, weights.flight_weights.get("degree_level_up") / threshold_not_met_relief_factor
-    else:
-        degree_diff *= -1
-        temp = departure_degree
-        departure_degree = arrival_degree
-        arrival_degree = temp
-        del temp
-
-        ratio = min(arrival_degree, departure_degree) / max(arrival_degree, departure_degree)
-        if weights.flight_weights.get("degree_level_down") == 0:
-            if departure_degree <= low_threshold and \
-                    arrival_degree >= high_threshold:
-                return 0, weights.flight_weights.get("degree_level_up")
-            else:
-                return 0, weights.flight_weights.get("degree_level_up") / threshold_not_met_relief_factor
-        else:
-            if departure_degree <= low_threshold and \
-                    arrival_degree >= high_threshold:
-                return min(1.0, custom_sigmoid(degree_diff, 4.32, 0.67, 15, False)) * \
-                       min(1.0, custom_sigmoid(ratio, 1.68, 0.497, 4, False)), \
-                       weights.flight_weights.get("degree_level_down")
-            else:
-                return 0, weights.flight_weights.get("degree_level_down") / threshold_not_met_relief_factor
+    up = degree_diff > 0
+    # Looking at a step down from the arrival city's side turns it into a step up
+    low = np.where(up, departure_degree, arrival_degree)
+    high = np.where(up, arrival_degree, departure_degree)
+    threshold_met = (low <= low_threshold) & (high >= high_threshold)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(up, high / low, low / high)
+    transition_rating = np.minimum(1.0, SIGMOIDS["degree_difference"](np.abs(degree_diff))) * \
+        np.minimum(1.0, SIGMOIDS["degree_ratio"](ratio))
+
+    # The weight of the step direction, or the other direction's weight if the step's own weight is not set
+    direction_weight = np.where(up, level_up, level_down)
+    other_weight = np.where(up, level_down, level_up)
+    used_weight = np.where(direction_weight == 0, other_weight, direction_weight)
+
+    rated = np.where(threshold_met & (direction_weight != 0), transition_rating, 0)
+    weight = np.where(threshold_met, used_weight, used_weight / threshold_not_met_relief_factor)
+    weight = np.where(degree_diff == 0, max(level_up, level_down), weight)
+    return np.where(degree_diff == 0, 0, rated), weight
 
 
 def rate_flight(departure_city: str, arrival_city: str, weights: Weights) -> float:
-    departure_city_obj = Destination(departure_city, username=weights.username, template_name=weights.template_name)
-    arrival_city_obj = Destination(arrival_city, username=weights.username, template_name=weights.template_name)
-
-    rating = 0
-    total_weight_sum = 0
-
-    def check_and_restrict(condition):
-        if condition:
-            weights.add_dynamic_route_restriction([departure_city, arrival_city])
-        return
+    """
+    Rates a single flight with rate_flights.
+
+    :param departure_city: The departure city of the flight.
+    :param arrival_city: The arrival city of the flight.
+    :param weights: The weights of the profile.
+    :return: The rating of the flight.
+    """
+    return float(rate_flights([(departure_city, arrival_city)], weights)[0])
+
+
+def rate_flights(flights: list, weights: Weights) -> np.ndarray:
+    """
+    Rates all given (departure, arrival) flights in one pass over arrays of the cities' attributes and adds a dynamic
+    restriction for every flight excluded by a hard switch.
+
+    :param flights: The flights as (departure city, arrival city) pairs.
+    :param weights: The weights of the profile.
+    :return: The ratings in the order of flights.
+    """
+    destinations = {}
+    for flight in flights:
+        for city in flight:
+            if city not in destinations:
+                destinations[city] = get_destination(city, username=weights.username,
+                                                     template_name=weights.template_name)
+    departures = [destinations[departure] for departure, _ in flights]
+    arrivals = [destinations[arrival] for _, arrival in flights]
+
+    departure_eu = np.array([city.get_country_eu_member() for city in departures], dtype=bool)
+    arrival_eu = np.array([city.get_country_eu_member() for city in arrivals], dtype=bool)
+    departure_degree = np.array([city.get_degree() for city in departures], dtype=np.float64)
+    arrival_degree = np.array([city.get_degree() for city in arrivals], dtype=np.float64)
+    airport_rating = np.array([city.get_airport_rating() for city in arrivals], dtype=np.float64)
+    geodata = get_geodata()
+    distance = np.array([geodata.table_distance(departure, arrival) for departure, arrival in flights])
 
     # Check Hard Switches
+    restricted = np.zeros(len(flights), dtype=bool)
     if weights.flight_hard_switch.get("only_eu261") == 1:
-        check_and_restrict(not arrival_city_obj.get_country_eu_member())
+        restricted |= ~arrival_eu
     elif weights.flight_hard_switch.get("only_eu261") == 0:
-        check_and_restrict(arrival_city_obj.get_country_eu_member())
-
+        restricted |= arrival_eu
     if weights.flight_hard_switch.get("only_level_up") == 1:
-        check_and_restrict(departure_city_obj.get_degree() >= arrival_city_obj.get_degree())
+        restricted |= departure_degree >= arrival_degree
     elif weights.flight_hard_switch.get("only_level_up") == 0:
-        check_and_restrict(not (departure_city_obj.get_degree() >= arrival_city_obj.get_degree()))
-
-    # High/Low Distance
-    distance = departure_city_obj.get_distance_to(arrival_city_obj.city)
-    if weights.flight_weights.get("high_distance") != 0 or weights.flight_weights.get("low_distance") != 0:
-        if weights.flight_weights.get("high_distance") != 0:
-            rating += weights.flight_weights.get("high_distance") * (
-                    1 - custom_sigmoid(distance, 840, 700, 170, True))
-        else:
-            rating += weights.flight_weights.get("low_distance") * custom_sigmoid(distance, 840, 700, 170, True)
-        total_weight_sum += max(weights.flight_weights.get("high_distance"), weights.flight_weights.get("low_distance"))
-
-    # EU 261 / No EU 261
-    if weights.flight_weights.get("eu_261") != 0 or weights.flight_weights.get("no_eu_261") != 0:
-        if weights.flight_weights.get("eu_261") != 0:
-            rating += weights.flight_weights.get("eu_261") * (
-                    arrival_city_obj.get_country_eu_member() or departure_city_obj.get_country_eu_member())
-        else:
-            rating += weights.flight_weights.get("no_eu_261") * (
-                not (arrival_city_obj.get_country_eu_member() or departure_city_obj.get_country_eu_member()))
-        total_weight_sum += max(weights.flight_weights.get("eu_261"), weights.flight_weights.get("no_eu_261"))
-
-    # High/Low Airport Rating
-    airport_rating = arrival_city_obj.get_airport_rating()
-    if weights.flight_weights.get("high_airport_rating") != 0 or weights.flight_weights.get("low_airport_rating") != 0:
-        if weights.flight_weights.get("high_airport_rating") != 0:
-            rating += weights.flight_weights.get("high_airport_rating") * airport_rating / 10
-        else:
-            rating += weights.flight_weights.get("low_airport_rating") * (10 - airport_rating) / 10
-        total_weight_sum += max(weights.flight_weights.get("high_airport_rating"),
-                                weights.flight_weights.get("low_airport_rating"))
-
-    rated, weight = rate_degree_transition(departure_city_obj.get_degree(), arrival_city_obj.get_degree(), 4, 9, weights)
+        restricted |= ~(departure_degree >= arrival_degree)
+    for i in np.flatnonzero(restricted):
+        weights.add_dynamic_route_restriction(list(flights[i]))
+
+    rating = np.zeros(len(flights))
+    total_weight_sum = np.zeros(len(flights))
+    distance_rating = SIGMOIDS["flight_distance"](distance)
+    eu_261 = arrival_eu | departure_eu
+    for pro, con, pro_result, con_result in (
+            ("high_distance", "low_distance", 1 - distance_rating, distance_rating),
+            ("eu_261", "no_eu_261", eu_261, ~eu_261),
+            ("high_airport_rating", "low_airport_rating", airport_rating / 10, (10 - airport_rating) / 10)):
+        rated, weight = evaluate_max_weighting(weights.flight_weights.get(pro), weights.flight_weights.get(con),
+                                               pro_result, con_result)
+        rating += rated
+        total_weight_sum += weight
+
+    rated, weight = rate_degree_transitions(departure_degree, arrival_degree, 4, 9, weights)
     rating += rated * weight
     total_weight_sum += weight
 
-    # Normalize and return the final rating
-    if total_weight_sum == 0:
-        return 0
-    else:
-        rating = (rating / total_weight_sum) * 100
-        return round(rating, 5)
+    # Normalize the final ratings
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total_weight_sum == 0, 0, np.round(rating / total_weight_sum * 100, 5))
 
 
 if __name__ == '__main__':
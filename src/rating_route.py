@@ -1,13 +1,24 @@
 from src.weights import Weights
-from src.essentials import custom_sigmoid, calculate_distance_cities, evaluate_weighting
-from src.precompute import retrieve_precomputed_data
-from numpy import mean, std
+from src.essentials import SIGMOIDS, SigmoidCurve, evaluate_weighting_array
+from src.precompute import get_precomputed_ratings, PrecomputedRatings
+from src.graph_core import get_csr_graph, pack_routes, row_sums
+from src.geodata import get_geodata
+import numpy as np
+
+
+def airport_proximity_curve(radius: float) -> SigmoidCurve:
+    """
+    The curve rating the distance between a route's first/last airport and the intended start/end city, which
+    widens with the search radius.
+    """
+    return SigmoidCurve(1 + radius / 1.42, 1 + radius / 12, 0, True)
 
 
 def rating_route(route: list, weights: Weights, original_start: str = "", original_end: str = "",
-                 radius_start: float = 0, radius_end: float = 0):
+                 radius_start: float = 0, radius_end: float = 0, precomputed: PrecomputedRatings = None):
     """
-    Calculates the rating of an entire route based on various criteria.
+    Calculates the rating of an entire route based on various criteria, as a batch of one route for
+    rating_routes_batch.
 
     Args:
         route (list): A list of cities representing the route.
@@ -16,6 +27,7 @@ def rating_route(route: list, weights: Weights, original_start: str = "", origin
         radius_start (float): Radius around the start city to search for airports.
         radius_end (float): Radius around the destination city to search for airports.
         weights (Weights): The weights object containing user preferences.
+        precomputed (PrecomputedRatings, optional): Already loaded precomputed ratings of the weights' profile.
     Returns:
         float: The calculated rating of the route.
     """
@@ -27,97 +39,140 @@ def rating_route(route: list, weights: Weights, original_start: str = "", origin
         original_end = route[-1]
     if not weights:
         weights = Weights()
-    if not weights:
-        weights = Weights()
-    precomputed_data = retrieve_precomputed_data(weights.username, weights.template_name)
 
-    city_ratings_data = precomputed_data.get('city', {})
-    route_ratings_data = precomputed_data.get('routes', {})
+    graph = get_csr_graph()
+    routes, lengths = pack_routes([graph.ids_of(route)])
+    return float(rating_routes_batch(routes, lengths, weights, original_start, original_end, radius_start, radius_end,
+                                     precomputed)[0])
 
-    rating = 0
-    total_weight_sum = 0
 
-    # Calculate Route Distance Rating
-    direct_distance = calculate_distance_cities(original_start, original_end)
-    total_distance = sum([calculate_distance_cities(route[i], route[i + 1]) for i in range(len(route) - 1)])
+def _masked_mean_std(values: np.ndarray, mask: np.ndarray, counts: np.ndarray):
+    values = np.where(mask, values, 0.0)
+    means = row_sums(values) / counts
+    deviations = np.where(mask, values - means[:, None], 0.0)
+    return means, np.sqrt(row_sums(deviations ** 2) / counts)
+
 
-    distance_ratio = direct_distance / total_distance
-    distance_ratio = custom_sigmoid(distance_ratio * 100, 76.6, 8.4, 100, False)
+def rating_routes_batch(routes: np.ndarray, lengths: np.ndarray, weights: Weights, original_start: str,
+                        original_end: str, radius_start: float = 0, radius_end: float = 0,
+                        precomputed: PrecomputedRatings = None) -> np.ndarray:
+    """
+    Calculates the rating of every route of a batch at once based on various criteria.
 
-    a, b = evaluate_weighting(weights.route_weights.get("high_route_distance"),
-                              weights.route_weights.get("low_route_distance"), distance_ratio, 1 - distance_ratio)
+    Args:
+        routes (np.ndarray): The routes as an (R, H) array of city IDs padded with -1 (see graph_core.pack_routes).
+        lengths (np.ndarray): The number of cities of every route.
+        weights (Weights): The weights object containing user preferences.
+        original_start (str): The originally intended starting city.
+        original_end (str): The originally intended arrival city.
+        radius_start (float): Radius around the start city to search for airports.
+        radius_end (float): Radius around the destination city to search for airports.
+        precomputed (PrecomputedRatings, optional): Already loaded precomputed ratings of the weights' profile.
+    Returns:
+        np.ndarray: The rating of every route.
+    """
+    if precomputed is None:
+        precomputed = get_precomputed_ratings(weights.username, weights.template_name)
+    geodata = get_geodata()
+    edge_matrix = get_csr_graph().edge_matrix()
+
+    routes = np.asarray(routes)
+    lengths = np.asarray(lengths)
+    ratings = np.zeros(len(routes))
+    valid = lengths >= 2
+    if not valid.any():
+        return ratings
+    routes, lengths = routes[valid], lengths[valid]
+
+    columns = np.arange(routes.shape[1])
+    city_mask = columns[None, :] < lengths[:, None]
+    flight_mask = city_mask[:, 1:]
+    cities = np.where(city_mask, routes, 0)
+    departures, arrivals = cities[:, :-1], cities[:, 1:]
+
+    rating = np.zeros(len(routes))
+    total_weight_sum = 0
+
+    # Calculate Route Distance Rating
+    direct_distance = geodata.distance(original_start, original_end)
+    flight_distances = np.round(geodata.distances[departures, arrivals].astype(np.float64), 1)
+    total_distance = row_sums(np.where(flight_mask, flight_distances, 0.0))
+
+    distance_ratio = SIGMOIDS["route_distance_ratio"](direct_distance / total_distance * 100)
+    a, b = evaluate_weighting_array(weights.route_weights.get("high_route_distance"),
+                                    weights.route_weights.get("low_route_distance"),
+                                    distance_ratio, 1 - distance_ratio)
     rating += a
     total_weight_sum += b
 
     # Calculate City Ratings and Stability
-    city_ratings = [city_ratings_data.get(city, 0) for city in route]
+    city_mean, city_std = _masked_mean_std(precomputed.city[cities], city_mask, lengths)
+    average_city_rating = np.where(city_mean > 5, SIGMOIDS["average_rating"](city_mean), 0)
+    stddev_city_rating = 1 - np.where(city_std > 4, SIGMOIDS["rating_stddev"](city_std), 0)
 
-    average_city_rating = custom_sigmoid(mean(city_ratings), 53.3, 11.98, 100, False) if mean(city_ratings) > 5 else 0
-    stddev_city_rating = 1 - (custom_sigmoid(std(city_ratings), 19.5, 3.85, 50, False) if std(city_ratings) > 4 else 0)
-
-    a, b = evaluate_weighting(weights.route_weights.get("high_rated_cities"),
-                              weights.route_weights.get("low_rated_cities"),
-                              average_city_rating, 1 - average_city_rating)
+    a, b = evaluate_weighting_array(weights.route_weights.get("high_rated_cities"),
+                                    weights.route_weights.get("low_rated_cities"),
+                                    average_city_rating, 1 - average_city_rating)
     rating += a
     total_weight_sum += b
 
-    a, b = evaluate_weighting(weights.route_weights.get("high_city_rating_stability"),
-                              weights.route_weights.get("low_city_rating_stability"),
-                              stddev_city_rating, 1 - stddev_city_rating)
+    a, b = evaluate_weighting_array(weights.route_weights.get("high_city_rating_stability"),
+                                    weights.route_weights.get("low_city_rating_stability"),
+                                    stddev_city_rating, 1 - stddev_city_rating)
     rating += a
     total_weight_sum += b
 
     # Calculate Flight Ratings
-    flight_ratings = []
-    for i in range(len(route) - 1):
-        city_a = route[i]
-        city_b = route[i + 1]
-        flight_rating = route_ratings_data.get(city_a, {}).get(city_b, 0)
-        flight_ratings.append(flight_rating)
-
-    average_flight_rating = custom_sigmoid(mean(flight_ratings), 53.3, 11.98, 100, False) if mean(flight_ratings) > 5 else 0
-    stddev_flight_rating = 1 - (custom_sigmoid(std(flight_ratings), 19.5, 3.85, 50, False) if std(flight_ratings) > 4 else 0)
-
-    a, b = evaluate_weighting(weights.route_weights.get("high_rated_flights"),
-                              weights.route_weights.get("low_rated_flights"),
-                              average_flight_rating, 1 - average_flight_rating)
+    edge_ids = edge_matrix[departures, arrivals]
+    flight_ratings = np.where(edge_ids >= 0, precomputed.flight[edge_ids], 0.0)
+    flight_mean, flight_std = _masked_mean_std(flight_ratings, flight_mask, lengths - 1)
+    average_flight_rating = np.where(flight_mean > 5, SIGMOIDS["average_rating"](flight_mean), 0)
+    stddev_flight_rating = 1 - np.where(flight_std > 4, SIGMOIDS["rating_stddev"](flight_std), 0)
+
+    a, b = evaluate_weighting_array(weights.route_weights.get("high_rated_flights"),
+                                    weights.route_weights.get("low_rated_flights"),
+                                    average_flight_rating, 1 - average_flight_rating)
     rating += a
     total_weight_sum += b
 
-    a, b = evaluate_weighting(weights.route_weights.get("high_flight_rating_stability"),
-                              weights.route_weights.get("low_flight_rating_stability"),
-                              stddev_flight_rating, 1 - stddev_flight_rating)
+    a, b = evaluate_weighting_array(weights.route_weights.get("high_flight_rating_stability"),
+                                    weights.route_weights.get("low_flight_rating_stability"),
+                                    stddev_flight_rating, 1 - stddev_flight_rating)
     rating += a
     total_weight_sum += b
 
-    # Adjust Rating Based on Proximity to Start and End Airports
-    start_distance = calculate_distance_cities(route[0], original_start)
-    start_distance_score = custom_sigmoid(start_distance, 1 + radius_start / 1.42, 1 + radius_start / 12, 0, True)
-
-    end_distance = calculate_distance_cities(route[-1], original_end)
-    end_distance_score = custom_sigmoid(end_distance, 1 + radius_end / 1.42, 1 + radius_end / 12, 0, True)
-
-    a, b = evaluate_weighting(weights.route_weights.get("near_start_airport"),
-                              weights.route_weights.get("far_start_airport"),
-                              start_distance_score, 1 - start_distance_score)
+    # Adjust Rating Based on Proximity to Start and End Airports (few distinct airports, so look them up one by one)
+    first_cities = cities[:, 0]
+    last_cities = cities[np.arange(len(cities)), lengths - 1]
+    start_distance = _distances_to(geodata, first_cities, original_start)
+    end_distance = _distances_to(geodata, last_cities, original_end)
+    start_distance_score = airport_proximity_curve(radius_start)(start_distance)
+    end_distance_score = airport_proximity_curve(radius_end)(end_distance)
+
+    a, b = evaluate_weighting_array(weights.route_weights.get("near_start_airport"),
+                                    weights.route_weights.get("far_start_airport"),
+                                    start_distance_score, 1 - start_distance_score)
     rating += a
     total_weight_sum += b
 
-    a, b = evaluate_weighting(weights.route_weights.get("near_end_airport"),
-                              weights.route_weights.get("far_end_airport"),
-                              end_distance_score, 1 - end_distance_score)
+    a, b = evaluate_weighting_array(weights.route_weights.get("near_end_airport"),
+                                    weights.route_weights.get("far_end_airport"),
+                                    end_distance_score, 1 - end_distance_score)
     rating += a
     total_weight_sum += b
 
-    if total_weight_sum == 0:
-        return 0
-    else:
-        rating = (rating / total_weight_sum) * 100
-        return round(rating, 5)
+    if total_weight_sum != 0:
+        ratings[valid] = np.round((rating / total_weight_sum) * 100, 5)
+    return ratings
+
+
+def _distances_to(geodata, city_ids: np.ndarray, city: str) -> np.ndarray:
+    unique_ids, inverse = np.unique(city_ids, return_inverse=True)
+    distances = np.array([geodata.distance(geodata.names[i], city) for i in unique_ids])
+    return distances[inverse]
 
 
 if __name__ == '__main__':
-    prec = retrieve_precomputed_data("tomsontomno", "template_test")
     w = Weights("tomsontomno", "template_test")
 
     print(rating_route(["Cologne", "Skopje", "Abu Dhabi", "Male"], w, "Cologne", "Male", 120, 0))
@@ -1,70 +1,91 @@
-import threading
+import heapq
+import itertools
+import os
 import time
 import concurrent.futures
-from src.graph_algos import get_all_routes
-from src.essentials import get_Graph, calculate_distance_route, evaluate_weighting, custom_sigmoid
-from src.rating_route import rating_route
+import numpy as np
+from src.worker_pool import get_worker_pool, chunked
+from src.precompute import get_precomputed_ratings
+from src.graph_algos import get_allowed_route_set
+from src.essentials import get_Graph, evaluate_weighting_array, SIGMOIDS
+from src.rating_route import rating_routes_batch
+from src.graph_core import get_csr_graph
+from src.geodata import get_geodata
 from src.weights import Weights
+from src.restrictions import RestrictionIndex
+from src.route_cache import RouteSet
+from src.route_results import RouteResults
+from src.tasks import get_task_registry
+from src.result_cache import get_result_cache, query_key, input_fingerprint
 
 G = get_Graph()
-task_progress = {}
-response = {}
+# Number of rating bins in the summary of the routes not returned by a top-K query
+HISTOGRAM_BINS = 10
+# Number of packed chunks of routes handed to the worker pool at a time
+MAX_PENDING_CHUNKS = 4 * (os.cpu_count() or 1)
+# Number of routes packed at a time to sum up their distances
+DISTANCE_CHUNK_SIZE = 65536
+# The profile (user and template) whose settings rate the routes
+DEFAULT_PROFILE = "default"
+DEFAULT_TEMPLATE = "default"
+tasks = get_task_registry()
+result_cache = get_result_cache()
 
 
 def get_results(task_id):
-    with threading.Lock():
-        return response[task_id]
+    """
+    Returns the RouteResults of a finished task, or None if there are none.
+    """
+    state = tasks.get(task_id)
+    return state["result"] if state else None
 
 
 def get_progress_rating(task_id):
-    with threading.Lock():
-        if task_id not in task_progress:
-            return None  # for the case that "Task not found"
-        return round(100 * task_progress[task_id][0] / task_progress[task_id][1], 3)
+    state = tasks.get(task_id)
+    if state is None:
+        return None  # for the case that "Task not found"
+    return state["progress"]
 
 
 def update_task_progress(task_id, progress_increment):
-    with threading.Lock():
-        task_progress[task_id][0] += progress_increment
+    tasks.add_progress(task_id, progress_increment)
 
 
 def set_task_total(task_id, total):
-    with threading.Lock():
-        task_progress[task_id][1] = total
+    tasks.set_total(task_id, total)
 
 
 def reset_task_total(task_id):
-    with threading.Lock():
-        task_progress[task_id] = [0, 0]
+    tasks.reset_progress(task_id)
 
 
 def set_finished(task_id):
-    with threading.Lock():
-        task_progress[task_id] = [1, 1]
+    tasks.set_total(task_id, 1)
+    tasks.add_progress(task_id, 1)
 
 
 def abort(task_id):
-    with threading.Lock():
-        if task_id in task_progress:
-            task_progress[task_id][1] = -2  # Mark task as aborted
+    return tasks.abort(task_id)
 
 
 def check_aborted(task_id):
-    with threading.Lock():
-        if task_progress[task_id][1] == -2:
-            return True
-        return False
+    return tasks.is_aborted(task_id)
 
 
-def calculate_rating(route, original_start, original_end, radius_start, radius_end, weights):
-    return tuple(route), \
-           rating_route(route, weights, original_start, original_end, radius_start, radius_end)
+def calculate_ratings(routes, lengths, original_start, original_end, radius_start, radius_end, weights):
+    """
+    Rates a batch of packed routes (see graph_core.pack_routes) inside a worker process, reusing the worker's cached
+    precomputed ratings.
+    """
+    precomputed = get_precomputed_ratings(weights.username, weights.template_name)
+    return rating_routes_batch(routes, lengths, weights, original_start, original_end, radius_start, radius_end,
+                               precomputed)
 
 
 def get_valid_routes(routes, forbidden_cities, forbidden_routes):
     """
     Checks which of the given routes are restricted based on city and route restrictions.
-    The function checks if any part of the given route matches the forbidden routes or cities.
+    A route is restricted if it contains a forbidden city or any forbidden route as consecutive cities.
 
     Args:
         routes (list): A list representing the routes, each represented by a list of their cities.
@@ -74,35 +95,264 @@ def get_valid_routes(routes, forbidden_cities, forbidden_routes):
     Returns:
         list: A list of all valid routes, that are not restricted.
     """
-    valid_routes_city = []
-    valid_routes_total = []
+    graph = get_csr_graph()
+    restrictions = RestrictionIndex(forbidden_cities, forbidden_routes, graph)
+    if not restrictions:
+        return list(routes)
+    return [route for route in routes if restrictions.allows_route(graph.ids_of(route))]
 
-    allowed = True
-    for route in routes:
-        for city in forbidden_cities:
-            if city in route:
-                allowed = False
-                break
-        if allowed:
-            valid_routes_city.append(route)
-        else:
-            allowed = True
-
-    for route in valid_routes_city:
-        for i in range(len(route)):
-            for j in range(i + 1, len(route) + 1):
-                sub_route = route[i:j]
-                if sub_route in forbidden_routes:
-                    allowed = False
-                    break
-            if not allowed:
+
+def routes_normalisation(hops: np.ndarray, distances: np.ndarray) -> tuple:
+    """
+    The ranking compares every route's number of flights and overall distance to the span over all valid routes.
+
+    Returns:
+        tuple: The minimum number of flights, its span, the minimum distance and its span (spans of 0 become inf).
+    """
+    min_flights = hops.min()
+    span_flights = hops.max() - min_flights
+    if span_flights == 0:
+        span_flights = float("inf")
+    min_distance = distances.min()
+    span_routes = distances.max() - min_distance
+    if span_routes == 0:
+        span_routes = float("inf")
+    return min_flights, span_flights, min_distance, span_routes
+
+
+def score_routes(ratings: np.ndarray, hops: np.ndarray, distances: np.ndarray, weights: Weights,
+                 normalisation: tuple):
+    """
+    Combines the route ratings with the number of flights and the overall distance of every route according to
+    the routes weights, in one pass over the arrays.
+
+    Args:
+        ratings (np.ndarray): The rating_route rating of every route.
+        hops (np.ndarray): The number of flights of every route.
+        distances (np.ndarray): The overall distance of every route in kilometers.
+        weights (Weights): The weights object containing user preferences.
+        normalisation (tuple): The routes_normalisation of all valid routes.
+
+    Returns:
+        tuple: A mask of the routes kept by the hard switches and the final rating of every route.
+    """
+    min_flights, span_flights, min_distance, span_routes = normalisation
+
+    # hard switch
+    keep = np.ones(len(hops), dtype=bool)
+    if weights.routes_hard_switch.get("only_minimum_flights") == 1:
+        keep = hops == min_flights
+    elif weights.routes_hard_switch.get("only_minimum_flights") == 0:
+        keep = hops != min_flights
+
+    route_rating = np.where(hops == min_flights, weights.routes_weights.get("minimum_flights"), 0)
+    total_weight_sum = weights.routes_weights.get("minimum_flights")
+
+    # Adding the previously calculated route rating
+    a, b = evaluate_weighting_array(weights.routes_weights.get("high_route_rating"),
+                                    weights.routes_weights.get("low_route_rating"),
+                                    ratings / 100, (100 - ratings) / 100)
+    route_rating = route_rating + a
+    total_weight_sum += b
+
+    # Flights amount
+    flights_score = SIGMOIDS["relative_span"]((hops - min_flights) / span_flights)
+    a, b = evaluate_weighting_array(weights.routes_weights.get("less_flights"),
+                                    weights.routes_weights.get("more_flights"),
+                                    flights_score, 1 - flights_score)
+    route_rating = route_rating + a
+    total_weight_sum += b
+
+    # Overall distance
+    distance_score = SIGMOIDS["relative_span"]((distances - min_distance) / span_routes)
+    a, b = evaluate_weighting_array(weights.routes_weights.get("low_overall_distance"),
+                                    weights.routes_weights.get("high_overall_distance"),
+                                    distance_score, 1 - distance_score)
+    route_rating = route_rating + a
+    total_weight_sum += b
+
+    if total_weight_sum == 0:
+        return keep, np.zeros(len(hops))
+    return keep, np.round(route_rating / total_weight_sum, 3)
+
+
+def rank_routes(ratings: np.ndarray, hops: np.ndarray, distances: np.ndarray, weights: Weights):
+    """
+    Final ranking stage: scores all routes (see score_routes) and orders them.
+
+    Returns:
+        tuple: The indices of the routes kept by the hard switches, best first, and the final rating of every route.
+    """
+    keep, final_ratings = score_routes(ratings, hops, distances, weights, routes_normalisation(hops, distances))
+    kept = np.flatnonzero(keep)
+    return kept[np.argsort(-final_ratings[kept], kind='stable')], final_ratings
+
+
+def _start_rating(route_set: RouteSet, task_id: str) -> bool:
+    """
+    Starts the progress of a task over the routes of route_set. The routes are not filtered again, they have to be
+    allowed by the restrictions already (see get_allowed_route_set and get_valid_routes).
+
+    Returns:
+        bool: False if there are no routes to rate.
+    """
+    reset_task_total(task_id)
+    if not len(route_set):
+        print("No valid routes available based on the restrictions.")
+        set_finished(task_id)
+        return False
+    set_task_total(task_id, len(route_set))
+    return True
+
+
+def _route_set_of(routes: list) -> RouteSet:
+    graph = get_csr_graph()
+    return RouteSet.from_routes([graph.ids_of(route) for route in routes], len(graph))
+
+
+def _iter_route_ratings(route_set: RouteSet, start: str, radius_start: float, end: str, radius_end: float,
+                        task_id: str, weights: Weights):
+    """
+    Rates the routes in chunks on the worker pool and yields (row indices, ratings) of every chunk as soon as it is
+    done. Every chunk is packed straight from the route set (see RouteSet.pack) only when it is handed to the pool,
+    and at most MAX_PENDING_CHUNKS are handed over at a time, so the packed routes never exist for all routes at
+    once. Stops early, cancelling the remaining chunks, when the task is aborted.
+    """
+    executor = get_worker_pool()
+    chunks = iter(chunked(np.arange(len(route_set))))
+    future_to_rows = {}
+
+    def submit(count):
+        for rows in itertools.islice(chunks, count):
+            future = executor.submit(calculate_ratings, *route_set.pack(rows), start, end, radius_start, radius_end,
+                                     weights)
+            future_to_rows[future] = rows
+
+    submit(MAX_PENDING_CHUNKS)
+    while future_to_rows:
+        done, _ = concurrent.futures.wait(future_to_rows, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            rows = future_to_rows.pop(future)
+            yield rows, future.result()
+            update_task_progress(task_id, len(rows))
+            if check_aborted(task_id):  # Check for abort signal
+                print("ABORT REQUEST RECEIVED")
+                for future_x in future_to_rows:
+                    future_x.cancel()  # Cancel all remaining tasks
+                return
+        submit(len(done))
+
+
+def _route_distances(route_set: RouteSet) -> np.ndarray:
+    """
+    The overall distance of every route, packing DISTANCE_CHUNK_SIZE routes at a time.
+    """
+    geodata = get_geodata()
+    distances = np.zeros(len(route_set))
+    for rows in chunked(np.arange(len(route_set)), DISTANCE_CHUNK_SIZE):
+        distances[rows] = geodata.route_distances(*route_set.pack(rows))
+    return distances
+
+
+def rank_route_set(route_set: RouteSet, start: str, radius_start: float, end: str, radius_end: float, task_id: str,
+                   weights: Weights):
+    """
+    Rates and ranks all routes of a route set (see rate_all_routes) without translating them to city names.
+
+    Args:
+        route_set (RouteSet): The routes allowed by the restrictions.
+        start (str): The originally intended starting city.
+        radius_start (float): Radius around the start city to search for airports.
+        end (str): The originally intended arrival city.
+        radius_end (float): Radius around the destination city to search for airports.
+        task_id (str): The ID of the current task to track progress.
+        weights (Weights): The weights object containing user preferences.
+
+    Returns:
+        tuple: The indices of the ranked routes in route_set, best first, their final ratings and their overall
+            distances (all empty if the task was aborted), or None if there are no routes.
+    """
+    if not _start_rating(route_set, task_id):
+        return None
+
+    ratings = np.zeros(len(route_set))
+    for rows, chunk_ratings in _iter_route_ratings(route_set, start, radius_start, end, radius_end, task_id,
+                                                   weights):
+        ratings[rows] = chunk_ratings
+    if check_aborted(task_id):
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+    print("ALL RATED")
+    distances = _route_distances(route_set)
+    order, final_ratings = rank_routes(ratings, route_set.lengths() - 1, distances, weights)
+    return order, final_ratings[order], distances[order]
+
+
+def top_route_set(route_set: RouteSet, start: str, radius_start: float, end: str, radius_end: float, task_id: str,
+                  top_k: int, weights: Weights):
+    """
+    Rates the routes of a route set and keeps the best top_k of them (see rate_top_routes) without translating them
+    to city names. Apart from the route set, only the number of flights and the overall distance are held for every
+    route, since their span over all routes normalises the scores (see routes_normalisation).
+
+    Args:
+        route_set (RouteSet): The routes allowed by the restrictions.
+        start (str): The originally intended starting city.
+        radius_start (float): Radius around the start city to search for airports.
+        end (str): The originally intended arrival city.
+        radius_end (float): Radius around the destination city to search for airports.
+        task_id (str): The ID of the current task to track progress.
+        top_k (int): The number of routes to return.
+        weights (Weights): The weights object containing user preferences.
+
+    Returns:
+        tuple: The indices of the best routes in route_set, best first, their final ratings and their overall
+            distances (all empty if the task was aborted), or None if there are no routes, and the summary of the
+            remaining routes (see rate_top_routes).
+
+    Raises:
+        ValueError: If top_k is smaller than 1.
+    """
+    if top_k < 1:
+        raise ValueError(f"top_k must be at least 1, not {top_k}.")
+    summary = {"count": 0, "histogram": [0] * HISTOGRAM_BINS}
+    if not _start_rating(route_set, task_id):
+        return None, summary
+
+    hops = route_set.lengths() - 1
+    distances = _route_distances(route_set)
+    normalisation = routes_normalisation(hops, distances)
+
+    # Min-heap of (rating, -row): the root is the worst kept route, among equal ratings the latest one
+    heap = []
+    histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    count = 0
+    for rows, chunk_ratings in _iter_route_ratings(route_set, start, radius_start, end, radius_end, task_id,
+                                                   weights):
+        keep, final_ratings = score_routes(chunk_ratings, hops[rows], distances[rows], weights, normalisation)
+        rows, final_ratings = rows[keep], final_ratings[keep]
+        count += len(rows)
+        histogram += _rating_histogram(final_ratings)
+
+        # Only the chunk's own best top_k can make it into the heap
+        best = np.lexsort((rows, -final_ratings))[:top_k]
+        for rating, row in zip(final_ratings[best].tolist(), rows[best].tolist()):
+            if len(heap) < top_k:
+                heapq.heappush(heap, (rating, -row))
+            elif (rating, -row) > heap[0]:
+                heapq.heapreplace(heap, (rating, -row))
+            else:
                 break
-        if allowed:
-            valid_routes_total.append(route)
-        else:
-            allowed = True
+    if check_aborted(task_id):
+        return (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)), summary
 
-    return valid_routes_total
+    print("ALL RATED")
+    top = sorted(heap, reverse=True)
+    top_rows = np.array([-row for _, row in top], dtype=np.int64)
+    top_ratings = np.array([rating for rating, _ in top])
+    summary["count"] = count - len(top)
+    summary["histogram"] = (histogram - _rating_histogram(top_ratings)).tolist()
+    return (top_rows, top_ratings, distances[top_rows]), summary
 
 
 def rate_all_routes(routes: list, start: str, radius_start: float, end: str, radius_end: float, task_id: str,
@@ -112,7 +362,7 @@ def rate_all_routes(routes: list, start: str, radius_start: float, end: str, rad
     updated rating.
 
     Args:
-        routes (list): A list of routes, where each route is a list of city names.
+        routes (list): The routes allowed by the restrictions (see get_valid_routes), each a list of city names.
         start (str): The originally intended starting city.
         radius_start (float): Radius around the start city to search for airports.
         end (str): The originally intended arrival city.
@@ -123,108 +373,116 @@ def rate_all_routes(routes: list, start: str, radius_start: float, end: str, rad
     if not weights:
         weights = Weights()
 
-    forbidden_cities = weights.get_all_city_restrictions()
-    forbidden_routes = weights.get_all_route_restrictions()
-    reset_task_total(task_id)
-    valid_routes = get_valid_routes(routes, forbidden_cities, forbidden_routes)
-
-    if not valid_routes:
-        print("No valid routes available based on the restrictions.")
-        set_finished(task_id)
+    route_set = _route_set_of(routes)
+    ranked = rank_route_set(route_set, start, radius_start, end, radius_end, task_id, weights)
+    if ranked is None:
         return [[[start, "IMPOSSIBLE", end], 0.0]]
-    set_task_total(task_id, len(valid_routes))
-    min_flights = min(len(route) - 1 for route in valid_routes)
-    max_flights = max(len(route) - 1 for route in valid_routes)
-    span_flights = max_flights - min_flights
-    if span_flights == 0:
-        span_flights = float("inf")
+    rows, final_ratings, _ = ranked
+    return [[routes[row], rating] for row, rating in zip(rows.tolist(), final_ratings.tolist())]
 
-    all_distances = [calculate_distance_route(route) for route in valid_routes]
-    min_distance = min(all_distances)
-    max_distance = max(all_distances)
-    span_routes = max_distance - min_distance
-    if span_routes == 0:
-        span_routes = float("inf")
 
-    ratings_dict = {}
+def rate_top_routes(routes: list, start: str, radius_start: float, end: str, radius_end: float, task_id: str,
+                    top_k: int, weights: Weights = None):
+    """
+    Like rate_all_routes, but only keeps the best top_k routes: every chunk is scored as soon as the workers return
+    it and merged into a heap of size top_k, the other routes are only counted in a rating histogram.
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        future_to_route = {
-            executor.submit(calculate_rating, route, start, end, radius_start, radius_end, weights): route
-            for route in valid_routes
-        }
+    Args:
+        routes (list): The routes allowed by the restrictions (see get_valid_routes), each a list of city names.
+        start (str): The originally intended starting city.
+        radius_start (float): Radius around the start city to search for airports.
+        end (str): The originally intended arrival city.
+        radius_end (float): Radius around the destination city to search for airports.
+        task_id (str): The ID of the current task to track progress.
+        top_k (int): The number of routes to return.
+        weights (Weights): The weights object containing user preferences.
 
-        for future in concurrent.futures.as_completed(future_to_route):
-            route_tuple, rating = future.result()
-            ratings_dict[route_tuple] = rating
-            update_task_progress(task_id, 1)
-            if check_aborted(task_id):  # Check for abort signal
-                print("ABORT REQUEST RECEIVED")
-                for future_x in future_to_route:
-                    future_x.cancel()  # Cancel all remaining tasks
-                break
+    Returns:
+        tuple: The best routes with their rating, best first (in the same order as rate_all_routes), and a summary of
+            the remaining routes: their count and the number of them per rating bin (HISTOGRAM_BINS bins over 0-1).
+    """
+    if not weights:
+        weights = Weights()
+
+    top, summary = top_route_set(_route_set_of(routes), start, radius_start, end, radius_end, task_id, top_k,
+                                 weights)
+    if top is None:
+        return [[[start, "IMPOSSIBLE", end], 0.0]], summary
+    rows, top_ratings, _ = top
+    return [[routes[row], rating] for row, rating in zip(rows.tolist(), top_ratings.tolist())], summary
+
+
+def _rating_histogram(ratings: np.ndarray) -> np.ndarray:
+    return np.histogram(np.clip(ratings, 0, 1), bins=HISTOGRAM_BINS, range=(0, 1))[0]
 
-    print("ALL RATED")
-    rerated_routes = []
-    for i, route in enumerate(valid_routes):
-        route_rating = 0
-        total_weight_sum = 0
-        num_flights = len(route) - 1
-
-        # hard switch
-        if weights.routes_hard_switch.get("only_minimum_flights") == 1 and num_flights != min_flights:
-            continue
-        if weights.routes_hard_switch.get("only_minimum_flights") == 0 and num_flights == min_flights:
-            continue
-
-        if num_flights == min_flights:
-            route_rating += weights.routes_weights.get("minimum_flights")
-        total_weight_sum += weights.routes_weights.get("minimum_flights")
-
-        # Adding the previously calculated route rating
-        rating = ratings_dict[tuple(route)]
-        a, b = evaluate_weighting(weights.routes_weights.get("high_route_rating"),
-                                  weights.routes_weights.get("low_route_rating"),
-                                  rating/100, (100 - rating)/100)
-        route_rating += a
-        total_weight_sum += b
-
-        # Flights amount
-        a, b = evaluate_weighting(weights.routes_weights.get("less_flights"),
-                                  weights.routes_weights.get("more_flights"),
-                                  custom_sigmoid((num_flights - min_flights) / span_flights, 0.42, 0.084, 0, True),
-                                  1 - custom_sigmoid((num_flights - min_flights) / span_flights, 0.42, 0.084, 0, True))
-        route_rating += a
-        total_weight_sum += b
-
-        # Adding the previously calculated route rating
-        a, b = evaluate_weighting(weights.routes_weights.get("low_overall_distance"),
-                                  weights.routes_weights.get("high_overall_distance"),
-                                  custom_sigmoid((calculate_distance_route(route) - min_distance) / span_routes, 0.42, 0.084, 0, True),
-                                  1 - custom_sigmoid((calculate_distance_route(route) - min_distance) / span_routes, 0.42, 0.084, 0, True))
-        route_rating += a
-        total_weight_sum += b
-
-        rerated_routes.append([route, round(route_rating / total_weight_sum, 3)])
-
-    return sorted(rerated_routes, key=lambda x: x[1], reverse=True)
-
-
-def rate_all(start, radius_start, end, radius_end, tolerance, task_id):
-    start_time = time.time()
-    routes = get_all_routes(start, radius_start, end, radius_end, tolerance)
-    ranked_routes = rate_all_routes(routes, start, radius_start, end, radius_end, task_id)
-    end_time = time.time()
 
-    output = f"\nTime taken to rank {len(routes)} routes: {end_time - start_time:.4f} seconds\n"
-    output += f"This equates to {len(routes) / (end_time - start_time):.4f} routes ranked per second.\n\n"
-    for i, route in enumerate(ranked_routes):
-        output += f"#{i + 1}\nRATING: {round(route[1] * 100, 2)}\nROUTE: {' -> '.join(route[0])}\n\n"
+def rate_all(start, radius_start, end, radius_end, tolerance, task_id, top_k=None, branch_and_bound=False):
+    """
+    Runs a whole search task and stores its RouteResults for get_results. Repeated searches are answered from the
+    result cache as long as the graph and the profile's settings and precomputed ratings are unchanged.
+
+    Args:
+        start (str): The originally intended starting city.
+        radius_start (float): Radius around the start city to search for airports.
+        end (str): The originally intended arrival city.
+        radius_end (float): Radius around the destination city to search for airports.
+        tolerance (int): Tolerance level for the routes.
+        task_id (str): The ID of the current task to track progress.
+        top_k (int, optional): Only keep the best top_k routes and a summary of the others.
+        branch_and_bound (bool, optional): Find the best top_k routes with route_search instead of rating every
+            route.
+    """
+    start_time = time.time()
+    # The search and the result cache key use the same city names
+    start, end = start.strip(), end.strip()
+    # Taken before the settings are read, so a change during the search makes its result stale right away
+    fingerprint = input_fingerprint(DEFAULT_PROFILE, DEFAULT_TEMPLATE)
+    weights = Weights(DEFAULT_PROFILE, DEFAULT_TEMPLATE)
+    key = query_key(start, radius_start, end, radius_end, tolerance, weights.username, weights.template_name,
+                    top_k, branch_and_bound)
+    cached = result_cache.get(key, fingerprint)
+    if cached is not None:
+        seconds = time.time() - start_time
+        tasks.ensure(task_id)
+        tasks.finish(task_id, cached.with_timing({**cached.timing, "seconds": round(seconds, 4),
+                                                      "routes_per_second": None, "cached": True}))
+        return
+
+    summary = None
+    if top_k and branch_and_bound:
+        # route_search builds on the scoring of this module
+        from src.route_search import search_top_routes
+        # The search has no meaningful total, the task only completes at the end
+        reset_task_total(task_id)
+        set_task_total(task_id, 1)
+        ranked_routes = search_top_routes(start, radius_start, end, radius_end, tolerance, top_k, weights,
+                                          lambda: check_aborted(task_id))
+        routes_ranked = None
+    else:
+        # The restrictions are applied once, to the cached unrestricted route set, so the rating does not filter again.
+        # The routes stay city IDs, only the pages a client asks for are translated to names (see RouteResults.page)
+        route_set = get_allowed_route_set(start, radius_start, end, radius_end, tolerance,
+                                          RestrictionIndex.from_weights(weights))
+        if top_k:
+            ranked, summary = top_route_set(route_set, start, radius_start, end, radius_end, task_id, top_k, weights)
+        else:
+            ranked = rank_route_set(route_set, start, radius_start, end, radius_end, task_id, weights)
+        ranked_routes = [[[start, "IMPOSSIBLE", end], 0.0]] if ranked is None else None
+        routes_ranked = len(route_set)
 
-    with threading.Lock():
-        response[task_id] = output
+    seconds = time.time() - start_time
+    timing = {"seconds": round(seconds, 4), "routes_ranked": routes_ranked,
+              "routes_per_second": round(routes_ranked / seconds, 4) if routes_ranked and seconds else None,
+              "cached": False}
+    if ranked_routes is None:
+        results = RouteResults.from_route_set(route_set, *ranked, timing, summary)
+    else:
+        results = RouteResults.from_ranked(ranked_routes, timing, summary)
+    # An aborted search has no complete result to reuse
+    if not check_aborted(task_id):
+        result_cache.put(key, fingerprint, results)
 
-    update_task_progress(task_id, 1000)  # Mark progress as complete
+    tasks.finish(task_id, results)
 
 
 if __name__ == '__main__':
@@ -234,6 +492,7 @@ if __name__ == '__main__':
     re = 0
 
     start_timer = time.time()
-    print(rate_all(s, rs, e, re, 0, "x"))
+    rate_all(s, rs, e, re, 0, "x")
+    print(get_results("x").page())
     end_timer = time.time()
     print(f"Time taken: {end_timer - start_timer:.4f} seconds\n")
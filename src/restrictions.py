@@ -0,0 +1,114 @@
+import numpy as np
+from src.graph_core import get_csr_graph
+
+
+class RestrictionIndex:
+    """
+    City and route restrictions compiled against the integer city IDs of the CSR graph.
+
+    Forbidden cities are held as a bitmask (bit i set: city i is forbidden), in the same form as the visited set of
+    the path search, so the search can exclude them for free. Forbidden routes are direction-sensitive sequences of
+    consecutive cities; they are stored as a set of ID tuples and grouped by their last city, so extending a path
+    only has to look at the sequences that end in the newly added city.
+    """
+
+    def __init__(self, forbidden_cities, forbidden_routes, graph=None):
+        if graph is None:
+            graph = get_csr_graph()
+        self.graph = graph
+
+        self.city_mask = 0
+        for city in forbidden_cities:
+            if city in graph:
+                self.city_mask |= 1 << graph.index[city]
+
+        self.sequences = set()
+        self.sequences_by_last = {}
+        for route in forbidden_routes:
+            # Routes through unknown cities can never match, a single city route is just a forbidden city
+            if not route or any(city not in graph for city in route):
+                continue
+            if len(route) == 1:
+                self.city_mask |= 1 << graph.index[route[0]]
+                continue
+            sequence = tuple(graph.ids_of(route))
+            if sequence not in self.sequences:
+                self.sequences.add(sequence)
+                self.sequences_by_last.setdefault(sequence[-1], []).append(sequence)
+
+    @classmethod
+    def from_weights(cls, weights, graph=None):
+        """
+        Compiles all (static and dynamic) restrictions of a profile.
+        """
+        return cls(weights.get_all_city_restrictions(), weights.get_all_route_restrictions(), graph)
+
+    def __bool__(self):
+        return bool(self.city_mask or self.sequences)
+
+    def allows_city(self, city: int) -> bool:
+        return not self.city_mask >> city & 1
+
+    def allows_step(self, path: list, city: int) -> bool:
+        """
+        Checks whether appending city to an allowed path keeps it allowed.
+
+        Args:
+            path (list): The city IDs of the path so far.
+            city (int): The ID of the next city.
+
+        Returns:
+            bool: False if the city is forbidden or a forbidden route would end in it.
+        """
+        if self.city_mask >> city & 1:
+            return False
+        for sequence in self.sequences_by_last.get(city, ()):
+            length = len(sequence) - 1
+            if length <= len(path) and tuple(path[len(path) - length:]) == sequence[:-1]:
+                return False
+        return True
+
+    def allows_route(self, route: list) -> bool:
+        """
+        Checks a whole route of city IDs against all restrictions.
+        """
+        for i, city in enumerate(route):
+            if not self.allows_step(route[:i], city):
+                return False
+        return True
+
+    def allows_routes(self, cities: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Batch version of allows_route for routes stored back to back.
+
+        Args:
+            cities (np.ndarray): The city IDs of all routes, one route after the other.
+            offsets (np.ndarray): Route i is cities[offsets[i]:offsets[i + 1]].
+
+        Returns:
+            np.ndarray: A boolean array, True for every allowed route.
+        """
+        cities = np.asarray(cities)
+        offsets = np.asarray(offsets)
+        route_count = len(offsets) - 1
+        allowed = np.ones(route_count, dtype=bool)
+        if not self or route_count == 0:
+            return allowed
+        route_of = np.repeat(np.arange(route_count), np.diff(offsets))
+
+        if self.city_mask:
+            forbidden = np.array([self.city_mask >> city & 1 for city in range(len(self.graph))], dtype=bool)
+            allowed[route_of[forbidden[cities]]] = False
+
+        for sequence in self.sequences:
+            positions = len(cities) - len(sequence) + 1
+            if positions <= 0:
+                continue
+            match = np.ones(positions, dtype=bool)
+            for k, city in enumerate(sequence):
+                match &= cities[k:k + positions] == city
+            firsts = np.flatnonzero(match)
+            # A match must lie within a single route
+            firsts = firsts[route_of[firsts] == route_of[firsts + len(sequence) - 1]]
+            allowed[route_of[firsts]] = False
+        return allowed
@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+from src.graph_core import graph_pkl, edges_json
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Number of search results kept; beyond it the least recently used results are dropped
+RESULT_CACHE_SIZE = 32
+
+
+def query_key(start: str, radius_start: float, end: str, radius_end: float, tolerance: int, username: str,
+              template_name: str, top_k: int = None, branch_and_bound: bool = False) -> tuple:
+    """
+    Normalises the numeric parameters of a search, so equal searches written differently share one cache entry. The
+    city names are used as given, they have to be the ones the search runs with.
+
+    :return: The hashable cache key.
+    """
+    top_k = int(top_k) if top_k else None
+    return (start, float(radius_start), end, float(radius_end), int(tolerance), username,
+            template_name, top_k, bool(branch_and_bound) and top_k is not None)
+
+
+def input_fingerprint(username: str, template_name: str, output_dir: str = os.path.join(base_dir, 'data')) -> tuple:
+    """
+    The modification times of the files a search result depends on: the graph, and the profile's settings.json and
+    precomputed.json. Any change of them makes cached results stale.
+    """
+    profile_dir = os.path.join(output_dir, username, template_name)
+    files = (graph_pkl, edges_json, os.path.join(profile_dir, 'settings.json'),
+             os.path.join(profile_dir, 'precomputed.json'))
+    fingerprint = []
+    for file_path in files:
+        try:
+            fingerprint.append(os.stat(file_path).st_mtime_ns)
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of finished search results (RouteResults) by query_key. Every entry remembers the
+    input_fingerprint it was computed with and is dropped as stale when it no longer matches.
+    """
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "evicted": 0}
+
+    def get(self, key: tuple, fingerprint: tuple):
+        """
+        :return: The cached results, or None if there are none for these inputs.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != fingerprint:
+                del self._entries[key]
+                self._counters["stale"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def put(self, key: tuple, fingerprint: tuple, results) -> None:
+        with self._lock:
+            self._entries[key] = (fingerprint, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters["evicted"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        """
+        :return: The number of cached results and the counters of hits, misses, stale and evicted entries since the
+                 start of the process.
+        """
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {"size": len(self._entries), "max_size": self.max_size, **self._counters,
+                    "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else None}
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Returns the process-wide search result cache.
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
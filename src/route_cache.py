@@ -0,0 +1,174 @@
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Number of route sets kept; beyond it the least recently used sets are dropped
+ROUTE_CACHE_SIZE = 16
+# Maximum number of city IDs held by all cached route sets together
+ROUTE_CACHE_MAX_CITIES = 20_000_000
+
+
+class RouteSet:
+    """
+    The enumerated routes of one search in compact form: the city IDs of all routes one after the other in a single
+    integer array (int16 for graphs of up to 32767 cities), and the offsets at which every route starts.
+    """
+    __slots__ = ("cities", "offsets")
+
+    def __init__(self, cities: np.ndarray, offsets: np.ndarray):
+        self.cities = cities
+        self.offsets = offsets
+
+    @classmethod
+    def from_routes(cls, routes, city_count: int):
+        """
+        :param routes: An iterable of routes as lists of city IDs.
+        :param city_count: The number of cities of the graph, which decides the integer type.
+        :return: The route set.
+        """
+        routes = list(routes)
+        dtype = np.int16 if city_count <= np.iinfo(np.int16).max else np.int32
+        lengths = np.fromiter((len(route) for route in routes), dtype=np.int64, count=len(routes))
+        offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        cities = np.fromiter(itertools.chain.from_iterable(routes), dtype=dtype, count=int(offsets[-1]))
+        return cls(cities, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self) -> np.ndarray:
+        """
+        :return: The number of cities of every route.
+        """
+        return np.diff(self.offsets).astype(np.int32)
+
+    def route(self, row: int) -> list:
+        return self.cities[self.offsets[row]:self.offsets[row + 1]].tolist()
+
+    def select(self, rows: np.ndarray):
+        """
+        :param rows: A boolean array selecting routes, or the indices of routes in the wanted order.
+        :return: A new route set of the selected routes.
+        """
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        lengths = np.diff(self.offsets)[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.arange(offsets[-1]) + np.repeat(self.offsets[:-1][rows] - offsets[:-1], lengths)
+        return RouteSet(self.cities[positions], offsets)
+
+    def pack(self, rows: np.ndarray = None) -> tuple:
+        """
+        Packs routes into the padded layout of graph_core.pack_routes without building Python lists.
+
+        :param rows: The indices of the routes to pack, all routes if None.
+        :return: The (R, width) int32 array padded with -1 and the int32 array of route lengths.
+        """
+        route_set = self if rows is None else self.select(rows)
+        lengths = route_set.lengths()
+        width = int(lengths.max()) if len(lengths) else 0
+        packed = np.full((len(lengths), width), -1, dtype=np.int32)
+        route_of = np.repeat(np.arange(len(lengths)), lengths)
+        packed[route_of, np.arange(len(route_set.cities)) - route_set.offsets[:-1][route_of]] = route_set.cities
+        return packed, lengths
+
+    def allowed(self, restrictions) -> np.ndarray:
+        """
+        :param restrictions: The RestrictionIndex of a profile.
+        :return: A boolean array, True for every route allowed by the restrictions.
+        """
+        return restrictions.allows_routes(self.cities, self.offsets)
+
+    def routes(self, keep: np.ndarray = None) -> list:
+        """
+        :param keep: A boolean array selecting the routes to return, all routes if None.
+        :return: The routes as lists of city IDs, in enumeration order.
+        """
+        cities = self.cities.tolist()
+        offsets = self.offsets.tolist()
+        rows = range(len(self)) if keep is None else np.flatnonzero(keep).tolist()
+        return [cities[offsets[i]:offsets[i + 1]] for i in rows]
+
+
+class RouteCache:
+    """
+    Thread-safe LRU cache of enumerated route sets.
+
+    Path enumeration only depends on the graph, the start and end airports and the flight budget, not on the
+    weights or restrictions of a profile, so one route set serves every user and template searching the same
+    corridor; restrictions are applied to the cached set afterwards.
+    """
+
+    def __init__(self, max_size: int = ROUTE_CACHE_SIZE, max_cities: int = ROUTE_CACHE_MAX_CITIES):
+        self.max_size = max_size
+        self.max_cities = max_cities
+        self._entries = OrderedDict()
+        self._cities = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evicted": 0}
+
+    @staticmethod
+    def key(graph, starts: list, ends: list, tolerance: int, max_min_flights: int) -> tuple:
+        return tuple(starts), tuple(ends), tolerance, max_min_flights, graph.version
+
+    def get(self, key: tuple):
+        """
+        :return: The cached RouteSet, or None if it is not cached.
+        """
+        with self._lock:
+            route_set = self._entries.get(key)
+            if route_set is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return route_set
+
+    def put(self, key: tuple, route_set: RouteSet) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._cities -= len(self._entries.pop(key).cities)
+            self._entries[key] = route_set
+            self._cities += len(route_set.cities)
+            # The newest set is kept even if it exceeds the limit on its own
+            while len(self._entries) > 1 and (len(self._entries) > self.max_size or self._cities > self.max_cities):
+                _, evicted = self._entries.popitem(last=False)
+                self._cities -= len(evicted.cities)
+                self._counters["evicted"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._cities = 0
+
+    def metrics(self) -> dict:
+        """
+        :return: The number of cached route sets, routes and city IDs, and the counters of hits, misses and evicted
+                 sets since the start of the process.
+        """
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {"size": len(self._entries), "max_size": self.max_size,
+                    "routes": sum(len(route_set) for route_set in self._entries.values()),
+                    "cities": self._cities, "max_cities": self.max_cities, **self._counters,
+                    "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else None}
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache() -> RouteCache:
+    """
+    Returns the process-wide route set cache.
+    """
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache()
+    return _route_cache
@@ -0,0 +1,119 @@
+import numpy as np
+from src.graph_core import get_csr_graph
+from src.geodata import get_geodata
+from src.route_cache import RouteSet
+
+# Number of routes of a results page if the client does not ask for another amount
+DEFAULT_PAGE_SIZE = 50
+# Largest number of routes sent in one page
+MAX_PAGE_SIZE = 1000
+
+
+class RouteResults:
+    """
+    The ranked routes of a finished task in a compact form: the routes as a RouteSet of city IDs in rank order, and
+    arrays of their final rating, number of flights and overall distance, plus the timing metadata and the top-K
+    summary. Nothing is translated to city names or serialised until a client asks for a page of it.
+    """
+    __slots__ = ("route_set", "ratings", "hops", "km", "timing", "summary", "impossible")
+
+    def __init__(self, route_set: RouteSet, ratings: np.ndarray, hops: np.ndarray, km: np.ndarray, timing: dict,
+                 summary: dict = None, impossible: bool = False):
+        self.route_set = route_set
+        self.ratings = ratings
+        self.hops = hops
+        self.km = km
+        self.timing = timing
+        self.summary = summary
+        self.impossible = impossible
+
+    @classmethod
+    def from_ranked(cls, ranked_routes: list, timing: dict, summary: dict = None):
+        """
+        Builds the results from the [[route, rating], ...] list of the rating functions.
+
+        Args:
+            ranked_routes (list): The ranked routes, possibly the single IMPOSSIBLE route.
+            timing (dict): The timing metadata of the task.
+            summary (dict, optional): The summary of the routes not returned by a top-K query.
+
+        Returns:
+            RouteResults: The results.
+        """
+        if len(ranked_routes) == 1 and ranked_routes[0][0][1:2] == ["IMPOSSIBLE"]:
+            ranked_routes, impossible = [], True
+        else:
+            impossible = False
+
+        ratings = np.fromiter((rating for _, rating in ranked_routes), dtype=np.float64, count=len(ranked_routes))
+        graph = get_csr_graph()
+        route_set = RouteSet.from_routes([graph.ids_of(route) for route, _ in ranked_routes], len(graph))
+        km = get_geodata().route_distances(*route_set.pack()) if ranked_routes else np.zeros(0)
+        return cls(route_set, ratings, route_set.lengths() - 1, km, timing, summary, impossible)
+
+    @classmethod
+    def from_route_set(cls, route_set: RouteSet, rows: np.ndarray, ratings: np.ndarray, km: np.ndarray,
+                       timing: dict, summary: dict = None):
+        """
+        Builds the results from the rows of a route set ranked by the rating functions, without translating any
+        route to city names.
+
+        Args:
+            route_set (RouteSet): The rated routes.
+            rows (np.ndarray): The indices of the ranked routes in route_set, best first.
+            ratings (np.ndarray): The final rating of every ranked route.
+            km (np.ndarray): The overall distance of every ranked route.
+            timing (dict): The timing metadata of the task.
+            summary (dict, optional): The summary of the routes not returned by a top-K query.
+
+        Returns:
+            RouteResults: The results.
+        """
+        ranked = route_set.select(rows)
+        return cls(ranked, ratings, ranked.lengths() - 1, km, timing, summary)
+
+    def with_timing(self, timing: dict):
+        """
+        The same results with other timing metadata, sharing the route arrays (used for results served from the
+        result cache).
+
+        Args:
+            timing (dict): The timing metadata of the task.
+
+        Returns:
+            RouteResults: The results.
+        """
+        return RouteResults(self.route_set, self.ratings, self.hops, self.km, timing, self.summary, self.impossible)
+
+    def __len__(self):
+        return len(self.route_set)
+
+    def page(self, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        """
+        One page of the results, ready to be sent as JSON.
+
+        Args:
+            offset (int): The rank (0-based) of the first route of the page.
+            limit (int): The number of routes of the page, at most MAX_PAGE_SIZE.
+
+        Returns:
+            dict: The routes of the page as {route, rating, hops, km} objects, the paging information, the timing
+                metadata, the top-K summary and whether no route is possible at all.
+        """
+        offset = max(offset, 0)
+        limit = min(max(limit, 0), MAX_PAGE_SIZE)
+        rows = slice(offset, offset + limit)
+        graph = get_csr_graph()
+        names = [graph.names_of(self.route_set.route(row)) for row in range(len(self))[rows]]
+        routes = [{"route": route, "rating": rating, "hops": hops, "km": km}
+                  for route, rating, hops, km in zip(names, self.ratings[rows].tolist(),
+                                                     self.hops[rows].tolist(), self.km[rows].tolist())]
+        return {
+            "offset": offset,
+            "limit": limit,
+            "total": len(self),
+            "routes": routes,
+            "timing": self.timing,
+            "summary": self.summary,
+            "impossible": self.impossible,
+        }
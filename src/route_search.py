@@ -0,0 +1,583 @@
+import heapq
+import math
+import numpy as np
+from src.essentials import SIGMOIDS
+from src.graph_algos import iter_search_plans, nearby_airport_finder
+from src.graph_core import get_csr_graph, pack_routes
+from src.geodata import get_geodata
+from src.precompute import get_precomputed_ratings
+from src.rating_route import airport_proximity_curve, rating_routes_batch
+from src.rating_routes import routes_normalisation, score_routes
+from src.restrictions import RestrictionIndex
+from src.weights import Weights
+
+# Margin added to every bound, so floating point noise can never prune a route the exhaustive ranking would keep
+BOUND_SLACK = 1e-6
+# Margin for the distance bounds, which are compared with overall distances rounded to one decimal
+DISTANCE_SLACK = 0.1
+# Maximum number of found routes rated together in one batch
+LEAF_BATCH = 256
+# Number of search steps between two checks of the abort signal
+ABORT_CHECK_INTERVAL = 1000
+
+# The terms of rating_route as (pro weight, con weight)
+ROUTE_TERMS = {
+    "distance": ("high_route_distance", "low_route_distance"),
+    "city_average": ("high_rated_cities", "low_rated_cities"),
+    "city_stability": ("high_city_rating_stability", "low_city_rating_stability"),
+    "flight_average": ("high_rated_flights", "low_rated_flights"),
+    "flight_stability": ("high_flight_rating_stability", "low_flight_rating_stability"),
+    "start": ("near_start_airport", "far_start_airport"),
+    "end": ("near_end_airport", "far_end_airport"),
+}
+
+
+def _curve(curve, x: float) -> float:
+    try:
+        return curve(x)
+    except OverflowError:  # far beyond the turning point of a flipped curve
+        return 0.0
+
+
+def _average_score(mean: float) -> float:
+    return _curve(SIGMOIDS["average_rating"], mean) if mean > 5 else 0
+
+
+def _stability_score(std: float) -> float:
+    return 1 - (_curve(SIGMOIDS["rating_stddev"], std) if std > 4 else 0)
+
+
+def _span_term_bound(pro: float, con: float, low: float, high: float, minimum: float, span: float) -> float:
+    """
+    Highest weighted relative_span score (see rating_routes.score_routes) of a value within [low, high].
+    """
+    low, high = min(max(low, minimum), minimum + span), min(max(high, minimum), minimum + span)
+    scores = (_curve(SIGMOIDS["relative_span"], (low - minimum) / span),
+              _curve(SIGMOIDS["relative_span"], (high - minimum) / span))
+    return max(pro * score if pro else con * (1 - score) for score in scores)
+
+
+class RouteSearch:
+    """
+    Branch-and-bound search for the best routes of a query.
+
+    The search expands partial paths over the same simple paths as graph_algos.iter_multi_target_paths, keeping the
+    running sums of every path (distance, city and flight ratings and their squares). From these and per-start
+    tables of what a path in a city at a given depth can still add on its way to an end (remaining flights, BFS
+    and Dijkstra minima, longest-walk maxima and the best/worst rating sums over walks of every length), an
+    optimistic bound of the final rating of all routes extending the path follows, as every term of rating_route
+    and of the final ranking is monotone in these quantities. Paths are expanded best bound first, and once top_k
+    routes are known, paths whose bound cannot beat the k-th best are dropped.
+
+    Found routes are rated with the same batch scorers as the exhaustive ranking. Every path carries its position in
+    the enumeration order of get_all_routes, so equal ratings are ordered exactly like the stable sort of
+    rating_routes.rank_routes, and the result equals rating_routes.rate_top_routes.
+
+    The final ranking normalises the number of flights and the overall distance by their span over all valid
+    routes. If the routes weights use them, these values are found first with a depth-first pass that skips every
+    branch that can no longer change them.
+    """
+
+    def __init__(self, city_start: str, radius_start: float, city_end: str, radius_end: float, tolerance: int,
+                 weights: Weights = None, aborted=None):
+        if not weights:
+            weights = Weights()
+        self.weights = weights
+        self.city_start, self.city_end = city_start, city_end
+        self.radius_start, self.radius_end = radius_start, radius_end
+        self.aborted = aborted or (lambda: False)
+
+        self.graph = graph = get_csr_graph()
+        self.geodata = geodata = get_geodata()
+        self.precomputed = get_precomputed_ratings(weights.username, weights.template_name)
+        self.restrictions = RestrictionIndex.from_weights(weights, graph)
+
+        starts = graph.ids_of(nearby_airport_finder(city_start, radius_start))
+        ends = graph.ids_of([city for city in nearby_airport_finder(city_end, radius_end) if city in graph])
+        if tolerance > 4:
+            tolerance = 4
+        self.plans = list(iter_search_plans(graph, starts, ends, tolerance))
+        self.max_flights = max((budget for _, _, _, budgets in self.plans for budget in budgets.values()), default=0)
+
+        # Per edge ID: the rounded leg distance (as summed by GeoData.route_distances) and its departure city
+        self.edge_sources = np.repeat(np.arange(len(graph)), np.diff(graph.indptr))
+        self.legs = np.round(geodata.distances[self.edge_sources, graph.indices].astype(np.float64), 1)
+
+        self.start_scores = {}
+        self.end_scores = {}
+        start_curve, end_curve = airport_proximity_curve(radius_start), airport_proximity_curve(radius_end)
+        for start, _, _, end_budgets in self.plans:
+            self.start_scores[start] = start_curve(geodata.distance(graph.names[start], city_start))
+            for end in end_budgets:
+                if end not in self.end_scores:
+                    self.end_scores[end] = end_curve(geodata.distance(graph.names[end], city_end))
+
+        self._end_tables = {}
+        self._start_tables = {}
+        self._setup_weights()
+        self.normalisation = None
+
+    def _setup_weights(self):
+        weights = self.weights
+        self.routes = routes = {key: weights.routes_weights.get(key) or 0 for key in (
+            "minimum_flights", "high_route_rating", "low_route_rating", "less_flights", "more_flights",
+            "low_overall_distance", "high_overall_distance")}
+        self.only_minimum_flights = weights.routes_hard_switch.get("only_minimum_flights")
+        self.routes_weight = routes["minimum_flights"] + \
+            (routes["high_route_rating"] or routes["low_route_rating"]) + \
+            (routes["less_flights"] or routes["more_flights"]) + \
+            (routes["low_overall_distance"] or routes["high_overall_distance"])
+        self.needs_flights_span = bool(routes["minimum_flights"] or routes["less_flights"] or
+                                       routes["more_flights"] or self.only_minimum_flights in (0, 1))
+        self.needs_distance_span = bool(routes["low_overall_distance"] or routes["high_overall_distance"])
+
+        # The bound needs the highest route rating if it raises the final rating, else the lowest. Each term of the
+        # route rating then needs its highest score if that moves the route rating that way, else its lowest.
+        if routes["high_route_rating"]:
+            rating_sign = 1 if routes["high_route_rating"] > 0 else -1
+        else:
+            rating_sign = -1 if routes["low_route_rating"] > 0 else 1 if routes["low_route_rating"] else 0
+        self.rating_sign = rating_sign
+        route_weights = {term: (weights.route_weights.get(pro) or 0, weights.route_weights.get(con) or 0)
+                         for term, (pro, con) in ROUTE_TERMS.items()}
+        self.route_weight = sum(pro or con for pro, con in route_weights.values())
+        self.route_terms = {}
+        for term, (pro, con) in route_weights.items():
+            if pro or con:
+                increasing = pro > 0 if pro else con < 0
+                self.route_terms[term] = (pro, con, increasing == ((rating_sign > 0) == (self.route_weight > 0)))
+        self.direct_distance = self.geodata.distance(self.city_start, self.city_end)
+
+        city_ratings, flight_ratings = self.precomputed.city, self.precomputed.flight
+        self.city_half_range = (float(city_ratings.max()) - float(city_ratings.min())) / 2
+        self.flight_half_range = (float(flight_ratings.max()) - float(flight_ratings.min())) / 2
+
+    # Bound tables
+
+    def _end_table(self, end: int) -> tuple:
+        """
+        Per end city, from every city: the minimum number of flights, the shortest distance and, for every number
+        of flights j, the longest walk (prefix maximum over j) and the lowest/highest sums of the city ratings and
+        of the flight ratings along walks of exactly j flights to the end (the first city not counted).
+        """
+        if end not in self._end_tables:
+            graph = self.graph
+            city_ratings = self.precomputed.city[graph.indices]
+            flight_ratings = self.precomputed.flight
+            step_values = (self.legs, city_ratings, city_ratings, flight_ratings, flight_ratings)
+            tables = []
+            for values, maximum in zip(step_values, (True, True, False, True, False)):
+                table = np.full((self.max_flights + 1, len(graph)), -np.inf if maximum else np.inf)
+                table[0, end] = 0.0
+                combine = np.maximum if maximum else np.minimum
+                for j in range(1, self.max_flights + 1):
+                    combine.at(table[j], self.edge_sources, values + table[j - 1][graph.indices])
+                tables.append(table)
+            tables[0] = np.maximum.accumulate(tables[0], axis=0)
+            self._end_tables[end] = (graph.hop_matrix()[end], graph.dijkstra(end, self.legs), *tables)
+        return self._end_tables[end]
+
+    def _tables(self, plan: tuple) -> list:
+        """
+        For every depth (number of flights so far) and city, what a path there can still add on its way to an end
+        within that end's budget: the minimum and maximum number of flights, the minimum and maximum distance, the
+        lowest and highest end proximity score, and per possible number of flights j a tuple (j, lowest and highest
+        city rating sum, lowest and highest flight rating sum). None where no end can be reached.
+        """
+        start, _, _, end_budgets = plan
+        if start in self._start_tables:
+            return self._start_tables[start]
+
+        ends = list(end_budgets)
+        budgets = np.array([end_budgets[end] for end in ends])
+        hops, shortest, longest, city_high, city_low, flight_high, flight_low = \
+            (np.stack(table) for table in zip(*(self._end_table(end) for end in ends)))
+        proximity = np.array([self.end_scores[end] for end in ends])[:, None]
+        flight_counts = np.arange(self.max_flights + 1)
+
+        tables = []
+        for depth in range(int(budgets.max()) + 1):
+            remaining = budgets - depth
+            # Paths continue from a city only towards the other ends that are still reachable within their budget
+            feasible = (hops >= 1) & (hops <= remaining[:, None])
+            with_flights = feasible[:, None, :] & (flight_counts[None, :, None] <= remaining[:, None, None]) & \
+                (flight_counts[None, :, None] >= 1)
+            sums = [np.where(with_flights, table, fill).max(axis=0) if fill < 0 else
+                    np.where(with_flights, table, fill).min(axis=0)
+                    for table, fill in ((city_low, np.inf), (city_high, -np.inf), (flight_low, np.inf),
+                                        (flight_high, -np.inf))]
+            longest_walk = longest[np.arange(len(ends)), np.maximum(remaining, 0)]
+            columns = (
+                np.where(feasible, hops, 1 << 30).min(axis=0),
+                np.where(feasible, remaining[:, None], -1).max(axis=0),
+                np.where(feasible, shortest, np.inf).min(axis=0),
+                np.where(feasible, longest_walk, -np.inf).max(axis=0),
+                np.where(feasible, proximity, np.inf).min(axis=0),
+                np.where(feasible, proximity, -np.inf).max(axis=0),
+            )
+            columns = [column.tolist() for column in columns]
+            possible = np.isfinite(sums[1]).T.tolist()
+            sums = [table.T.tolist() for table in sums]
+
+            rows = []
+            for city, reachable in enumerate(feasible.any(axis=0).tolist()):
+                if not reachable:
+                    rows.append(None)
+                    continue
+                per_flights = tuple((j, sums[0][city][j], sums[1][city][j], sums[2][city][j], sums[3][city][j])
+                                    for j in range(1, self.max_flights + 1) if possible[city][j])
+                rows.append(tuple(column[city] for column in columns) + (per_flights,))
+            tables.append(rows)
+        self._start_tables[start] = tables
+        return tables
+
+    # Bounds
+
+    def _rating_bound(self, start: int, flights: int, per_flights: tuple, distance_low: float,
+                      distance_high: float, end_low: float, end_high: float, state: tuple) -> float:
+        """
+        Bound of the rating_route rating of all routes extending a path: the highest one if rating_sign is positive,
+        the lowest one otherwise.
+        """
+        _, city_sum, city_squares, flight_sum, flight_squares = state
+        more_high = per_flights[-1][0]
+        total = 0.0
+        for term, (pro, con, high) in self.route_terms.items():
+            if term == "distance":
+                distance = distance_low if high else distance_high
+                ratio = self.direct_distance / distance * 100 if distance > 0 else math.inf
+                score = _curve(SIGMOIDS["route_distance_ratio"], ratio)
+            elif term == "city_average" or term == "flight_average":
+                known, values = (flights + 1, city_sum) if term == "city_average" else (flights, flight_sum)
+                if high:
+                    mean = max((values + entry[2 if term == "city_average" else 4]) / (known + entry[0])
+                               for entry in per_flights) + BOUND_SLACK
+                else:
+                    mean = min((values + entry[1 if term == "city_average" else 3]) / (known + entry[0])
+                               for entry in per_flights) - BOUND_SLACK
+                score = _average_score(mean)
+            elif term == "city_stability" or term == "flight_stability":
+                if term == "city_stability":
+                    known, values, squares, half_range = flights + 1, city_sum, city_squares, self.city_half_range
+                else:
+                    known, values, squares, half_range = flights, flight_sum, flight_squares, self.flight_half_range
+                variance = max(squares / known - (values / known) ** 2, 0.0)
+                if high:
+                    # The known values alone already spread this much over the longest possible route
+                    std = math.sqrt(variance * known / (known + more_high)) - BOUND_SLACK
+                elif more_high:
+                    # Popoviciu's inequality: values within a range deviate at most half of it
+                    std = max(half_range, math.sqrt(variance)) + BOUND_SLACK
+                else:
+                    std = math.sqrt(variance) + BOUND_SLACK
+                score = _stability_score(std)
+            elif term == "start":
+                score = self.start_scores[start]
+            else:
+                score = end_high if high else end_low
+            total += pro * score if pro else con * (1 - score)
+        return total / self.route_weight * 100 + (BOUND_SLACK if self.rating_sign > 0 else -BOUND_SLACK)
+
+    def upper_bound(self, start: int, flights: int, per_flights: tuple, distance_low: float, distance_high: float,
+                    end_low: float, end_high: float, state: tuple) -> float:
+        """
+        Optimistic bound of the final rating (see rating_routes.score_routes) of every route extending a path.
+
+        Args:
+            start (int): The start city of the path.
+            flights (int): The number of flights of the path.
+            per_flights (tuple): The entries of the path's table row per possible number of further flights, for
+                a complete route ((0, 0, 0, 0, 0),).
+            distance_low (float): The minimum overall distance of the routes.
+            distance_high (float): The maximum overall distance of the routes.
+            end_low (float): The minimum end proximity score of the routes.
+            end_high (float): The maximum end proximity score of the routes.
+            state (tuple): The running distance and rating sums of the path.
+
+        Returns:
+            float: The bound, -inf if no extension passes the hard switch.
+        """
+        routes = self.routes
+        min_flights, span_flights, min_distance, span_distance = self.normalisation
+        flights_low, flights_high = flights + per_flights[0][0], flights + per_flights[-1][0]
+
+        if self.only_minimum_flights == 1 and not flights_low <= min_flights <= flights_high:
+            return -math.inf
+        if self.only_minimum_flights == 0 and flights_low == flights_high == min_flights:
+            return -math.inf
+        if self.routes_weight <= 0:
+            return math.inf
+
+        bound = 0.0
+        if self.rating_sign:
+            # Single airport routes are rated 0
+            rating = 0.0 if flights == 0 or not self.route_weight else \
+                self._rating_bound(start, flights, per_flights, distance_low, distance_high, end_low, end_high, state)
+            bound += routes["high_route_rating"] * rating / 100 if routes["high_route_rating"] else \
+                routes["low_route_rating"] * (100 - rating) / 100
+
+        if routes["minimum_flights"]:
+            values = []
+            if flights_low <= min_flights <= flights_high:
+                values.append(routes["minimum_flights"])
+            if not flights_low == flights_high == min_flights:
+                values.append(0)
+            bound += max(values)
+
+        # Every route is valid, so its flights and distance lie within the spans of the normalisation
+        if routes["less_flights"] or routes["more_flights"]:
+            bound += _span_term_bound(routes["less_flights"], routes["more_flights"], flights_low, flights_high,
+                                      min_flights, span_flights)
+        if routes["low_overall_distance"] or routes["high_overall_distance"]:
+            bound += _span_term_bound(routes["low_overall_distance"], routes["high_overall_distance"], distance_low,
+                                      distance_high, min_distance, span_distance)
+
+        return bound / self.routes_weight + BOUND_SLACK
+
+    # Search
+
+    def _walk(self, plan: tuple, expand_ok):
+        """
+        graph_algos._walk_simple_paths that also tracks the distance of every path and asks expand_ok before
+        continuing beyond a city.
+
+        Args:
+            plan (tuple): The start, reach, expand and end budgets from graph_algos.iter_search_plans.
+            expand_ok (callable): Called with (depth, city, distance), returns False to cut the branch.
+
+        Yields:
+            tuple: A route as a list of city IDs and its distance.
+        """
+        start, reach, expand, end_budgets = plan
+        restrictions = self.restrictions
+        if reach[start] < 0 or not restrictions.allows_city(start):
+            return
+        sequences_by_last = restrictions.sequences_by_last
+        indptr, indices, legs = self.graph.indptr.tolist(), self.graph.indices.tolist(), self.legs.tolist()
+
+        if end_budgets.get(start, -1) >= 0:
+            yield [start], 0.0
+        if expand[start] < 0:
+            return
+
+        path = [start]
+        distances = [0.0]
+        visited = restrictions.city_mask | 1 << start
+        stack = [iter(range(indptr[start], indptr[start + 1]))]
+        while stack:
+            for edge in stack[-1]:
+                city = indices[edge]
+                if visited >> city & 1:
+                    continue
+                depth = len(path)
+                if reach[city] < depth:
+                    continue
+                if city in sequences_by_last and not restrictions.allows_step(path, city):
+                    continue
+                distance = distances[-1] + legs[edge]
+                if end_budgets.get(city, -1) >= depth:
+                    yield path + [city], distance
+                if expand[city] < depth or not expand_ok(depth, city, distance):
+                    continue
+                path.append(city)
+                distances.append(distance)
+                visited |= 1 << city
+                stack.append(iter(range(indptr[city], indptr[city + 1])))
+                break
+            else:
+                stack.pop()
+                distances.pop()
+                visited &= ~(1 << path.pop())
+
+    def find_normalisation(self) -> tuple:
+        """
+        The minimum and maximum number of flights and overall distance over all valid routes, as used by
+        rating_routes.routes_normalisation. Only the values the weights need are searched.
+
+        Returns:
+            tuple: The routes_normalisation tuple, or None if there is no valid route (or the search was aborted).
+        """
+        found = [math.inf, -math.inf, math.inf, -math.inf]
+        for plan in self.plans:
+            tables = self._tables(plan)
+
+            def expand_ok(depth, city, distance):
+                if found[0] == math.inf:  # until the first route is found
+                    return True
+                more_low, more_high, distance_low, distance_high = tables[depth][city][:4]
+                if self.needs_flights_span and (depth + more_low < found[0] or depth + more_high > found[1]):
+                    return True
+                return self.needs_distance_span and (distance + distance_low - DISTANCE_SLACK < found[2] or
+                                                     distance + distance_high + DISTANCE_SLACK > found[3])
+
+            for route, distance in self._walk(plan, expand_ok):
+                flights, distance = len(route) - 1, float(np.round(distance, 1))
+                found = [min(found[0], flights), max(found[1], flights), min(found[2], distance),
+                         max(found[3], distance)]
+            if self.aborted():
+                return None
+        if found[0] == math.inf:
+            return None
+
+        min_flights, max_flights = (found[0], found[1]) if self.needs_flights_span else (0, 0)
+        min_distance, max_distance = (found[2], found[3]) if self.needs_distance_span else (0.0, 0.0)
+        return routes_normalisation(np.array([min_flights, max_flights], dtype=np.int32),
+                                    np.array([min_distance, max_distance]))
+
+    def top_routes(self, top_k: int):
+        """
+        Searches the best top_k routes.
+
+        Returns:
+            list: The best routes as lists of city IDs with their rating, best first, in the same order as
+                rating_routes.rate_top_routes, empty if aborted, or None if there is no valid route.
+
+        Raises:
+            ValueError: If top_k is smaller than 1.
+        """
+        if top_k < 1:
+            raise ValueError(f"top_k must be at least 1, not {top_k}.")
+        self.normalisation = self.find_normalisation()
+        if self.normalisation is None:
+            return [] if self.aborted() else None
+
+        graph, restrictions = self.graph, self.restrictions
+        indptr, indices, legs = graph.indptr.tolist(), graph.indices.tolist(), self.legs.tolist()
+        city_ratings, flight_ratings = self.precomputed.city.tolist(), self.precomputed.flight.tolist()
+        sequences_by_last = restrictions.sequences_by_last
+
+        # Enumeration keys: the start's plan index followed by the neighbour position taken at every depth, as
+        # digits of one integer. A path's prefixes come first, just like in the depth-first enumeration.
+        base = int(np.diff(graph.indptr).max()) + 1
+        digits = [base ** (self.max_flights - depth) for depth in range(self.max_flights + 1)]
+
+        # Min-heap of the best routes as (rating, -key, route): the root is the worst kept route, among equal
+        # ratings the latest one
+        best = []
+        # Max-heap of the paths still to look at as (-bound, key, is path to expand, item)
+        frontier = []
+        pending = []
+
+        def beaten(bound, key):
+            return len(best) == top_k and (round(bound, 3), -key) < best[0][:2]
+
+        def flush():
+            packed, lengths = pack_routes([route for _, route in pending])
+            ratings = rating_routes_batch(packed, lengths, self.weights, self.city_start, self.city_end,
+                                          self.radius_start, self.radius_end, self.precomputed)
+            distances = self.geodata.route_distances(packed, lengths)
+            keep, final_ratings = score_routes(ratings, lengths - 1, distances, self.weights, self.normalisation)
+            for (key, route), kept, rating in zip(pending, keep.tolist(), final_ratings.tolist()):
+                if not kept:
+                    continue
+                if len(best) < top_k:
+                    heapq.heappush(best, (rating, -key, route))
+                elif (rating, -key) > best[0][:2]:
+                    heapq.heapreplace(best, (rating, -key, route))
+            pending.clear()
+
+        def add_route(start, route, key, state):
+            end_score = self.end_scores[route[-1]]
+            distance = state[0]
+            bound = self.upper_bound(start, len(route) - 1, ((0, 0, 0, 0, 0),), distance - DISTANCE_SLACK,
+                                     distance + DISTANCE_SLACK, end_score, end_score, state)
+            if not beaten(bound, key):
+                heapq.heappush(frontier, (-bound, key, False, route))
+
+        for number, plan in enumerate(self.plans):
+            start, reach, expand, end_budgets = plan
+            if reach[start] < 0 or not restrictions.allows_city(start):
+                continue
+            rating = city_ratings[start]
+            state = (0.0, rating, rating * rating, 0.0, 0.0)
+            key = number * digits[0] * base
+            if end_budgets.get(start, -1) >= 0:
+                add_route(start, (start,), key, state)
+            if expand[start] >= 0:
+                heapq.heappush(frontier, (-math.inf, key, True, (number, (start,), state,
+                                                                  restrictions.city_mask | 1 << start)))
+
+        steps = 0
+        while frontier:
+            bound, key, is_path, item = frontier[0]
+            bound = -bound
+            if beaten(bound, key):
+                if pending:
+                    flush()
+                    continue
+                if round(bound, 3) < best[0][0]:
+                    break  # nothing left can beat the kept routes
+                heapq.heappop(frontier)
+                continue
+            heapq.heappop(frontier)
+
+            steps += 1
+            if steps % ABORT_CHECK_INTERVAL == 0 and self.aborted():
+                return []
+
+            if not is_path:
+                pending.append((key, list(item)))
+                if len(pending) >= (LEAF_BATCH if len(best) == top_k else top_k - len(best)):
+                    flush()
+                continue
+
+            number, path, state, visited = item
+            start, reach, expand, end_budgets = self.plans[number]
+            tables = self._tables(self.plans[number])
+            depth = len(path)
+            u = path[-1]
+            for position, edge in enumerate(range(indptr[u], indptr[u + 1])):
+                city = indices[edge]
+                if visited >> city & 1 or reach[city] < depth:
+                    continue
+                if city in sequences_by_last and not restrictions.allows_step(path, city):
+                    continue
+                distance, city_sum, city_squares, flight_sum, flight_squares = state
+                city_rating, flight_rating = city_ratings[city], flight_ratings[edge]
+                child_state = (distance + legs[edge], city_sum + city_rating, city_squares + city_rating ** 2,
+                               flight_sum + flight_rating, flight_squares + flight_rating ** 2)
+                child_key = key + (position + 1) * digits[depth]
+                child = path + (city,)
+                if end_budgets.get(city, -1) >= depth:
+                    add_route(start, child, child_key, child_state)
+                if expand[city] < depth:
+                    continue
+                more_low, more_high, distance_low, distance_high, end_low, end_high, per_flights = \
+                    tables[depth][city]
+                child_bound = self.upper_bound(start, depth, per_flights,
+                                               child_state[0] + distance_low - DISTANCE_SLACK,
+                                               child_state[0] + distance_high + DISTANCE_SLACK, end_low, end_high,
+                                               child_state)
+                if not beaten(child_bound, child_key):
+                    heapq.heappush(frontier, (-child_bound, child_key, True,
+                                              (number, child, child_state, visited | 1 << city)))
+        if pending:
+            flush()
+
+        return [[route, rating] for rating, _, route in sorted(best, reverse=True)]
+
+
+def search_top_routes(city_start: str, radius_start: float, city_end: str, radius_end: float, tolerance: int,
+                      top_k: int, weights: Weights = None, aborted=None):
+    """
+    Finds the best top_k routes of a query with the branch-and-bound RouteSearch instead of enumerating and rating
+    every route. The result is the same as get_all_routes followed by rating_routes.rate_top_routes.
+
+    Args:
+        city_start (str): Name of the starting city.
+        radius_start (float): Radius around the starting city to search for airports.
+        city_end (str): Name of the destination city.
+        radius_end (float): Radius around the destination city to search for airports.
+        tolerance (int): Tolerance level for the routes.
+        top_k (int): The number of routes to return.
+        weights (Weights): The weights object containing user preferences.
+        aborted (callable, optional): Polled during the search, returning True stops it.
+
+    Returns:
+        list: The best routes with their rating, best first, or the IMPOSSIBLE route if there is no valid route.
+    """
+    search = RouteSearch(city_start, radius_start, city_end, radius_end, tolerance, weights, aborted)
+    top = search.top_routes(top_k)
+    if top is None:
+        return [[[city_start, "IMPOSSIBLE", city_end], 0.0]]
+    return [[search.graph.names_of(route), rating] for route, rating in top]
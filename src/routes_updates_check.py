@@ -57,3 +57,15 @@ for route in sorted(removed_routes):
 print("\nChanges in number of flights for each city:")
 for city, counts in city_changes.items():
     print(f"{city}: {counts['old']} -> {counts['new']}")
+
+# Rate the new flights and drop the removed ones in every profile's precomputed ratings. precompute reads graph.pkl,
+# so it has to be rebuilt from the latest routes (edges_maker, then graph_maker) first
+graph_pkl = os.path.join(base_dir, 'data', 'graph.pkl')
+if added_routes or removed_routes:
+    if not os.path.exists(graph_pkl) or os.path.getmtime(graph_pkl) < os.path.getmtime(new_file):
+        print("\ngraph.pkl is older than the latest routes, run edges_maker and graph_maker before updating the "
+              "precomputed ratings.")
+    else:
+        from src.precompute import update_all_precomputed
+        print("\nUpdating the precomputed ratings...")
+        update_all_precomputed()
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from src.tasks import get_task_registry, QUEUED
+
+# Number of tasks calculated at the same time; every task already uses all processes of the worker pool
+MAX_CONCURRENT_TASKS = int(os.environ.get("MAX_CONCURRENT_TASKS", 2))
+# Number of tasks that may wait for a free slot before new tasks are rejected. Together with MAX_CONCURRENT_TASKS
+# it stays well below the server threads (see Dockerfile), so the progress streams of all admitted tasks cannot
+# take every thread even for the short time each stream is open
+MAX_QUEUED_TASKS = int(os.environ.get("MAX_QUEUED_TASKS", 4))
+# Assumed seconds per task for the retry hint until the first task has finished
+DEFAULT_TASK_SECONDS = 10.0
+
+
+class QueueFull(Exception):
+    """
+    Raised by TaskScheduler.submit when no more tasks can be queued.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many calculations are queued, retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class TaskScheduler:
+    """
+    Runs the calculation tasks on a fixed number of runner threads instead of one new thread per request, so
+    concurrent requests do not oversubscribe the CPUs.
+
+    Tasks wait in a first-in, first-out queue of at most max_queued tasks and are registered as QUEUED in the task
+    registry, which also holds their current position in the queue. Aborted tasks leave the queue right away.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_TASKS, max_queued: int = MAX_QUEUED_TASKS):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_queued = max(max_queued, 0)
+        self.tasks = get_task_registry()
+        self._queue = deque()
+        self._running = 0
+        self._lock = threading.Condition(threading.Lock())
+        # Exponential moving average of the duration of a task, for the retry hint
+        self._task_seconds = DEFAULT_TASK_SECONDS
+        self._runners = [threading.Thread(target=self._run, daemon=True, name=f"task-runner-{i}")
+                         for i in range(self.max_concurrent)]
+        for runner in self._runners:
+            runner.start()
+
+    def submit(self, target) -> str:
+        """
+        Queues a task.
+
+        :param target: The calculation, called with the ID of the task once a runner is free.
+        :return: The ID of the task.
+        :raises QueueFull: If max_queued tasks are waiting already.
+        """
+        with self._lock:
+            # Queued tasks a runner has not picked up yet are counted too, so a burst of submits cannot get past
+            # the limit before the runners wake up
+            if len(self._queue) + self._running >= self.max_concurrent + self.max_queued:
+                raise QueueFull(self._retry_after())
+            task_id = self.tasks.create(QUEUED)
+            self._queue.append((task_id, target))
+            self._update_positions(len(self._queue) - 1)
+            self._lock.notify()
+        return task_id
+
+    def abort(self, task_id: str) -> bool:
+        """
+        Aborts a queued or running task.
+
+        :return: False if the task is not found.
+        """
+        with self._lock:
+            for i, (queued_id, _) in enumerate(self._queue):
+                if queued_id == task_id:
+                    del self._queue[i]
+                    self._update_positions(i)
+                    break
+        return self.tasks.abort(task_id)
+
+    def _retry_after(self) -> int:
+        # A place in the queue is free once the first of the running tasks has finished
+        return max(1, round(self._task_seconds / self.max_concurrent))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"running": self._running, "queued": len(self._queue), "max_concurrent": self.max_concurrent,
+                    "max_queued": self.max_queued, "average_task_seconds": round(self._task_seconds, 3)}
+
+    def _update_positions(self, first: int = 0):
+        # The first queued tasks go to the free runners, only the others have to wait for a running task
+        free_runners = self.max_concurrent - self._running
+        for i, (task_id, _) in enumerate(list(self._queue)[first:], start=first):
+            self.tasks.set_queue_position(task_id, max(1, i + 1 - free_runners))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._lock.wait()
+                task_id, target = self._queue.popleft()
+                self._running += 1
+                self._update_positions()
+
+            try:
+                # Skips tasks aborted between leaving the queue and starting
+                if self.tasks.start(task_id):
+                    start_time = time.monotonic()
+                    try:
+                        target(task_id)
+                    except Exception as e:
+                        traceback.print_exc()
+                        self.tasks.fail(task_id, str(e))
+                    with self._lock:
+                        self._task_seconds = 0.8 * self._task_seconds + 0.2 * (time.monotonic() - start_time)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._update_positions()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> TaskScheduler:
+    """
+    Returns the process-wide task scheduler, starting its runner threads on first use.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = TaskScheduler()
+    return _scheduler
@@ -0,0 +1,259 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Seconds a task that is no longer running is kept after its client last asked for it
+TASK_TTL_SECONDS = 30 * 60
+# Maximum number of tasks kept; beyond it the least recently used tasks that are no longer running are evicted
+MAX_TASKS = 64
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+ABORTED = "aborted"
+FAILED = "failed"
+# Tasks in these states are never evicted
+ACTIVE = (QUEUED, RUNNING)
+
+
+class TaskState:
+    """
+    The state of one calculation task: its status, its position in the queue while it waits to run, its progress
+    (done out of total work units), the result once it is finished, and a version that is increased with every
+    change so waiters can tell whether anything happened.
+    """
+    __slots__ = ("task_id", "status", "queue_position", "done", "total", "result", "error", "created", "last_access",
+                 "version")
+
+    def __init__(self, task_id: str, status: str = RUNNING):
+        now = time.monotonic()
+        self.task_id = task_id
+        self.status = status
+        self.queue_position = None
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.created = now
+        self.last_access = now
+        self.version = 0
+
+    def percentage(self) -> float:
+        if self.status == FINISHED:
+            return 100.0
+        if self.total <= 0:
+            return 0.0  # the total is not known yet
+        return round(min(100 * self.done / self.total, 100.0), 3)
+
+    def snapshot(self) -> dict:
+        return {"task_id": self.task_id, "status": self.status, "queue_position": self.queue_position,
+                "progress": self.percentage(),
+                "version": self.version, "result": self.result, "error": self.error}
+
+
+class TaskRegistry:
+    """
+    Thread-safe registry of the calculation tasks of this process.
+
+    Task IDs are random UUIDs, so tasks started at the same time never collide. Every task has its own TaskState.
+    Tasks that are no longer running are evicted once they were not asked for during TASK_TTL_SECONDS, or, least
+    recently used first, when more than MAX_TASKS tasks are held; queued and running tasks are never evicted. Every
+    change notifies the waiters of wait().
+    """
+
+    def __init__(self, max_tasks: int = MAX_TASKS, ttl: float = TASK_TTL_SECONDS):
+        self.max_tasks = max_tasks
+        self.ttl = ttl
+        self._tasks = OrderedDict()
+        self._changed = threading.Condition(threading.Lock())
+        self._counters = {"created": 0, "finished": 0, "aborted": 0, "failed": 0, "evicted_expired": 0,
+                          "evicted_lru": 0}
+
+    def create(self, status: str = RUNNING) -> str:
+        """
+        Registers a new task.
+
+        :param status: QUEUED for a task that still waits for the scheduler, RUNNING otherwise.
+        :return: The ID of the task.
+        """
+        with self._changed:
+            task_id = uuid.uuid4().hex
+            self._add(task_id, status)
+            return task_id
+
+    def ensure(self, task_id: str) -> None:
+        """
+        Registers a task under a given ID unless it exists already (for the rating functions run outside the app).
+        """
+        with self._changed:
+            if task_id not in self._tasks:
+                self._add(task_id)
+
+    def _add(self, task_id: str, status: str = RUNNING) -> TaskState:
+        self._evict()
+        state = self._tasks[task_id] = TaskState(task_id, status)
+        self._counters["created"] += 1
+        return state
+
+    def _evict(self):
+        now = time.monotonic()
+        for task_id, state in list(self._tasks.items()):
+            if state.status not in ACTIVE and now - state.last_access > self.ttl:
+                del self._tasks[task_id]
+                self._counters["evicted_expired"] += 1
+        # The dict is ordered from least to most recently used
+        for task_id, state in list(self._tasks.items()):
+            if len(self._tasks) < self.max_tasks:
+                break
+            if state.status not in ACTIVE:
+                del self._tasks[task_id]
+                self._counters["evicted_lru"] += 1
+
+    def _change(self, task_id: str, change) -> bool:
+        with self._changed:
+            state = self._tasks.get(task_id)
+            if state is None:
+                return False
+            change(state)
+            state.version += 1
+            self._changed.notify_all()
+            return True
+
+    def set_queue_position(self, task_id: str, position: int) -> None:
+        def change(state):
+            state.queue_position = position
+        self._change(task_id, change)
+
+    def start(self, task_id: str) -> bool:
+        """
+        Marks a queued task as running.
+
+        :return: False if the task was aborted (or evicted) while it waited, so it must not be run.
+        """
+        started = []
+
+        def change(state):
+            if state.status == QUEUED:
+                state.status = RUNNING
+                state.queue_position = None
+                started.append(True)
+        self._change(task_id, change)
+        return bool(started)
+
+    def add_progress(self, task_id: str, increment: int) -> None:
+        def change(state):
+            state.done += increment
+        self._change(task_id, change)
+
+    def set_total(self, task_id: str, total: int) -> None:
+        def change(state):
+            state.total = total
+        self._change(task_id, change)
+
+    def reset_progress(self, task_id: str) -> None:
+        """
+        Starts counting the progress of a task from zero again. An abort is kept.
+        """
+        def change(state):
+            state.done = state.total = 0
+        self.ensure(task_id)
+        self._change(task_id, change)
+
+    def finish(self, task_id: str, result) -> None:
+        """
+        Stores the result of a task and marks it finished, unless it was aborted meanwhile.
+        """
+        def change(state):
+            if state.status == RUNNING:
+                state.status = FINISHED
+                state.result = result
+                self._counters["finished"] += 1
+        self._change(task_id, change)
+
+    def fail(self, task_id: str, error: str) -> None:
+        def change(state):
+            if state.status == RUNNING:
+                state.status = FAILED
+                state.error = error
+                self._counters["failed"] += 1
+        self._change(task_id, change)
+
+    def abort(self, task_id: str) -> bool:
+        """
+        Marks a queued or running task as aborted; a running calculation stops at its next check.
+
+        :return: False if the task is not found.
+        """
+        def change(state):
+            if state.status in ACTIVE:
+                state.status = ABORTED
+                state.queue_position = None
+                self._counters["aborted"] += 1
+        return self._change(task_id, change)
+
+    def is_aborted(self, task_id: str) -> bool:
+        with self._changed:
+            state = self._tasks.get(task_id)
+            return state is not None and state.status == ABORTED
+
+    def get(self, task_id: str):
+        """
+        Returns a snapshot of a task (see TaskState.snapshot) and marks it as recently used.
+
+        :return: The snapshot, or None if the task is not found (or was evicted).
+        """
+        with self._changed:
+            state = self._tasks.get(task_id)
+            if state is None:
+                return None
+            state.last_access = time.monotonic()
+            self._tasks.move_to_end(task_id)
+            return state.snapshot()
+
+    def wait(self, task_id: str, version: int, timeout: float):
+        """
+        Blocks until a task changes from the given version, but at most timeout seconds.
+
+        :param task_id: The ID of the task.
+        :param version: The version the caller already knows, None if it knows nothing yet.
+        :param timeout: The maximum number of seconds to wait.
+        :return: The snapshot of the task (unchanged after a timeout), or None if the task is not found.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                state = self._tasks.get(task_id)
+                remaining = deadline - time.monotonic()
+                if state is None or state.version != version or remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return self.get(task_id)
+
+    def metrics(self) -> dict:
+        """
+        :return: The number of live tasks per status and the counters of created, finished, aborted, failed and
+                 evicted tasks since the start of the process.
+        """
+        with self._changed:
+            live = {status: 0 for status in (QUEUED, RUNNING, FINISHED, ABORTED, FAILED)}
+            for state in self._tasks.values():
+                live[state.status] += 1
+            return {"live": len(self._tasks), "live_by_status": live, "max_tasks": self.max_tasks,
+                    "ttl_seconds": self.ttl, **self._counters}
+
+
+_task_registry = None
+_task_registry_lock = threading.Lock()
+
+
+def get_task_registry() -> TaskRegistry:
+    """
+    Returns the process-wide task registry.
+    """
+    global _task_registry
+    if _task_registry is None:
+        with _task_registry_lock:
+            if _task_registry is None:
+                _task_registry = TaskRegistry()
+    return _task_registry
@@ -1,5 +1,7 @@
 import json
 import os
+import tempfile
+from contextlib import contextmanager
 from multiprocessing import Lock
 
 lock = Lock()
@@ -27,6 +29,10 @@ class Weights:
         self.static_route_cleared = False
         self.dynamic_route_cleared = False
 
+        # While batching, restriction changes are only collected and written once by flush_restrictions
+        self.batching = False
+        self.unsaved_restrictions = False
+
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.file_path = os.path.join(base_dir, 'data', self.username, self.template_name, 'settings.json')
         self.load_weights()
@@ -68,7 +74,31 @@ class Weights:
                 self.static_route_restrictions = []
                 self.dynamic_route_restrictions = []
 
+    @contextmanager
+    def batch_restrictions(self):
+        """
+        Collects all restriction changes made inside the with block in memory and writes them to settings.json
+        once at its end (nothing is written if the block raises).
+        """
+        self.batching = True
+        try:
+            yield self
+            self.batching = False
+            self.flush_restrictions()
+        finally:
+            self.batching = False
+
+    def flush_restrictions(self):
+        """
+        Writes the restriction changes collected while batching.
+        """
+        if self.unsaved_restrictions:
+            self.save_restrictions()
+
     def save_restrictions(self):
+        if self.batching:
+            self.unsaved_restrictions = True
+            return
         with lock:
             # Load existing settings from the file
             if os.path.exists(self.file_path):
@@ -108,13 +138,26 @@ class Weights:
                 updated_dynamic_route = existing_dynamic_route.union(tuple(route) for route in self.dynamic_route_restrictions)
                 existing_settings['restrictions']['dynamic']['route'] = [list(route) for route in updated_dynamic_route]
 
-            with open(self.file_path, 'w', encoding='utf-8') as file:
-                json.dump(existing_settings, file, indent=4, ensure_ascii=False)
+            self._write_settings(existing_settings)
 
             self.static_city_cleared = False
             self.dynamic_city_cleared = False
             self.static_route_cleared = False
             self.dynamic_route_cleared = False
+            self.unsaved_restrictions = False
+
+    def _write_settings(self, settings: dict):
+        # Write to a temporary file next to settings.json and rename it, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.file_path), prefix='.settings_', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(settings, file, indent=4, ensure_ascii=False)
+            if os.path.exists(self.file_path):
+                os.chmod(temp_path, os.stat(self.file_path).st_mode & 0o777)
+            os.replace(temp_path, self.file_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
 
     def add_static_city_restriction(self, city_name: str):
         if city_name not in self.static_city_restrictions:
@@ -151,6 +194,7 @@ class Weights:
     def remove_static_city_restriction(self, city_name: str):
         if city_name in self.static_city_restrictions:
             self.static_city_restrictions.remove(city_name)
+            self.static_city_cleared = True
             self.save_restrictions()
             print(f"Static city restriction removed: {city_name}")
         else:
@@ -159,6 +203,7 @@ class Weights:
     def remove_dynamic_city_restriction(self, city_name: str):
         if city_name in self.dynamic_city_restrictions:
             self.dynamic_city_restrictions.remove(city_name)
+            self.dynamic_city_cleared = True
             self.save_restrictions()
             print(f"Dynamic city restriction removed: {city_name}")
         else:
@@ -167,6 +212,7 @@ class Weights:
     def remove_static_route_restriction(self, route: list):
         if route in self.static_route_restrictions:
             self.static_route_restrictions.remove(route)
+            self.static_route_cleared = True
             self.save_restrictions()
             print(f"Static route restriction removed: {route}")
         else:
@@ -175,6 +221,7 @@ class Weights:
     def remove_dynamic_route_restriction(self, route: list):
         if route in self.dynamic_route_restrictions:
             self.dynamic_route_restrictions.remove(route)
+            self.dynamic_route_cleared = True
             self.save_restrictions()
             print(f"Dynamic route restriction removed: {route}")
         else:
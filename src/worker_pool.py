@@ -0,0 +1,79 @@
+import atexit
+import concurrent.futures
+import os
+import threading
+
+# Number of routes sent to a worker in one task
+DEFAULT_CHUNK_SIZE = 500
+
+_executor = None
+_max_workers = 1
+_executor_lock = threading.Lock()
+
+
+def _preload_worker():
+    """
+    Initializer of every worker process: loads the graph, the geodata (including the distances) and the default
+    precomputed ratings once, so the tasks themselves never touch the filesystem for them.
+    """
+    from src.graph_core import get_csr_graph
+    from src.geodata import get_geodata
+    from src.precompute import get_precomputed_ratings
+
+    get_csr_graph()
+    get_geodata()
+    get_precomputed_ratings("default", "default")
+
+
+def _ping():
+    return os.getpid()
+
+
+def start_worker_pool(max_workers: int = None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Creates the long-lived worker pool and starts all of its (preloaded) worker processes right away.
+    Calling it again returns the already running pool.
+
+    :param max_workers: Number of worker processes, defaults to the number of CPUs.
+    :return: The process pool executor.
+    """
+    global _executor, _max_workers
+    with _executor_lock:
+        if _executor is None:
+            _max_workers = max_workers or os.cpu_count() or 1
+            _executor = concurrent.futures.ProcessPoolExecutor(max_workers=_max_workers, initializer=_preload_worker)
+            # Submitting a first task launches the worker processes now instead of during the first request
+            _executor.submit(_ping).result()
+            atexit.register(shutdown_worker_pool)
+        return _executor
+
+
+def get_worker_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Returns the running worker pool, starting it on first use (e.g. when run outside the Flask app).
+    """
+    if _executor is None:
+        return start_worker_pool()
+    return _executor
+
+
+def shutdown_worker_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def chunked(items: list, chunk_size: int = None) -> list:
+    """
+    Splits items into consecutive batches for the worker pool.
+
+    :param items: The items to split.
+    :param chunk_size: Maximum batch size. By default the items are spread over a few batches per worker, but no
+                       batch is larger than DEFAULT_CHUNK_SIZE.
+    :return: A list of batches.
+    """
+    if chunk_size is None:
+        chunk_size = min(DEFAULT_CHUNK_SIZE, max(1, -(-len(items) // (_max_workers * 4))))
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]